@@ -78,9 +78,13 @@ class GlobalConfig:
     stream_log_detailed: bool = False
     log_dir: str = default_path("log")
     cache_dir: str = default_path("cache")
+    cache_max_size_mib: int = 0
     latex_cache_dir: str = default_path("cache/latex")
     data_dir: str = default_path("lib")
     run_dir: str = default_path("run")
+    rpc_binary_protocol: bool = True
+    rpc_compression: bool = False
+    rpc_max_frame_size_mib: int = 1
 
 
 @dataclass()
@@ -93,11 +97,20 @@ class DatabaseConfig:
 @dataclass()
 class WorkerConfig:
     keep_sandbox: bool = False
+    prefetch_batch: bool = False
+    sandbox_pool_size: int = 0
+    sandbox_pool_reset: str = "wipe"
+    parallel_jobs: int = 1
+    pinned_cpus: list[int] = field_helper(list[int])
 
 
 @dataclass()
 class SandboxConfig:
     sandbox_implementation: str = "isolate"
+    # How files are put into the sandboxes from the cache: "copy",
+    # "clone" (reflink when the filesystem supports it, else copy) or
+    # "link" (reflink, else read-only hardlink, else copy).
+    file_staging: str = "copy"
     # Max size of each writable file during an evaluation step, in KiB.
     max_file_size: int = 1024 * 1024  # 1 GiB
     # Max processes, CPU time (s), memory (KiB) for compilation runs.
@@ -203,6 +216,7 @@ class TaskOverviewConfig:
     contests_folders: list[str] = field_helper(list[str])
     auto_sync: bool = False
     max_compilations: int = 10
+    build_cache_max_size_mib: int = 1024  # 1 GiB
 
 
 @dataclass()
@@ -212,6 +226,7 @@ class GerTranslateConfig:
     task_repository: str | None = None
     auto_sync: bool = False
     max_compilations: int = 10
+    build_cache_max_size_mib: int = 1024  # 1 GiB
 
 
 @dataclass()
@@ -27,15 +27,19 @@
 """
 
 import atexit
+import contextlib
 import io
 import logging
 import os
+import sqlite3
 import tempfile
+import time
 import fcntl
 from abc import ABCMeta, abstractmethod
 import typing
 
 import gevent
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
 from cms import config, mkdir, rmtree
@@ -50,7 +54,8 @@ logger = logging.getLogger(__name__)
 
 
 def copyfileobj(source_fobj: typing.IO, destination_fobj: typing.IO,
-                buffer_size: int = io.DEFAULT_BUFFER_SIZE):
+                buffer_size: int = io.DEFAULT_BUFFER_SIZE,
+                max_buffer_size: int | None = None):
     """Read all content from one file object and write it to another.
 
     Repeatedly read from the given source file object, until no content
@@ -63,12 +68,18 @@ def copyfileobj(source_fobj: typing.IO, destination_fobj: typing.IO,
     destination_fobj: a file object open for writing, in the
         same mode as the source (doesn't need to be buffered).
     buffer_size: the size of the read/write buffer.
+    max_buffer_size: if given, the buffer size is doubled after
+        each read that fills the buffer, up to this size. This reduces
+        the number of calls when one of the file objects does a round
+        trip for each of them (e.g., a large object).
 
     """
     while True:
         buffer = source_fobj.read(buffer_size)
         if len(buffer) == 0:
             break
+        if max_buffer_size is not None and len(buffer) == buffer_size:
+            buffer_size = min(2 * buffer_size, max_buffer_size)
         while len(buffer) > 0:
             gevent.sleep(0)
             written = destination_fobj.write(buffer)
@@ -166,6 +177,25 @@ class FileCacherBackend(metaclass=ABCMeta):
         """
         pass
 
+    def get_sizes(self, digests: typing.Iterable[str]) -> dict[str, int]:
+        """Return the sizes of many files, if they exist.
+
+        Backends can override this to do a single lookup.
+
+        digests: the digests of the files.
+
+        return: a map from the digests of the files that exist in the
+            storage to their sizes, in bytes.
+
+        """
+        sizes = {}
+        for digest in digests:
+            try:
+                sizes[digest] = self.get_size(digest)
+            except KeyError:
+                pass
+        return sizes
+
     @abstractmethod
     def delete(self, digest: str):
         """Delete a file from the storage.
@@ -309,19 +339,43 @@ class DBBackend(FileCacherBackend):
     stores the files as lobjects (encapsuled in a FSObject) into a
     PostgreSQL database.
 
+    Files up to SINGLE_READ_MAX_SIZE are read with a single query on
+    a pooled connection; bigger files are streamed through a
+    LargeObject, which opens a connection of its own.
+
     """
 
+    SINGLE_READ_MAX_SIZE = 4 * 1024 * 1024  # 4 MiB
+
+    # Number of digests looked up with a single query.
+    LOOKUP_BATCH_SIZE = 1000
+
+    @staticmethod
+    def _size_column():
+        # Opening the large object in the query lets us learn its size
+        # without another connection; the descriptor is closed at the
+        # end of the transaction.
+        return func.lo_lseek64(
+            func.lo_open(FSObject.loid, LargeObject.INV_READ), 0,
+            io.SEEK_END)
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
         """
         with SessionGen() as session:
-            fso = FSObject.get_from_digest(digest, session)
+            row = session.query(FSObject.loid, self._size_column())\
+                .filter(FSObject.digest == digest).first()
 
-            if fso is None:
+            if row is None:
                 raise KeyError("File not found.")
 
-            return fso.get_lobject(mode='rb')
+            loid, size = row
+            if size <= self.SINGLE_READ_MAX_SIZE:
+                data = session.query(func.lo_get(loid)).scalar()
+                return io.BytesIO(bytes(data))
+
+        return LargeObject(loid, mode='rb')
 
     def create_file(self, digest):
         """See FileCacherBackend.create_file().
@@ -391,16 +445,26 @@ class DBBackend(FileCacherBackend):
         """See FileCacherBackend.get_size().
 
         """
-        # TODO - The business logic may be moved in FSObject, for
-        # better generality
-        with SessionGen() as session:
-            fso = FSObject.get_from_digest(digest, session)
+        sizes = self.get_sizes([digest])
+        if digest not in sizes:
+            raise KeyError("File not found.")
+        return sizes[digest]
 
-            if fso is None:
-                raise KeyError("File not found.")
+    def get_sizes(self, digests):
+        """See FileCacherBackend.get_sizes().
 
-            with fso.get_lobject(mode='rb') as lobj:
-                return lobj.seek(0, io.SEEK_END)
+        """
+        digests = list(digests)
+        sizes = {}
+        with SessionGen() as session:
+            for i in range(0, len(digests), self.LOOKUP_BATCH_SIZE):
+                batch = digests[i:i + self.LOOKUP_BATCH_SIZE]
+                sizes.update(
+                    session.query(FSObject.digest, self._size_column())
+                    .filter(FSObject.digest.in_(batch)).all())
+                # Close the large objects opened by the query.
+                session.rollback()
+        return sizes
 
     def delete(self, digest):
         """See FileCacherBackend.delete().
@@ -471,10 +535,129 @@ class NullBackend(FileCacherBackend):
         return list()
 
 
+class CacheIndex:
+    """Index of the files in a cache directory, used to evict the
+    least recently used ones when the cache grows too big.
+
+    The index is a SQLite database inside the cache directory, and it
+    is shared by all the processes using the directory. It is only
+    advisory: a file missing from it is added the next time it is
+    accessed, and a file listed in it might have been deleted.
+
+    """
+
+    # Seconds to keep retrying a statement while another process holds
+    # the lock on the database. SQLite's own busy timeout would block
+    # the whole process, so we retry sleeping through gevent.
+    LOCK_TIMEOUT = 30
+    LOCK_RETRY_INTERVAL = 0.01
+
+    # Seconds during which further accesses to a file are not written
+    # to the index. The eviction order doesn't need to be more precise
+    # than that, and we avoid a write at every cache hit.
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path: str):
+        """Open (and create, if needed) the index.
+
+        path: the path of the SQLite database.
+
+        """
+        self._db = sqlite3.connect(path, timeout=0, isolation_level=None)
+        # Last time we recorded an access to each file.
+        self._last_touch: dict[str, float] = {}
+        self._execute("PRAGMA journal_mode=WAL")
+        # The index can be rebuilt, no need to wait for the disk.
+        self._execute("PRAGMA synchronous=OFF")
+        self._execute("CREATE TABLE IF NOT EXISTS files ("
+                      "digest TEXT PRIMARY KEY, "
+                      "size INTEGER NOT NULL, "
+                      "last_access REAL NOT NULL)")
+        self._execute("CREATE INDEX IF NOT EXISTS files_last_access "
+                      "ON files (last_access)")
+
+    def close(self):
+        self._db.close()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        """Execute a statement, waiting if the database is locked.
+
+        raise (sqlite3.OperationalError): if the database is still
+            locked after LOCK_TIMEOUT seconds, or for any other error.
+
+        """
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                return self._db.execute(sql, parameters)
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error) \
+                        or time.monotonic() >= deadline:
+                    raise
+            gevent.sleep(self.LOCK_RETRY_INTERVAL)
+
+    def touch(self, digest: str, size: int, force: bool = False):
+        """Record that a file was accessed (or added to the cache).
+
+        Accesses to a file recorded less than TOUCH_INTERVAL seconds
+        ago are not written, unless force is given.
+
+        digest: the digest of the file.
+        size: the size of the file, in bytes.
+        force: whether to write the access anyway (e.g. because the
+            file was just added to the cache).
+
+        """
+        now = time.time()
+        if not force \
+                and now - self._last_touch.get(digest, -self.TOUCH_INTERVAL) \
+                < self.TOUCH_INTERVAL:
+            return
+        self._execute(
+            "INSERT INTO files (digest, size, last_access) VALUES (?, ?, ?) "
+            "ON CONFLICT (digest) DO UPDATE "
+            "SET size = excluded.size, last_access = excluded.last_access",
+            (digest, size, now))
+        self._last_touch[digest] = now
+
+    def remove(self, digest: str):
+        """Forget a file, which was deleted from the cache.
+
+        digest: the digest of the file.
+
+        """
+        self._execute("DELETE FROM files WHERE digest = ?", (digest,))
+        self._last_touch.pop(digest, None)
+
+    def total_size(self) -> int:
+        """Return the total size of the files in the cache, in bytes."""
+        return self._execute(
+            "SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def least_recently_used(self, limit: int) -> list[tuple[str, int]]:
+        """Return the files accessed least recently.
+
+        limit: the maximum number of files to return.
+
+        return: the digests and sizes of the files, the least recently
+            used first.
+
+        """
+        return self._execute(
+            "SELECT digest, size FROM files ORDER BY last_access LIMIT ?",
+            (limit,)).fetchall()
+
+
 class FileCacher:
     """This class implement a local cache for files stored as FSObject
     in the database.
 
+    If config.global_.cache_max_size_mib is set, the least recently
+    used files are evicted from the cache when it grows bigger than
+    that. The cache directory can be shared by the services running
+    on the same machine: a file is downloaded by only one of them at a
+    time, and the others wait for it.
+
     """
 
     # This value is very arbitrary, and in this case we want it to be a
@@ -490,6 +673,18 @@ class FileCacher:
     # CHUNK_SIZE should be a multiple of these values.
     # Note that a too-small value can cause issues on high-latency networks.
     CHUNK_SIZE = 1024 * 1024  # 1 MiB
+    # When transferring files from and to the backend, the chunk size
+    # grows up to this value, to reduce the number of round trips for
+    # big files.
+    MAX_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MiB
+
+    # Seconds between attempts to lock a file that another process is
+    # downloading.
+    LOCK_POLL_INTERVAL = 0.05
+
+    # Number of files to consider at once for eviction.
+    EVICTION_BATCH_SIZE = 100
+
     backend: FileCacherBackend
 
     def __init__(self, service: "Service | None" = None, path: str | None = None, null: bool = False):
@@ -541,6 +736,24 @@ class FileCacher:
         # Just to make sure it was created.
         self._create_directory_or_die(self.file_dir)
 
+        # Counters of the accesses to the cache, for this instance.
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._open_index()
+
+    def _open_index(self):
+        """Prepare the locks and (if the cache size is limited) the
+        index of the cache directory.
+
+        """
+        self._create_directory_or_die(os.path.join(self.file_dir, "_locks"))
+        self.max_size = config.global_.cache_max_size_mib * 1024 * 1024
+        if getattr(self, "_index", None) is not None:
+            self._index.close()
+        self._index: CacheIndex | None = None
+        if self.max_size > 0:
+            self._index = CacheIndex(
+                os.path.join(self.file_dir, "_index.sqlite"))
+
     def is_shared(self):
         """Return whether the cache directory is shared with other services."""
         return self.service is not None
@@ -583,6 +796,91 @@ class FileCacher:
             if not returned:
                 fobj.close()
 
+    @staticmethod
+    def _try_lock(fobj: typing.IO) -> bool:
+        try:
+            fcntl.flock(fobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def _digest_lock(self, digest: str, blocking: bool = True):
+        """Lock a file of the cache against other processes.
+
+        Files are mapped to a fixed number of locks, so that unrelated
+        files might share a lock. We poll instead of blocking, to let
+        the other greenlets run.
+
+        digest: the digest of the file.
+        blocking: whether to wait for the lock to be available.
+
+        yield (bool): whether the lock was acquired; always True if
+            blocking.
+
+        """
+        lock_file = os.path.join(self.file_dir, "_locks", digest[:2])
+        with open(lock_file, "a") as fobj:
+            locked = self._try_lock(fobj)
+            while not locked and blocking:
+                gevent.sleep(self.LOCK_POLL_INTERVAL)
+                locked = self._try_lock(fobj)
+            try:
+                yield locked
+            finally:
+                if locked:
+                    fcntl.flock(fobj, fcntl.LOCK_UN)
+
+    def _open_cached(self, digest: str) -> typing.IO[bytes] | None:
+        """Open a file of the cache, recording the access.
+
+        digest: the digest of the file.
+
+        return: a readable binary file-like object, or None if the
+            file is not in the cache.
+
+        """
+        try:
+            fobj = open(os.path.join(self.file_dir, digest), 'rb')
+        except FileNotFoundError:
+            return None
+        self.stats["hits"] += 1
+        if self._index is not None:
+            self._index.touch(digest, os.fstat(fobj.fileno()).st_size)
+        return fobj
+
+    def _evict(self):
+        """Delete the least recently used files until the cache fits in
+        its maximum size.
+
+        Files that are being downloaded by other processes are skipped.
+
+        """
+        if self._index is None:
+            return
+        total_size = self._index.total_size()
+        while total_size > self.max_size:
+            candidates = self._index.least_recently_used(
+                self.EVICTION_BATCH_SIZE)
+            evicted = False
+            for digest, size in candidates:
+                if total_size <= self.max_size:
+                    break
+                with self._digest_lock(digest, blocking=False) as locked:
+                    if not locked:
+                        continue
+                    try:
+                        os.unlink(os.path.join(self.file_dir, digest))
+                    except FileNotFoundError:
+                        pass
+                    self._index.remove(digest)
+                total_size -= size
+                evicted = True
+                self.stats["evictions"] += 1
+                logger.debug("File %s evicted from the cache.", digest)
+            if not evicted:
+                break
+
     def _load(self, digest: str, cache_only: bool) -> typing.IO[bytes] | None:
         """Load a file into the cache and open it for reading.
 
@@ -594,42 +892,62 @@ class FileCacher:
         raise (KeyError): if the file cannot be found.
 
         """
-        cache_file_path = os.path.join(self.file_dir, digest)
+        fd = self._open_cached(digest)
+        if fd is None:
+            with self._digest_lock(digest):
+                # Another process might have downloaded it meanwhile.
+                fd = self._open_cached(digest)
+                if fd is None:
+                    fd = self._download(digest)
+                    downloaded = True
+                else:
+                    downloaded = False
+            if downloaded:
+                self._evict()
 
         if cache_only:
-            if os.path.exists(cache_file_path):
-                return
-        else:
-            try:
-                return open(cache_file_path, 'rb')
-            except FileNotFoundError:
-                pass
+            fd.close()
+            return None
+        return fd
+
+    def _download(self, digest: str) -> typing.IO[bytes]:
+        """Download a file from the backend into the cache.
+
+        digest: the digest of the file.
 
+        return: a readable binary file-like object from which to read the
+            contents of the file.
+
+        raise (KeyError): if the file cannot be found.
+
+        """
+        self.stats["misses"] += 1
         logger.debug("File %s not in cache, downloading "
                      "from database.", digest)
 
+        cache_file_path = os.path.join(self.file_dir, digest)
         ftmp_handle, temp_file_path = tempfile.mkstemp(dir=self.temp_dir,
                                                        text=False)
         with open(ftmp_handle, 'wb') as ftmp, \
                 self.backend.get_file(digest) as fobj:
-            copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
+            copyfileobj(fobj, ftmp, self.CHUNK_SIZE, self.MAX_CHUNK_SIZE)
 
-        if not cache_only:
-            # We allow anyone to delete files from the cache directory
-            # self.file_dir at any time. Hence, cache_file_path might no
-            # longer exist an instant after we create it. Opening the
-            # temporary file before renaming it circumvents this issue.
-            # (Note that the temporary file may not be manually deleted!)
-            fd = open(temp_file_path, 'rb')
+        # We allow anyone to delete files from the cache directory
+        # self.file_dir at any time. Hence, cache_file_path might no
+        # longer exist an instant after we create it. Opening the
+        # temporary file before renaming it circumvents this issue.
+        # (Note that the temporary file may not be manually deleted!)
+        fd = open(temp_file_path, 'rb')
 
         # Then move it to its real location (this operation is atomic
         # by POSIX requirement)
         os.rename(temp_file_path, cache_file_path)
+        if self._index is not None:
+            self._index.touch(digest, os.fstat(fd.fileno()).st_size,
+                              force=True)
 
         logger.debug("File %s downloaded.", digest)
-
-        if not cache_only:
-            return fd
+        return fd
 
     def cache_file(self, digest: str):
         """Load a file into the cache.
@@ -793,11 +1111,17 @@ class FileCacher:
             with open(dst.name, 'rb') as src:
                 fobj = self.backend.create_file(digest)
                 if fobj is not None:
-                    copyfileobj(src, fobj, self.CHUNK_SIZE)
+                    copyfileobj(src, fobj, self.CHUNK_SIZE,
+                                self.MAX_CHUNK_SIZE)
                     self.backend.commit_file(fobj, digest, desc)
 
             os.rename(dst.name, cache_file_path)
 
+        if self._index is not None:
+            self._index.touch(digest, os.stat(cache_file_path).st_size,
+                              force=True)
+            self._evict()
+
         return digest
 
     def put_file_content(self, content: bytes, desc: str = "") -> str:
@@ -862,6 +1186,18 @@ class FileCacher:
             raise TombstoneError()
         return self.backend.get_size(digest)
 
+    def get_sizes(self, digests: typing.Iterable[str]) -> dict[str, int]:
+        """Return the sizes of many files, if they exist.
+
+        digests: the digests of the files.
+
+        return: a map from the digests of the files that exist in the
+            backend to their sizes, in bytes.
+
+        """
+        return self.backend.get_sizes(
+            digest for digest in digests if digest != Digest.TOMBSTONE)
+
     def delete(self, digest: str):
         """Delete a file from the backend and the local cache.
 
@@ -887,6 +1223,8 @@ class FileCacher:
             os.unlink(cache_file_path)
         except OSError:
             pass
+        if self._index is not None:
+            self._index.remove(digest)
 
     def purge_cache(self):
         """Empty the local cache.
@@ -898,6 +1236,7 @@ class FileCacher:
         if not mkdir(config.global_.cache_dir) or not mkdir(self.file_dir):
             logger.error("Cannot create necessary directories.")
             raise RuntimeError("Cannot create necessary directories.")
+        self._open_index()
 
     def destroy_cache(self):
         """Completely remove and destroy the cache.
@@ -910,6 +1249,9 @@ class FileCacher:
         """
         if self.is_shared():
             raise Exception("You may not destroy a shared cache.")
+        if self._index is not None:
+            self._index.close()
+            self._index = None
         rmtree(self.file_dir)
 
     def list(self) -> list[tuple[str, str]]:
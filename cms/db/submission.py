@@ -36,7 +36,8 @@ from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.schema import Column, ForeignKey, ForeignKeyConstraint, \
-    UniqueConstraint
+    Index, UniqueConstraint
+from sqlalchemy.sql import text
 from sqlalchemy.types import Integer, Float, String, Unicode, DateTime, Enum, \
     BigInteger
 
@@ -316,6 +317,14 @@ class SubmissionResult(Base):
     __tablename__ = 'submission_results'
     __table_args__ = (
         UniqueConstraint('submission_id', 'dataset_id'),
+        # Partial indices covering only the results ES may still have
+        # to work on, so that its periodic sweep does not need to scan
+        # the (much larger) set of completed results.
+        Index('ix_submission_results_to_compile', 'dataset_id',
+              postgresql_where=text("compilation_outcome IS NULL")),
+        Index('ix_submission_results_to_evaluate', 'dataset_id',
+              postgresql_where=text("compilation_outcome = 'ok' AND "
+                                    "evaluation_outcome IS NULL")),
     )
 
     # Primary key is (submission_id, dataset_id).
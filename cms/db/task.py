@@ -535,13 +535,20 @@ class Dataset(Base):
                 or self.score_type != self._cached_score_type \
                 or (self.score_type_parameters
                     != self._cached_score_type_parameters) \
-                or public_testcases != self._cached_public_testcases:
+                or public_testcases != self._cached_public_testcases \
+                or self.task.score_precision != self._cached_score_precision:
             # Import late to avoid a circular dependency.
-            from cms.grading.scoretypes import get_score_type
+            from cms.grading.scoretypes import get_dataset_score_type, \
+                get_score_type
             # This can raise.
-            self._cached_score_type_object = get_score_type(
-                self.score_type, self.score_type_parameters, public_testcases,
-                self.task.score_precision)
+            if self.id is not None:
+                self._cached_score_type_object = get_dataset_score_type(
+                    self.id, self.score_type, self.score_type_parameters,
+                    public_testcases, self.task.score_precision)
+            else:
+                self._cached_score_type_object = get_score_type(
+                    self.score_type, self.score_type_parameters,
+                    public_testcases, self.task.score_precision)
             # If an exception is raised these updates don't take place:
             # that way, next time this property is accessed, we get a
             # cache miss again and the same exception is raised again.
@@ -549,6 +556,7 @@ class Dataset(Base):
             self._cached_score_type_parameters = \
                 copy.deepcopy(self.score_type_parameters)
             self._cached_public_testcases = public_testcases
+            self._cached_score_precision = self.task.score_precision
         return self._cached_score_type_object
 
     def clone_from(self, old_dataset: "Dataset", clone_managers: bool = True,
@@ -27,7 +27,8 @@ from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.schema import Column, ForeignKey, ForeignKeyConstraint, \
-    UniqueConstraint
+    Index, UniqueConstraint
+from sqlalchemy.sql import text
 from sqlalchemy.types import Integer, Float, String, Unicode, DateTime, \
     BigInteger
 
@@ -241,6 +242,12 @@ class UserTestResult(Base):
     __tablename__ = 'user_test_results'
     __table_args__ = (
         UniqueConstraint('user_test_id', 'dataset_id'),
+        # See the analogous indices on SubmissionResult.
+        Index('ix_user_test_results_to_compile', 'dataset_id',
+              postgresql_where=text("compilation_outcome IS NULL")),
+        Index('ix_user_test_results_to_evaluate', 'dataset_id',
+              postgresql_where=text("compilation_outcome = 'ok' AND "
+                                    "evaluation_outcome IS NULL")),
     )
 
     # Primary key is (user_test_id, dataset_id).
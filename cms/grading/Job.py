@@ -36,9 +36,12 @@ testcase".
 """
 
 import logging
-from typing import Self
+from typing import NamedTuple, Self
 import json
 
+from sqlalchemy import func, literal_column, select, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
 from cms.db import (
     Dataset,
     Evaluation,
@@ -46,12 +49,15 @@ from cms.db import (
     File,
     Manager,
     Submission,
+    Task,
+    Testcase,
     UserTest,
     UserTestExecutable,
     Contest,
     SubmissionResult,
     UserTestResult,
 )
+from cms.db.session import Session
 from cms.grading.languagemanager import get_language
 from cms.service.esoperations import ESOperation
 
@@ -69,8 +75,12 @@ def _is_contest_multithreaded(contest: Contest) -> bool:
     return: True if the sandbox should allow multithreading.
 
     """
+    return _are_languages_multithreaded(contest.languages)
+
+
+def _are_languages_multithreaded(languages: list[str]) -> bool:
     return any(get_language(l).requires_multithreading
-               for l in contest.languages)
+               for l in languages)
 
 
 class Job:
@@ -675,17 +685,29 @@ class EvaluationJob(Job):
         # only if it is True.
 
         sr.evaluations += [Evaluation(
-            text=self.text,
-            admin_text=self.admin_text,
-            outcome=self.outcome,
-            execution_time=self.plus.get('execution_time'),
-            execution_wall_clock_time=self.plus.get(
+            testcase=sr.dataset.testcases[self.operation.testcase_codename],
+            **self.get_evaluation_values())]
+
+    def get_evaluation_values(self) -> dict:
+        """Return the values of the columns of the Evaluation row
+        describing the job result, except those identifying it.
+
+        return: a dictionary from column names to values, suitable to
+            build an Evaluation or to insert it directly in bulk.
+
+        """
+        return {
+            "text": self.text,
+            "admin_text": self.admin_text,
+            "outcome": self.outcome,
+            "execution_time": self.plus.get('execution_time'),
+            "execution_wall_clock_time": self.plus.get(
                 'execution_wall_clock_time'),
-            execution_memory=self.plus.get('execution_memory'),
-            evaluation_shard=self.shard,
-            evaluation_sandbox_paths=self.sandboxes,
-            evaluation_sandbox_digests=self.get_sandbox_digest_list(),
-            testcase=sr.dataset.testcases[self.operation.testcase_codename])]
+            "execution_memory": self.plus.get('execution_memory'),
+            "evaluation_shard": self.shard,
+            "evaluation_sandbox_paths": self.sandboxes,
+            "evaluation_sandbox_digests": self.get_sandbox_digest_list(),
+        }
 
     @staticmethod
     def from_user_test(
@@ -807,3 +829,194 @@ class JobGroup:
 
             jobs.append(Job.from_operation(operation, object_, dataset))
         return JobGroup(jobs)
+
+
+class _DatasetFiles(NamedTuple):
+    """The files of a dataset, as cached by DatasetJobCache."""
+    # Digests of the testcases and of the managers, computed by the DB.
+    fingerprint: tuple[str, str]
+    # Map from filename to digest.
+    managers: dict[str, str]
+    # Map from codename to input and output digests.
+    testcases: dict[str, tuple[str, str]]
+
+
+class DatasetJobCache:
+    """Build the job groups for the operations sent to the workers.
+
+    Each job of a submission repeats the same data of its dataset
+    (task type, limits, managers and testcases), so we keep the
+    files of each dataset in memory instead of loading them through
+    the ORM for every batch. At each batch we ask the DB for the small
+    scalar columns of the datasets involved and for a digest of their
+    testcases and managers, and we reload the files of a dataset only
+    if the digest changed (datasets can be modified in place, for
+    example when reimporting a task). The data specific to each
+    submission is then loaded with a few bulk queries.
+
+    Operations on user tests, which are rare, are built through the
+    ORM as in JobGroup.from_operations.
+
+    """
+
+    def __init__(self):
+        self._datasets: dict[int, _DatasetFiles] = {}
+
+    @staticmethod
+    def _fingerprint_columns() -> list:
+        testcases = select([func.md5(func.coalesce(func.string_agg(
+            Testcase.codename + " " + Testcase.input + " " + Testcase.output,
+            aggregate_order_by(literal_column("','"), Testcase.codename)),
+            ""))]).where(Testcase.dataset_id == Dataset.id).as_scalar()\
+            .label("testcases_digest")
+        managers = select([func.md5(func.coalesce(func.string_agg(
+            Manager.filename + " " + Manager.digest,
+            aggregate_order_by(literal_column("','"), Manager.filename)),
+            ""))]).where(Manager.dataset_id == Dataset.id).as_scalar()\
+            .label("managers_digest")
+        return [testcases, managers]
+
+    def _get_dataset_files(
+        self, dataset_id: int, fingerprint: tuple[str, str], session: Session
+    ) -> _DatasetFiles:
+        """Return the files of the dataset, reloading them if stale.
+
+        dataset_id: the id of the dataset.
+        fingerprint: the current digests of testcases and managers.
+        session: the session to use.
+
+        return: the files of the dataset.
+
+        """
+        files = self._datasets.get(dataset_id)
+        if files is not None and files.fingerprint == fingerprint:
+            return files
+        logger.debug("Loading files of dataset %d.", dataset_id)
+        managers = dict(
+            session.query(Manager.filename, Manager.digest)
+            .filter(Manager.dataset_id == dataset_id).all())
+        testcases = {
+            codename: (input_, output)
+            for codename, input_, output in
+            session.query(Testcase.codename, Testcase.input, Testcase.output)
+            .filter(Testcase.dataset_id == dataset_id).all()}
+        files = _DatasetFiles(fingerprint, managers, testcases)
+        self._datasets[dataset_id] = files
+        return files
+
+    def export_job_group(
+        self, operations: list[ESOperation], session: Session
+    ) -> dict:
+        """Return the job group for the operations, exported to dict.
+
+        The result is the same as that of
+        JobGroup.from_operations(operations, session).export_to_dict().
+
+        operations: the operations to build the jobs for.
+        session: the session to use.
+
+        return: the job group, exported to dict.
+
+        raise (KeyError): if some of the objects referred by the
+            operations do not exist.
+
+        """
+        submission_operations = [operation for operation in operations
+                                 if operation.for_submission()]
+
+        datasets = {}
+        if len(submission_operations) > 0:
+            dataset_ids = {operation.dataset_id
+                           for operation in submission_operations}
+            for row in session.query(
+                    Dataset.id, Dataset.task_type,
+                    Dataset.task_type_parameters, Dataset.time_limit,
+                    Dataset.memory_limit, Contest.languages,
+                    *self._fingerprint_columns())\
+                    .join(Task, Task.id == Dataset.task_id)\
+                    .outerjoin(Contest, Contest.id == Task.contest_id)\
+                    .filter(Dataset.id.in_(dataset_ids)).all():
+                datasets[row.id] = (row, self._get_dataset_files(
+                    row.id, (row.testcases_digest, row.managers_digest),
+                    session))
+
+            submission_ids = {operation.object_id
+                              for operation in submission_operations}
+            submissions = {
+                id_: (language, additional_info)
+                for id_, language, additional_info in session.query(
+                    Submission.id, Submission.language,
+                    Submission.additional_info)
+                .filter(Submission.id.in_(submission_ids)).all()}
+            files: dict[int, dict[str, str]] = \
+                {id_: {} for id_ in submission_ids}
+            for submission_id, filename, digest in session.query(
+                    File.submission_id, File.filename, File.digest)\
+                    .filter(File.submission_id.in_(submission_ids)).all():
+                files[submission_id][filename] = digest
+
+            executables: dict[tuple[int, int], dict[str, str]] = {}
+            evaluated = {(operation.object_id, operation.dataset_id)
+                         for operation in submission_operations
+                         if operation.type_ == ESOperation.EVALUATION}
+            if len(evaluated) > 0:
+                for submission_id, dataset_id, filename, digest in \
+                        session.query(Executable.submission_id,
+                                      Executable.dataset_id,
+                                      Executable.filename,
+                                      Executable.digest)\
+                        .filter(tuple_(Executable.submission_id,
+                                       Executable.dataset_id)
+                                .in_(evaluated)).all():
+                    executables.setdefault(
+                        (submission_id, dataset_id), {})[filename] = digest
+
+        jobs = []
+        for operation in operations:
+            if not operation.for_submission():
+                jobs.append(JobGroup.from_operations(
+                    [operation], session).jobs[0].export_to_dict())
+                continue
+
+            row, dataset_files = datasets[operation.dataset_id]
+            language, additional_info = submissions[operation.object_id]
+            common = {
+                "operation": operation,
+                "task_type": row.task_type,
+                "task_type_parameters": row.task_type_parameters,
+                "language": language,
+                "multithreaded_sandbox": _are_languages_multithreaded(
+                    row.languages or []),
+                "archive_sandbox": operation.archive_sandbox,
+            }
+            if operation.type_ == ESOperation.COMPILATION:
+                job = CompilationJob(
+                    info="compile submission %d" % operation.object_id,
+                    **common)
+            else:
+                input_, output = \
+                    dataset_files.testcases[operation.testcase_codename]
+                if additional_info is None:
+                    additional_limits = {}
+                else:
+                    additional_limits = json.loads(additional_info)\
+                        .get("limits", {})
+                job = EvaluationJob(
+                    input=input_,
+                    output=output,
+                    time_limit=additional_limits.get(
+                        "weak_time_limit", row.time_limit),
+                    memory_limit=additional_limits.get(
+                        "weak_mem_limit", row.memory_limit),
+                    info="evaluate submission %d on testcase %s" % (
+                        operation.object_id, operation.testcase_codename),
+                    **common)
+            job_dict = job.export_to_dict()
+            job_dict["files"] = dict(files[operation.object_id])
+            job_dict["managers"] = dict(dataset_files.managers)
+            if operation.type_ == ESOperation.EVALUATION:
+                job_dict["executables"] = dict(executables.get(
+                    (operation.object_id, operation.dataset_id), {}))
+            jobs.append(job_dict)
+
+        return {"jobs": jobs}
@@ -20,6 +20,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import fcntl
 import functools
 import logging
 import io
@@ -29,15 +30,24 @@ import stat
 import subprocess
 import tempfile
 import tarfile
+import time
 import typing
 
 from cms import config, rmtree
-from cms.db.filecacher import FileCacher
+from cms.db.filecacher import FileCacher, copyfileobj
 from cmscommon.commands import pretty_print_cmdline
 
 logger = logging.getLogger(__name__)
 
 
+# The ioctl making dst (its argument) a copy-on-write clone of src (the
+# file descriptor it is called on), from linux/fs.h.
+FICLONE = 0x40049409
+
+# Pairs of devices between which cloning failed, not to try again.
+_clone_unsupported: set[tuple[int, int]] = set()
+
+
 class SandboxInterfaceException(Exception):
     pass
 
@@ -201,6 +211,7 @@ class Sandbox:
         shard: int | None,
         name: str | None = None,
         temp_dir: str | None = None,
+        outer_dir: str | None = None,
     ):
         """Initialization.
 
@@ -212,6 +223,9 @@ class Sandbox:
             path and in system logs.
         temp_dir: temporary directory to use; if None, use the
             default temporary directory specified in the configuration.
+        outer_dir: if not None, the directory of a sandbox with the
+            same box_index that was reset (see reset()) and can be
+            reused as is, together with its isolate box.
 
         """
         self.name: str = name if name is not None else "unnamed"
@@ -241,12 +255,20 @@ class Sandbox:
         # we need to ensure that they can read and write to the directory.
         # But we don't want everybody on the system to, which is why the
         # outer directory exists with no read permissions.
-        self._outer_dir: str = tempfile.mkdtemp(
-            dir=self.temp_dir, prefix="cms-%s-" % (self.name)
-        )
+        if outer_dir is None:
+            self._outer_dir: str = tempfile.mkdtemp(
+                dir=self.temp_dir, prefix="cms-%s-" % (self.name)
+            )
+        else:
+            self._outer_dir = outer_dir
         self._home: str = os.path.join(self._outer_dir, "home")
         self._home_dest = "/tmp"
-        os.mkdir(self._home)
+        if outer_dir is None:
+            os.mkdir(self._home)
+
+        # Paths of the files that are hard links to files of the cache:
+        # their permissions must not be changed.
+        self._linked: set[str] = set()
 
         self.exec_name = "isolate"
         # Used for -M - the meta file ends up in the outer directory. The
@@ -276,6 +298,8 @@ class Sandbox:
         self.wallclock_timeout: float | None = None  # -w
         self.extra_timeout: float | None = None  # -x
         self.close_fds = True
+        # CPUs isolate and the sandboxed processes are pinned to.
+        self.cpus: set[int] | None = None
 
         self.max_processes: int = 1
 
@@ -309,8 +333,9 @@ class Sandbox:
         # after ourselves, but we might have missed something if a previous
         # worker was interrupted in the middle of an execution, so we issue an
         # idempotent cleanup.
-        self.cleanup()
-        self.initialize_isolate()
+        if outer_dir is None:
+            self.cleanup()
+            self.initialize_isolate()
 
     def set_multiprocess(self, multiprocess: bool):
         """Set the sandbox to (dis-)allow multiple threads and processes.
@@ -518,8 +543,100 @@ class Sandbox:
         executable: to set permissions.
 
         """
+        staging = config.sandbox.file_staging
+        if staging == "copy":
+            with self.create_file(path, executable) as dest_fobj:
+                file_cacher.get_file_to_fobj(digest, dest_fobj)
+            return
+
+        with file_cacher.get_file(digest) as src_fobj:
+            try:
+                src_fd = src_fobj.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                src_fd = None
+            if src_fd is not None:
+                if self._clone_file(path, src_fd, executable):
+                    return
+                if staging == "link" and \
+                        self._link_file(path, src_fd, executable):
+                    return
+            with self.create_file(path, executable) as dest_fobj:
+                copyfileobj(src_fobj, dest_fobj, FileCacher.CHUNK_SIZE)
+
+    def _clone_file(self, path: str, src_fd: int, executable: bool) -> bool:
+        """Create a file in the sandbox as a copy-on-write clone.
+
+        path: relative path of the file inside the sandbox.
+        src_fd: file descriptor of the file to clone.
+        executable: to set permissions.
+
+        return: whether the filesystem supports cloning the file.
+
+        """
+        devices = (os.fstat(src_fd).st_dev, os.stat(self._home).st_dev)
+        if devices in _clone_unsupported:
+            return False
         with self.create_file(path, executable) as dest_fobj:
-            file_cacher.get_file_to_fobj(digest, dest_fobj)
+            try:
+                fcntl.ioctl(dest_fobj.fileno(), FICLONE, src_fd)
+                return True
+            except OSError:
+                _clone_unsupported.add(devices)
+        os.remove(self.relative_path(path))
+        return False
+
+    def _link_file(self, path: str, src_fd: int, executable: bool) -> bool:
+        """Create a file in the sandbox as a hard link.
+
+        The linked file (in the cache) is made read-only, and readable
+        by everybody.
+
+        path: relative path of the file inside the sandbox.
+        src_fd: file descriptor of the file to link.
+        executable: to set permissions.
+
+        return: whether the file could be linked (it might be owned by
+            somebody else, or on another filesystem).
+
+        """
+        real_path = os.path.normpath(self.relative_path(path))
+        try:
+            mode = stat.S_IMODE(os.fstat(src_fd).st_mode)
+            # Never remove the execute permissions, another sandbox
+            # might be using the same file as an executable.
+            new_mode = mode & 0o555 | 0o444 | (0o111 if executable else 0)
+            if new_mode != mode:
+                os.fchmod(src_fd, new_mode)
+            # Link through the descriptor, as the file might be removed
+            # from the cache at any time. Passing a directory makes
+            # linkat follow the /proc link.
+            proc_fd = os.open("/proc/self/fd", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.link(str(src_fd), real_path, src_dir_fd=proc_fd,
+                        follow_symlinks=True)
+            finally:
+                os.close(proc_fd)
+        except OSError:
+            logger.debug("Couldn't link file %s in sandbox.", path,
+                         exc_info=True)
+            return False
+        self._linked.add(real_path)
+        return True
+
+    def _unlink_file(self, real_path: str):
+        """Replace a hard link to the cache with a private copy.
+
+        real_path: path of the file, outside the sandbox.
+
+        """
+        mode = stat.S_IMODE(os.stat(real_path).st_mode) | stat.S_IWUSR
+        tmp_path = real_path + ".cms-copy"
+        with open(real_path, "rb") as src_fobj, \
+                open(tmp_path, "xb") as dest_fobj:
+            copyfileobj(src_fobj, dest_fobj, FileCacher.CHUNK_SIZE)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, real_path)
+        self._linked.discard(real_path)
 
     def create_file_from_string(
         self, path: str, content: bytes, executable: bool = False
@@ -636,7 +753,9 @@ class Sandbox:
         path: relative path of the file inside the sandbox.
 
         """
-        os.remove(self.relative_path(path))
+        real_path = os.path.normpath(self.relative_path(path))
+        os.remove(real_path)
+        self._linked.discard(real_path)
 
     def execute_without_std(
         self, command: list[str], wait: bool = False
@@ -747,6 +866,59 @@ class Sandbox:
             # Delete the working directory.
             rmtree(self._outer_dir)
 
+    def reset(self, reinitialize: bool = False):
+        """Make the sandbox ready to be reused for another job.
+
+        The files in the sandbox are deleted, but the directory and the
+        isolate box (and its control group) are kept, so that a new
+        Sandbox can be created on them without initializing isolate
+        again (see the outer_dir argument of the constructor).
+
+        reinitialize: if True, also reinitialize the isolate box.
+
+        raise (SandboxInterfaceException): if the files written inside
+            the isolate box could not be deleted.
+        raise (OSError): if the files of the sandbox could not be
+            deleted.
+
+        """
+        # As in cleanup(), make our home writable, but also empty the
+        # box directory of isolate, which would otherwise be visible to
+        # the next job. The shell needs to fork.
+        ret = subprocess.call(
+            [
+                "isolate",
+                "--box-id=%d" % self.box_id,
+                "--cg",
+                "--processes=10",
+                "--dir=%s=%s:rw" % (self._home_dest, self._home),
+                "--run",
+                "--",
+                "/bin/sh",
+                "-c",
+                "chmod 777 -R %s 2>/dev/null; exec find /box -mindepth 1 -delete"
+                % self._home_dest,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        if ret != 0:
+            raise SandboxInterfaceException(
+                "Failed to empty sandbox (exit code %d)" % ret
+            )
+
+        for filename in os.listdir(self._outer_dir):
+            path = os.path.join(self._outer_dir, filename)
+            if os.path.isdir(path) and not os.path.islink(path):
+                rmtree(path)
+            else:
+                os.remove(path)
+        os.mkdir(self._home)
+
+        if reinitialize:
+            self.cleanup()
+            self.initialize_isolate()
+
     def archive(self, file_cacher: FileCacher) -> str | None:
         """Archive the directory where the sandbox operated.
 
@@ -808,13 +980,17 @@ class Sandbox:
         """Set permissions in such a way that any operation is allowed."""
         os.chmod(self._home, 0o777)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o777)
+            path = os.path.join(self._home, filename)
+            if path not in self._linked:
+                os.chmod(path, 0o777)
 
     def allow_writing_none(self):
         """Set permissions in such a way that the user cannot write anything."""
         os.chmod(self._home, 0o755)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o755)
+            path = os.path.join(self._home, filename)
+            if path not in self._linked:
+                os.chmod(path, 0o755)
 
     def allow_writing_only(self, inner_paths: list[str]):
         """Set permissions in so that the user can write only some paths.
@@ -847,6 +1023,8 @@ class Sandbox:
         for path in outer_paths:
             if not os.path.exists(path):
                 open(path, "wb").close()
+            elif path in self._linked:
+                self._unlink_file(path)
 
         # Close everything, then open only the specified.
         self.allow_writing_none()
@@ -990,6 +1168,11 @@ class Sandbox:
         with open(self.cmd_file, "at", encoding="utf-8") as commands:
             commands.write("%s\n" % (pretty_print_cmdline(args)))
         os.chmod(self._home, prev_permissions)
+        # The affinity is inherited by the processes isolate starts.
+        preexec_fn = None
+        if self.cpus is not None:
+            cpus = self.cpus
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
         try:
             p = subprocess.Popen(
                 args,
@@ -997,6 +1180,7 @@ class Sandbox:
                 stdout=stdout,
                 stderr=stderr,
                 close_fds=self.close_fds,
+                preexec_fn=preexec_fn,
             )
         except OSError:
             logger.critical(
@@ -1015,3 +1199,186 @@ class Sandbox:
             subprocess.check_call(init_cmd, stdout=subprocess.DEVNULL)
         except subprocess.CalledProcessError as e:
             raise SandboxInterfaceException("Failed to initialize sandbox") from e
+
+
+class SandboxPool:
+    """A pool of sandboxes that are reset and reused between jobs,
+    instead of being created and deleted each time.
+
+    The sandboxes of the pool use the box indices from BOX_INDEX_BASE
+    on, so that they never collide with those requested directly. The
+    pool can be used by several greenlets, but it is not thread-safe.
+
+    """
+
+    BOX_INDEX_BASE = 500
+    RESET_WIPE = "wipe"
+    RESET_REINIT = "reinit"
+
+    def __init__(self, shard: int | None, size: int, reset: str = RESET_WIPE):
+        """Initialization.
+
+        shard: the shard index of the service using the pool, if any.
+        size: the maximum number of sandboxes in the pool.
+        reset: how the sandboxes are reset between jobs: RESET_WIPE
+            only deletes their files, RESET_REINIT also reinitializes
+            their isolate box.
+
+        """
+        if reset not in (SandboxPool.RESET_WIPE, SandboxPool.RESET_REINIT):
+            raise ValueError("Unknown sandbox reset mode '%s'" % reset)
+        assert SandboxPool.BOX_INDEX_BASE + size <= 1000
+        self.shard = shard
+        self.size = size
+        self.reset = reset
+        # Box index and sandbox of the sandboxes in use (None while
+        # being created) and of those ready to be reused.
+        self._in_use: dict[int, Sandbox | None] = {}
+        self._free: list[tuple[int, Sandbox]] = []
+        self.stats = {
+            "created": 0,
+            "reused": 0,
+            "resets": 0,
+            "reset_failures": 0,
+            "creation_time": 0.0,
+            "reset_time": 0.0,
+        }
+
+    def acquire(self, name: str | None = None) -> Sandbox | None:
+        """Return a sandbox from the pool.
+
+        name: name of the sandbox.
+
+        return: a ready sandbox, or None if all the sandboxes of the
+            pool are in use.
+
+        raise (OSError): if a new sandbox cannot be created.
+
+        """
+        start = time.monotonic()
+        if self._free:
+            box_index, old_sandbox = self._free.pop()
+            sandbox = Sandbox(
+                box_index,
+                self.shard,
+                name=name,
+                temp_dir=old_sandbox.temp_dir,
+                outer_dir=old_sandbox.get_root_path(),
+            )
+            self.stats["reused"] += 1
+        elif len(self._in_use) < self.size:
+            box_index = next(
+                SandboxPool.BOX_INDEX_BASE + i
+                for i in range(self.size)
+                if SandboxPool.BOX_INDEX_BASE + i not in self._in_use
+            )
+            # Creating the sandbox yields to other greenlets, which
+            # must not take the same box index.
+            self._in_use[box_index] = None
+            try:
+                sandbox = Sandbox(box_index, self.shard, name=name)
+            except BaseException:
+                del self._in_use[box_index]
+                raise
+            self.stats["created"] += 1
+            self.stats["creation_time"] += time.monotonic() - start
+        else:
+            return None
+        self._in_use[box_index] = sandbox
+        return sandbox
+
+    def warm(self):
+        """Create the sandboxes of the pool that do not exist yet,
+        so that the first jobs do not pay for their initialization.
+
+        A sandbox that cannot be created is left to be created on
+        demand by acquire.
+
+        """
+        free = {box_index for box_index, _ in self._free}
+        for i in range(self.size):
+            box_index = SandboxPool.BOX_INDEX_BASE + i
+            if box_index in self._in_use or box_index in free:
+                continue
+            start = time.monotonic()
+            self._in_use[box_index] = None
+            try:
+                sandbox = Sandbox(box_index, self.shard, name="pool")
+            except (OSError, SandboxInterfaceException):
+                logger.warning("Couldn't create sandbox %d of the pool.",
+                               box_index, exc_info=True)
+                break
+            finally:
+                del self._in_use[box_index]
+            self._free.append((box_index, sandbox))
+            self.stats["created"] += 1
+            self.stats["creation_time"] += time.monotonic() - start
+
+    def _pop(self, sandbox: Sandbox) -> int | None:
+        for box_index, other in self._in_use.items():
+            if other is sandbox:
+                del self._in_use[box_index]
+                return box_index
+        return None
+
+    def release(self, sandbox: Sandbox) -> bool:
+        """Reset a sandbox and put it back in the pool.
+
+        sandbox: a sandbox, not necessarily from the pool.
+
+        return: whether the sandbox was from the pool; if it was, the
+            caller must not use it anymore.
+
+        """
+        box_index = self._pop(sandbox)
+        if box_index is None:
+            return False
+        start = time.monotonic()
+        try:
+            sandbox.reset(reinitialize=self.reset == SandboxPool.RESET_REINIT)
+        except (OSError, SandboxInterfaceException):
+            logger.warning(
+                "Couldn't reset sandbox %s, deleting it.",
+                sandbox.get_root_path(),
+                exc_info=True,
+            )
+            self.stats["reset_failures"] += 1
+            try:
+                sandbox.cleanup(delete=True)
+            except OSError:
+                logger.warning("Couldn't delete sandbox.", exc_info=True)
+        else:
+            self._free.append((box_index, sandbox))
+            self.stats["resets"] += 1
+        self.stats["reset_time"] += time.monotonic() - start
+        return True
+
+    def discard(self, sandbox: Sandbox) -> bool:
+        """Remove a sandbox from the pool without reusing it.
+
+        The caller is in charge of cleaning it up.
+
+        sandbox: a sandbox, not necessarily from the pool.
+
+        return: whether the sandbox was from the pool.
+
+        """
+        return self._pop(sandbox) is not None
+
+    def close(self):
+        """Delete the sandboxes ready to be reused."""
+        while self._free:
+            _, sandbox = self._free.pop()
+            try:
+                sandbox.cleanup(delete=True)
+            except OSError:
+                logger.warning("Couldn't delete sandbox.", exc_info=True)
+
+    def get_status(self) -> dict:
+        """Return the size, usage and statistics of the pool."""
+        return dict(
+            self.stats,
+            size=self.size,
+            in_use=len(self._in_use),
+            free=len(self._free),
+        )
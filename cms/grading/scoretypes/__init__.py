@@ -20,6 +20,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+import json
 import logging
 
 from cms import plugin_list
@@ -31,6 +33,7 @@ logger = logging.getLogger(__name__)
 
 __all__ = [
     "SCORE_TYPES", "get_score_type", "get_score_type_class",
+    "get_dataset_score_type",
     # abc
     "ScoreType", "ScoreTypeAlone", "ScoreTypeGroup",
 ]
@@ -40,6 +43,13 @@ SCORE_TYPES = dict((cls.__name__, cls)
                    for cls in plugin_list("cms.grading.scoretypes"))
 
 
+# For each dataset ID, the arguments its score type was last
+# instantiated with and the instance. It is shared by all the sessions
+# of the process, so that the score type is not instantiated again for
+# each submission result that is scored or shown.
+_dataset_score_types: dict[int, tuple[tuple, ScoreType]] = {}
+
+
 def get_score_type_class(name: str):
     """Load the ScoreType class given as parameter."""
     return SCORE_TYPES[name]
@@ -65,3 +75,36 @@ def get_score_type(
     """
     class_ = get_score_type_class(name)
     return class_(parameters, public_testcases, score_precision)
+
+
+def get_dataset_score_type(
+    dataset_id: int, name: str, parameters: object,
+    public_testcases: dict[str, bool], score_precision: int,
+) -> ScoreType:
+    """Construct the ScoreType of a dataset, or reuse the previous one.
+
+    The instance is reused as long as the arguments are the same as
+    the last time this was called for the dataset, so updates of the
+    dataset are picked up the next time it is used.
+
+    dataset_id: the ID of the dataset.
+    name: the name of the ScoreType class.
+    parameters: the parameters.
+    public_testcases: for each testcase (identified by
+        its codename) a flag telling whether it's public or not.
+    score_precision: the score precision of the task.
+
+    return: an instance of the correct ScoreType class.
+
+    """
+    key = (name, json.dumps(parameters, sort_keys=True),
+           tuple(sorted(public_testcases.items())), score_precision)
+    cached = _dataset_score_types.get(dataset_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    # The instance outlives the dataset object it comes from, so it
+    # must not share its mutable attributes.
+    score_type = get_score_type(name, copy.deepcopy(parameters),
+                                dict(public_testcases), score_precision)
+    _dataset_score_types[dataset_id] = (key, score_type)
+    return score_type
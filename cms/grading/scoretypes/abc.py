@@ -412,10 +412,18 @@ class ScoreTypeGroup(ScoreTypeAlone):
         to the corresponding subtask.
         The order of the list is the same as 'parameters'.
 
+        The result is computed only once per instance, as it depends
+        only on the parameters and the testcases.
+
         return: the list of the target testcases for each task.
 
         """
+        if not hasattr(self, "_target_testcases"):
+            self._target_testcases = self._retrieve_target_testcases()
+        return self._target_testcases
 
+    def _retrieve_target_testcases(self) -> list[list[str]]:
+        """Compute the result of retrieve_target_testcases."""
         t_params = [self.get_testcases(p) for p in self.parameters]
 
         if all(isinstance(t, int) for t in t_params):
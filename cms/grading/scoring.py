@@ -25,15 +25,18 @@
 
 from collections import namedtuple
 
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 
-from cms.db import Submission, Dataset, Participation, Task
+from cms.db import Contest, Session, Submission, SubmissionResult, Dataset, \
+    Participation, Task, Token
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 
 
 __all__ = [
-    "compute_changes_for_dataset", "task_score",
+    "compute_changes_for_dataset", "task_score", "contest_task_scores",
+    "contest_scores_fingerprint", "participation_task_scores", "TaskScores",
 ]
 
 
@@ -100,6 +103,10 @@ def compute_changes_for_dataset(
     return ret
 
 
+TaskScores = namedtuple(
+    'TaskScores', ['public_score', 'tokened_score', 'score', 'partial'])
+
+
 # Computing global scores (for ranking).
 
 
@@ -167,6 +174,170 @@ def task_score(
             score, score_details = sr.score, sr.score_details
         score_details_tokened.append((score, score_details, s.tokened()))
 
+    return _task_score(task, score_details_tokened), partial
+
+
+def contest_task_scores(
+    session: Session, contest: Contest
+) -> dict[int, dict[int, tuple[float, bool]]]:
+    """Return the scores of all the participations of a contest.
+
+    This computes task_score() for each participation and task at
+    once, loading only the columns it needs from the database.
+
+    session: the session to use.
+    contest: the contest.
+
+    return: for each participation ID and task ID, the score and
+        whether it is partial, as returned by task_score(); pairs
+        without official submissions are omitted.
+
+    """
+    tasks = {task.id: task for task in contest.tasks}
+    rows = _official_results_query(
+        session, Submission.participation_id, Submission.task_id,
+        Submission.additional_info.isnot(None) | Token.id.isnot(None),
+        SubmissionResult.filter_scored(),
+        SubmissionResult.score, SubmissionResult.score_details)\
+        .filter(Task.contest_id == contest.id)\
+        .order_by(Submission.timestamp, Submission.id)
+
+    # The arguments of the score modes, and whether the score is
+    # partial, for each participation and task.
+    groups: dict[tuple[int, int],
+                 tuple[list[tuple[float | None, object | None, bool]],
+                       list[bool]]] = {}
+    for p_id, t_id, tokened, scored, score, score_details in rows:
+        score_details_tokened, partial = \
+            groups.setdefault((p_id, t_id), ([], [False]))
+        if not scored:
+            partial[0] = True
+            score, score_details = None, None
+        score_details_tokened.append((score, score_details, tokened))
+
+    result: dict[int, dict[int, tuple[float, bool]]] = {}
+    for (p_id, t_id), (score_details_tokened, partial) in groups.items():
+        result.setdefault(p_id, {})[t_id] = \
+            (_task_score(tasks[t_id], score_details_tokened), partial[0])
+    return result
+
+
+def contest_scores_fingerprint(session: Session, contest: Contest) -> tuple:
+    """Return a value that changes when the scores of a contest change.
+
+    It is computed with a single aggregate query on the submissions
+    of the contest and their results on the active datasets, and on
+    the attributes of the tasks that affect the scores. It is cheap,
+    but it doesn't notice a rescoring that changes the scores of the
+    results without changing which ones are scored: ScoringService
+    tells AdminWebServer about those (see scores_changed).
+
+    session: the session to use.
+    contest: the contest.
+
+    return: the fingerprint, comparable for equality.
+
+    """
+    aggregates = _official_results_query(
+        session, func.count(Submission.id), func.max(Submission.id),
+        func.count(Token.id),
+        func.count(SubmissionResult.submission_id)
+        .filter(SubmissionResult.filter_scored()))\
+        .filter(Task.contest_id == contest.id)\
+        .one()
+    tasks = tuple((task.id, task.active_dataset_id, task.score_mode,
+                   task.score_precision) for task in contest.tasks)
+    return tuple(aggregates), tasks
+
+
+def participation_task_scores(
+    session: Session, participation: Participation, task: Task
+) -> TaskScores:
+    """Return all the scores of a contest's user on a task.
+
+    This is equivalent to calling task_score() with each combination
+    of its flags, but uses a single query that loads only the columns
+    it needs from the database.
+
+    session: the session to use.
+    participation: the user and contest for which to compute the
+        scores.
+    task: the task for which to compute the scores.
+
+    return: the public score, the score restricted to the tokened
+        submissions, the actual score, and True if not all submissions
+        of the participation in the task have been scored.
+
+    """
+    rows = _official_results_query(
+        session, Submission.additional_info.isnot(None) | Token.id.isnot(None),
+        SubmissionResult.filter_scored(),
+        SubmissionResult.score, SubmissionResult.score_details,
+        SubmissionResult.public_score, SubmissionResult.public_score_details)\
+        .filter(Submission.participation_id == participation.id)\
+        .filter(Submission.task_id == task.id)\
+        .order_by(Submission.timestamp, Submission.id)\
+        .all()
+    if len(rows) == 0:
+        return TaskScores(0.0, 0.0, 0.0, False)
+
+    public, tokened, actual = [], [], []
+    partial = False
+    for s_tokened, scored, score, score_details, \
+            public_score, public_score_details in rows:
+        if not scored:
+            partial = True
+            public.append((None, None, s_tokened))
+            tokened.append((None, None, s_tokened))
+            actual.append((None, None, s_tokened))
+            continue
+        public.append((public_score, public_score_details, s_tokened))
+        if s_tokened:
+            tokened.append((score, score_details, s_tokened))
+        else:
+            tokened.append((None, None, s_tokened))
+        actual.append((score, score_details, s_tokened))
+
+    return TaskScores(_task_score(task, public), _task_score(task, tokened),
+                      _task_score(task, actual), partial)
+
+
+def _official_results_query(session: Session, *columns):
+    """Return a query on the official submissions and their results.
+
+    Each submission is joined with its task, its token (if any) and
+    its result on the active dataset of its task (if any).
+
+    session: the session to use.
+    columns: the columns to select.
+
+    return: the query.
+
+    """
+    return session.query(*columns)\
+        .select_from(Submission)\
+        .join(Task, Submission.task_id == Task.id)\
+        .outerjoin(Token, Token.submission_id == Submission.id)\
+        .outerjoin(SubmissionResult,
+                   (SubmissionResult.submission_id == Submission.id)
+                   & (SubmissionResult.dataset_id == Task.active_dataset_id))\
+        .filter(Submission.official.is_(True))
+
+
+def _task_score(
+    task: Task,
+    score_details_tokened: list[tuple[float | None, object | None, bool]],
+) -> float:
+    """Compute the score of a task with its score mode.
+
+    task: the task.
+    score_details_tokened: a tuple for each submission of the user in the task,
+        sorted by time, containing score, score details (each None if not
+        scored yet) and if the submission was tokened.
+
+    return: the score.
+
+    """
     if task.score_mode == SCORE_MODE_MAX:
         score = _task_score_max(score_details_tokened)
     elif task.score_mode == SCORE_MODE_MAX_SUBTASK:
@@ -179,9 +350,7 @@ def task_score(
     # The following line should be unnecessary since subtask scores 
     # are rounded. However we are using floats not Decimals 
     # and this can cause errors. So we round again to be sure. 
-    score = round(score, task.score_precision)
-    
-    return score, partial
+    return round(score, task.score_precision)
 
 
 def _task_score_max_tokened_last(
@@ -72,6 +72,100 @@ def _white_diff_canonicalize(string: bytes) -> bytes:
     return string
 
 
+# Translation table mapping all whitespaces but the newline to " ".
+_TO_SPACE = bytes.maketrans(b"".join(_WHITES[1:]).replace(b"\n", b""),
+                            b" " * (len(_WHITES) - 2))
+
+
+def _white_diff_canonicalize_block(block: bytes) -> bytes:
+    """Apply _white_diff_canonicalize() to every line of a block.
+
+    block: lines separated by newlines.
+    return: the canonicalized lines, separated by newlines.
+
+    """
+    block = block.translate(_TO_SPACE)
+    # Each pass halves the length of the runs of spaces.
+    while b"  " in block:
+        block = block.replace(b"  ", b" ")
+    return block.replace(b" \n", b"\n").replace(b"\n ", b"\n").strip(b" ")
+
+
+class _LineReader:
+    """Read the lines of a file in blocks of many lines."""
+
+    # Size of the reads from the file.
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, fobj: typing.BinaryIO):
+        self.fobj = fobj
+        # Data read but not returned yet, and number of newlines in it.
+        self.buffer = b""
+        self.newlines = 0
+        self.eof = False
+
+    def fill(self):
+        """Read until the buffer has a complete line or the file ends."""
+        chunks = [self.buffer]
+        while self.newlines == 0 and not self.eof:
+            chunk = self.fobj.read(self.CHUNK_SIZE)
+            self.eof = len(chunk) == 0
+            self.newlines += chunk.count(b"\n")
+            chunks.append(chunk)
+        self.buffer = b"".join(chunks)
+
+    def take_lines(self, count: int) -> bytes:
+        """Return the next count complete lines, without the newline
+        after the last one.
+
+        """
+        if count == self.newlines:
+            end = self.buffer.rindex(b"\n")
+            block = self.buffer[:end]
+            self.buffer = self.buffer[end + 1:]
+        else:
+            lines = self.buffer.split(b"\n", count)
+            self.buffer = lines.pop()
+            block = b"\n".join(lines)
+        self.newlines -= count
+        return block
+
+    def take_line(self) -> bytes:
+        """Return the next line, or b"" at the end of the file (to be
+        called after fill()).
+
+        """
+        if self.newlines > 0:
+            return self.take_lines(1) + b"\n"
+        return self.take_rest()
+
+    def take_rest(self) -> bytes:
+        """Return the data not returned yet, in chunks, or b"" at the
+        end of the file.
+
+        """
+        if len(self.buffer) > 0:
+            block, self.buffer = self.buffer, b""
+            self.newlines = 0
+            return block
+        if self.eof:
+            return b""
+        return self.fobj.read(self.CHUNK_SIZE)
+
+
+def _mismatch_message(lout: bytes, lres: bytes, line: int) -> str:
+    lout = _white_diff_canonicalize(lout)
+    lres = _white_diff_canonicalize(lres)
+    LENGTH_LIMIT = 100
+    if len(lout) > LENGTH_LIMIT:
+        lout = lout[:LENGTH_LIMIT] + b"..."
+    if len(lres) > LENGTH_LIMIT:
+        lres = lres[:LENGTH_LIMIT] + b"..."
+    lout = lout.decode("utf-8", errors='backslashreplace')
+    lres = lres.decode("utf-8", errors='backslashreplace')
+    return f"Expected `{lres}`, found `{lout}` on line {line}"
+
+
 def _white_diff(output: typing.BinaryIO, res: typing.BinaryIO) -> tuple[bool, str | None]:
     """Compare the two output files. Two files are equal if for every
     integer i, line i of first file is equal to line i of second
@@ -83,46 +177,59 @@ def _white_diff(output: typing.BinaryIO, res: typing.BinaryIO) -> tuple[bool, st
     'sequence of characters ending with \n or EOF and beginning right
     after BOF or \n'. In particular, every line has *at most* one \n.
 
+    The files are read in large chunks, and their lines are compared
+    in blocks as long as possible: first byte by byte and, if they
+    differ, after canonicalizing the whole blocks.
+
     output: the first file to compare.
     res: the second file to compare.
     return: True if the two file are equal as explained above.
 
     """
-
+    out_reader = _LineReader(output)
+    res_reader = _LineReader(res)
     line = 0
 
+    # Compare blocks of complete lines while both files have some.
     while True:
-        lout = output.readline()
-        lres = res.readline()
-        line += 1
-
-        # Both files finished: comparison succeded
-        if len(lres) == 0 and len(lout) == 0:
-            return True, None
-
-        # Only one file finished: ok if the other contains only blanks
-        elif len(lres) == 0 or len(lout) == 0:
-            lout = lout.strip(b''.join(_WHITES))
-            lres = lres.strip(b''.join(_WHITES))
-            if len(lout) > 0:
-                return False, "Contestant output too long"
-            if len(lres) > 0:
-                return False, "Contestant output too short"
-
-        # Both file still have lines to go: ok if they agree except
-        # for the number of whitespaces
-        else:
-            lout = _white_diff_canonicalize(lout)
-            lres = _white_diff_canonicalize(lres)
-            if lout != lres:
-                LENGTH_LIMIT = 100
-                if len(lout) > LENGTH_LIMIT:
-                    lout = lout[:LENGTH_LIMIT] + b"..."
-                if len(lres) > LENGTH_LIMIT:
-                    lres = lres[:LENGTH_LIMIT] + b"..."
-                lout = lout.decode("utf-8", errors='backslashreplace')
-                lres = lres.decode("utf-8", errors='backslashreplace')
-                return False, f"Expected `{lres}`, found `{lout}` on line {line}"
+        out_reader.fill()
+        res_reader.fill()
+        count = min(out_reader.newlines, res_reader.newlines)
+        if count == 0:
+            break
+        out_block = out_reader.take_lines(count)
+        res_block = res_reader.take_lines(count)
+        if out_block != res_block:
+            out_lines = _white_diff_canonicalize_block(out_block).split(b"\n")
+            res_lines = _white_diff_canonicalize_block(res_block).split(b"\n")
+            if out_lines != res_lines:
+                index = next(index for index, (lout, lres)
+                             in enumerate(zip(out_lines, res_lines))
+                             if lout != lres)
+                return False, _mismatch_message(
+                    out_lines[index], res_lines[index], line + index + 1)
+        line += count
+
+    # One of the files has at most one more (incomplete) line: compare
+    # it with the next line of the other file, and then check that
+    # the rest of the other file is blank.
+    lout = out_reader.take_line()
+    lres = res_reader.take_line()
+    line += 1
+    if len(lout) > 0 and len(lres) > 0:
+        if _white_diff_canonicalize(lout) != _white_diff_canonicalize(lres):
+            return False, _mismatch_message(lout, lres, line)
+        lout = out_reader.take_rest()
+        lres = res_reader.take_rest()
+    whites = b"".join(_WHITES)
+    while len(lout) > 0 or len(lres) > 0:
+        if len(lout.translate(None, whites)) > 0:
+            return False, "Contestant output too long"
+        if len(lres.translate(None, whites)) > 0:
+            return False, "Contestant output too short"
+        lout = out_reader.take_rest()
+        lres = res_reader.take_rest()
+    return True, None
 
 
 def white_diff_fobj_step(
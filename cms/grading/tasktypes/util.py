@@ -33,11 +33,13 @@ import logging
 import os
 import shutil
 
+import gevent.local
+
 from cms import config
 from cms.db.filecacher import FileCacher
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob, Job
-from cms.grading.Sandbox import Sandbox
+from cms.grading.Sandbox import Sandbox, SandboxPool
 from cms.grading.language import Language
 from cms.grading.steps import EVALUATION_MESSAGES, checker_step, \
     white_diff_fobj_step
@@ -49,10 +51,57 @@ logger = logging.getLogger(__name__)
 EVAL_USER_OUTPUT_FILENAME = "user_output.txt"
 
 
+# The pool from which create_sandbox takes the sandboxes, if any.
+_sandbox_pool: SandboxPool | None = None
+
+
+def set_sandbox_pool(pool: SandboxPool | None):
+    """Set the pool from which create_sandbox takes the sandboxes.
+
+    pool: the pool, or None to always create new sandboxes.
+
+    """
+    global _sandbox_pool
+    _sandbox_pool = pool
+
+
+# Number of box indices reserved to each job slot (see set_job_slot);
+# task types use at most one more than the number of user processes.
+BOXES_PER_JOB_SLOT = 50
+
+
+class _JobSlot(gevent.local.local):
+    """The job slot of the current greenlet."""
+    index = 0
+    cpus: set[int] | None = None
+
+
+_job_slot = _JobSlot()
+
+
+def set_job_slot(index: int, cpus: set[int] | None = None):
+    """Set the job slot of the jobs executed by the current greenlet.
+
+    A worker executing several jobs at the same time gives each of
+    them a distinct slot. The sandboxes created for a slot use the box
+    indices from index * BOXES_PER_JOB_SLOT on, so that they do not
+    collide with those of the other slots, and their processes only
+    run on the given CPUs.
+
+    index: the index of the slot.
+    cpus: the CPUs the sandboxes of the slot are pinned to, or None
+        not to pin them.
+
+    """
+    _job_slot.index = index
+    _job_slot.cpus = cpus
+
+
 def create_sandbox(box_index: int, file_cacher: FileCacher, name: str | None = None) -> Sandbox:
     """Create a sandbox, and return it.
 
-    box_index: the index of this sandbox within this service.
+    box_index: the index of this sandbox within this service (and
+        within the job slot of the current greenlet).
     file_cacher: a file cacher instance.
     name: name to include in the path of the sandbox.
 
@@ -62,12 +111,20 @@ def create_sandbox(box_index: int, file_cacher: FileCacher, name: str | None = N
 
     """
     try:
-        shard = file_cacher.service.shard if file_cacher.service is not None else None
-        sandbox = Sandbox(box_index, shard, name=name)
+        sandbox = None
+        if _sandbox_pool is not None:
+            sandbox = _sandbox_pool.acquire(name)
+        if sandbox is None:
+            shard = file_cacher.service.shard if file_cacher.service is not None else None
+            sandbox = Sandbox(
+                _job_slot.index * BOXES_PER_JOB_SLOT + box_index,
+                shard,
+                name=name)
     except OSError:
         err_msg = "Couldn't create sandbox."
         logger.error(err_msg, exc_info=True)
         raise JobException(err_msg)
+    sandbox.cpus = _job_slot.cpus
     return sandbox
 
 
@@ -95,6 +152,10 @@ def delete_sandbox(sandbox: Sandbox, job: Job, file_cacher: FileCacher, success:
                        sandbox.get_root_path())
 
     delete = success and not config.worker.keep_sandbox and not job.keep_sandbox
+    if _sandbox_pool is not None:
+        if delete and _sandbox_pool.release(sandbox):
+            return
+        _sandbox_pool.discard(sandbox)
     try:
         sandbox.cleanup(delete=delete)
     except OSError:
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Programming contest management system
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from pathlib import Path
+from shutil import rmtree
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class BuildCache:
+    """Persistent cache of the statements compiled by TaskFetch and
+    TaskAccess, so that they survive the restarts of the servers.
+
+    Each entry is a directory containing the PDF and the log of a
+    successful compilation. The key of an entry has to identify the
+    content it was compiled from (e.g. the git tree hashes of the
+    directories involved and the language). When the entries grow
+    bigger than max_size_mib, the least recently used ones are
+    deleted. The directory can be shared by several servers.
+
+    """
+    PDF_FILE = "statement.pdf"
+    LOG_FILE = "log.html"
+    KEY_FILE = "key"
+
+    def __init__(self, path: str, max_size_mib: int):
+        """Create the cache.
+
+        path: the directory of the cache; it is created if needed.
+        max_size_mib: the maximum size of the cache, in MiB; 0 means
+            no limit.
+
+        """
+        self.path = Path(path)
+        self.max_size = max_size_mib * 1024 * 1024
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple[bytes, str]]:
+        """Return the PDF and the log stored for key, or None if there
+        are none.
+
+        """
+        entry = self._entry_path(key)
+        try:
+            result = (entry / BuildCache.PDF_FILE).read_bytes()
+            log = (entry / BuildCache.LOG_FILE).read_text(encoding="utf-8")
+            # The modification time of an entry is its last use.
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return result, log
+
+    def put(self, key: str, result: bytes, log: str):
+        """Store the PDF and the log compiled for key.
+
+        """
+        entry = self._entry_path(key)
+        # Write the entry aside and move it in place at once, so that
+        # the other servers never see it incomplete.
+        temp = Path(tempfile.mkdtemp(dir=self.path, prefix="_temp"))
+        try:
+            (temp / BuildCache.PDF_FILE).write_bytes(result)
+            (temp / BuildCache.LOG_FILE).write_text(log, encoding="utf-8")
+            (temp / BuildCache.KEY_FILE).write_text(key, encoding="utf-8")
+            try:
+                os.rename(temp, entry)
+            except OSError:
+                # Someone else stored it meanwhile.
+                pass
+        except OSError as e:
+            logger.warning("Couldn't store {} in the build cache: {}".
+                           format(key, e))
+        finally:
+            rmtree(temp, ignore_errors=True)
+
+        self._evict()
+
+    def _evict(self):
+        """Delete the least recently used entries until the cache fits
+        in its maximum size.
+
+        """
+        if self.max_size <= 0:
+            return
+
+        entries = []
+        for entry in self.path.iterdir():
+            if entry.name.startswith("_temp"):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            rmtree(entry, ignore_errors=True)
+            total_size -= size
+            logger.info("{} evicted from the build cache.".format(entry.name))
@@ -166,3 +166,30 @@ class Repository:
                 return None
             else:
                 return gitout.decode("utf-8").strip()
+
+    def get_tree_hashes(self, paths) -> Optional[list[str]]:
+        """Return the git hashes of the given paths (relative to the
+        repository) in HEAD, which identify their whole content.
+
+        Return None if they can't be used to identify the content on
+        disk, i.e. if one of them is missing in HEAD or has
+        uncommitted changes to tracked files (or if the repository is
+        not a git repository).
+
+        """
+        paths = [str(path) for path in paths]
+        with chdir(self.path):
+            try:
+                dirty = check_output(
+                    ["git", "status", "--porcelain", "--untracked-files=no",
+                     "--"] + paths)
+                if dirty.strip():
+                    return None
+                gitout = check_output(
+                    ["git", "rev-parse"] +
+                    ["HEAD:./" + path for path in paths])
+            except Exception as e:
+                logger.warning("Couldn't get tree hashes: {}".format(e))
+                return None
+            else:
+                return gitout.decode("utf-8").split()
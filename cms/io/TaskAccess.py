@@ -74,34 +74,79 @@ def repository_lock_file_code(contest, task, language):
 
 
 class TaskCompileJob:
-    def __init__(self, repository, contest, name, balancer, language=None):
+    def __init__(self, repository, contest, name, balancer, language=None,
+                 build_cache=None):
         self.repository = repository
         self.contest = contest
         self.name = name
         self.balancer = balancer
         self.language = language
+        self.build_cache = build_cache
 
-        self.current_handle = 1
+        self.current_handle = 0
         self.backup_handle = 0
         self.backup = None
-        self.idle = False
-
-        self._compile()
+        self.idle = True
+        self.status = {"error":  False,
+                       "done":   False,
+                       "result": None,
+                       "msg":    "Okay",
+                       "log":    ""}
 
     def join(self):
         self._update()
 
         if self.idle:
             self.current_handle += 1
-            self._compile()
+            if not self._load_cached():
+                self._compile()
         return self.current_handle
 
+    def _cache_key(self):
+        """Return the key of the statement in the build cache, or None
+        if it can't be cached.
+
+        """
+        # We compile the whole contest directory (and the overview
+        # also uses the list of the languages).
+        paths = [Path(self.contest)]
+        if self.name.endswith("overview"):
+            paths.append(Path("languages.json"))
+        hashes = self.repository.get_tree_hashes(paths)
+        if hashes is None:
+            return None
+        return "translate/{}/{}/{}".format("/".join(hashes), self.name,
+                                           self.language)
+
+    def _load_cached(self):
+        """Take the statement from the build cache as the result of
+        the current handle, if it's there.
+
+        """
+        if self.build_cache is None:
+            return False
+        # Don't look at the repository while someone is pulling.
+        with self.repository:
+            key = self._cache_key()
+        cached = None if key is None else self.build_cache.get(key)
+        if cached is None:
+            return False
+
+        logger.info("found task {} in the build cache".format(self.name))
+        self.backup = {"error":  False,
+                       "done":   True,
+                       "result": cached[0],
+                       "msg":    "Okay",
+                       "log":    cached[1]}
+        self.backup_handle = self.current_handle
+        return True
+
     def _compile(self):
         self._reset_status()
         logger.info("loading task {} in {}".format(self.name,
                                                    self.repository.path))
 
-        def do(status, repository, balancer):
+        def do(status, repository, balancer, build_cache):
             # stdout is process local in Python, so we can simply use this
             # to redirect all output from GerMake to a string
             sys.stdout = StringIO()
@@ -158,6 +203,10 @@ class TaskCompileJob:
                         )
 
                     with repository:
+                        # The key has to be computed after pulling, it
+                        # identifies what we are going to compile.
+                        if build_cache is not None:
+                            status["key"] = self._cache_key()
                         comp.prepare()
 
                         # TODO Kommentieren!
@@ -240,7 +289,8 @@ class TaskCompileJob:
 
         self.compilation_process = Process(target=do, args=(self.status,
                                                             self.repository,
-                                                            self.balancer))
+                                                            self.balancer,
+                                                            self.build_cache))
         self.compilation_process.daemon = True
         self.compilation_process.start()
 
@@ -253,6 +303,12 @@ class TaskCompileJob:
             self.backup.update(self.status)
             self.backup_handle = self.current_handle
 
+            if self.backup["key"] is not None and \
+                    self.backup["result"] is not None:
+                self.build_cache.put(self.backup["key"],
+                                     self.backup["result"],
+                                     self.backup["log"])
+
             # Release Manager subprocess for status
             self.compilation_process.join()
             del self.compilation_process
@@ -271,7 +327,8 @@ class TaskCompileJob:
                             "done":   False,
                             "result": None,
                             "msg":    "Okay",
-                            "log":    ""})
+                            "log":    "",
+                            "key":    None})
         self.idle = False
 
     def info(self, handle):
@@ -425,14 +482,16 @@ class TaskAccess:
     jobs = {}
     repository = None
     balancer = None
+    build_cache = None
 
     @staticmethod
-    def init(repository, max_compilations):
+    def init(repository, max_compilations, build_cache=None):
         logger.info("initializing task compilation in directory {}.".
                     format(repository.path))
 
         TaskAccess.repository = repository
         TaskAccess.balancer = Manager().BoundedSemaphore(max_compilations)
+        TaskAccess.build_cache = build_cache
 
     @staticmethod
     def compile(name):
@@ -443,7 +502,8 @@ class TaskAccess:
                                                    contest,
                                                    task,
                                                    TaskAccess.balancer,
-                                                   language)
+                                                   language,
+                                                   TaskAccess.build_cache)
         return TaskAccess.jobs[name].join()
 
     @staticmethod
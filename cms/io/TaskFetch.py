@@ -27,6 +27,7 @@ from typing import Optional
 from io import StringIO
 from ansi2html import Ansi2HTMLConverter
 
+from cms.io.BuildCache import BuildCache
 from cms.io.Repository import Repository
 from cms.io.TaskInfo import TaskInfo
 
@@ -44,28 +45,69 @@ class TaskCompileJob:
         language,
         task_folder: str,
         balancer,
+        build_cache: Optional[BuildCache] = None,
     ):
         self.repository = repository
         self.name = name
         self.language = language
         self.task_folder = task_folder
         self.balancer = balancer
+        self.build_cache = build_cache
 
-        self.current_handle = 1
+        self.current_handle = 0
         self.backup_handle = 0
         self.backup = None
-        self.idle = False
-
-        self._compile()
+        self.idle = True
+        self.status = {"error":  False,
+                       "done":   False,
+                       "result": None,
+                       "msg":    "Okay",
+                       "log":    ""}
 
     def join(self):
         self._update()
 
         if self.idle:
             self.current_handle += 1
-            self._compile()
+            if not self._load_cached():
+                self._compile()
         return self.current_handle
 
+    def _cache_key(self) -> Optional[str]:
+        """Return the key of the statement in the build cache, or None
+        if it can't be cached.
+
+        """
+        hashes = self.repository.get_tree_hashes([self.task_folder])
+        if hashes is None:
+            return None
+        return "task/{}/{}".format(hashes[0], self.language)
+
+    def _load_cached(self) -> bool:
+        """Take the statement from the build cache as the result of
+        the current handle, if it's there.
+
+        """
+        if self.build_cache is None:
+            return False
+        # Don't look at the repository while someone is pulling.
+        with self.repository:
+            key = self._cache_key()
+        cached = None if key is None else self.build_cache.get(key)
+        if cached is None:
+            return False
+
+        logger.info("found task {} with language = {} in the build cache".
+                    format(self.name,
+                           "ALL" if self.language is None else self.language))
+        self.backup = {"error":  False,
+                       "done":   True,
+                       "result": cached[0],
+                       "msg":    "Okay",
+                       "log":    cached[1]}
+        self.backup_handle = self.current_handle
+        return True
+
     def _compile(self):
         self._reset_status()
         directory = Path(self.repository.path) / self.task_folder
@@ -83,6 +125,7 @@ class TaskCompileJob:
             language,
             directory: str,
             balancer,
+            build_cache,
         ):
             # stdout is process local in Python, so we can simply use this
             # to redirect all output from GerMakeTask to a string
@@ -107,6 +150,10 @@ class TaskCompileJob:
                     comp = GerMakeTask(**task_kwargs)
 
                     with repository:
+                        # The key has to be computed after pulling, it
+                        # identifies what we are going to compile.
+                        if build_cache is not None:
+                            status["key"] = self._cache_key()
                         comp.prepare()
 
                     statement_file = comp.build()
@@ -147,6 +194,7 @@ class TaskCompileJob:
                 self.language,
                 str(directory),
                 self.balancer,
+                self.build_cache,
             ),
         )
         self.compilation_process.daemon = True
@@ -161,6 +209,12 @@ class TaskCompileJob:
             self.backup.update(self.status)
             self.backup_handle = self.current_handle
 
+            if self.backup["key"] is not None and \
+                    self.backup["result"] is not None:
+                self.build_cache.put(self.backup["key"],
+                                     self.backup["result"],
+                                     self.backup["log"])
+
             # Release Manager subprocess for status
             self.compilation_process.join()
             del self.compilation_process
@@ -179,7 +233,8 @@ class TaskCompileJob:
                             "done":   False,
                             "result": None,
                             "msg":    "Okay",
-                            "log":    ""})
+                            "log":    "",
+                            "key":    None})
         self.idle = False
 
     def info(self, handle):
@@ -212,18 +267,20 @@ class TaskFetch:
     jobs = {}
     repository: Optional[Repository] = None
     balancer = None
+    build_cache: Optional[BuildCache] = None
 
     @staticmethod
     def get_key(name, language):
         return (name, language)
 
     @staticmethod
-    def init(repository, max_compilations):
+    def init(repository, max_compilations, build_cache=None):
         logger.info("initializing task compilation in directory {}.".
                     format(repository.path))
 
         TaskFetch.repository = repository
         TaskFetch.balancer = Manager().BoundedSemaphore(max_compilations)
+        TaskFetch.build_cache = build_cache
 
     @staticmethod
     def compile(name: str, language):
@@ -239,6 +296,7 @@ class TaskFetch:
                 language,
                 TaskInfo.tasks[name]["folder"],
                 TaskFetch.balancer,
+                TaskFetch.build_cache,
             )
         return TaskFetch.jobs[key].join()
 
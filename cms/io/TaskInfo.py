@@ -45,6 +45,17 @@ from cmscontrib.gerpythonformat.TaskConfig import TaskConfig
 logger = logging.getLogger(__name__)
 
 
+def stat_key(path: Path):
+    """returns a value that changes whenever the file (or directory) at
+    path is modified, replaced, created or deleted, without reading it
+    """
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
 class DateEntry:
     def __init__(self, date_code, info):
         self.date = datetime.strptime(date_code, "%Y-%m-%d").date()
@@ -124,9 +135,12 @@ class SingleTaskInfo:
 class TaskDataSource:
     """Base class representing different data sources for the tasks"""
 
-    def __init__(self, tasks, is_annotator=False) -> None:
+    def __init__(self, tasks, is_annotator=False, version=None) -> None:
         self.tasks = tasks
         self.is_annotator = is_annotator
+        # shared counter (see TaskInfo.version), increased whenever
+        # the tasks are changed
+        self.version = version
 
     def merge_uses(self, new: list, old: list) -> list:
         def clean(u):
@@ -159,16 +173,25 @@ class TaskDataSource:
         return res
 
     def apply(self, data: dict) -> None:
+        changed = False
         for task_code, info in data.items():
             if info is None:
                 if not self.is_annotator:
-                    self.tasks.pop(task_code, None)
+                    changed |= self.tasks.pop(task_code, None) is not None
                 continue
             old = self.tasks.get(task_code, {"timestamp": 0})
             info = self.merge(info, old)
             if info != old:
                 info["timestamp"] = time()
                 self.tasks[task_code] = info
+                changed = True
+        if changed:
+            self.changed()
+
+    def changed(self) -> None:
+        """to be called after changing self.tasks"""
+        if self.version is not None:
+            self.version.value += 1
 
     def load_once(self, repository: Repository) -> None:
         """responsible for loading data on startup"""
@@ -182,10 +205,13 @@ class TaskDataSource:
 class InfoJsonSource(TaskDataSource):
     REQUIRED_FIELDS = ("title", "algorithm", "implementation")
 
-    def __init__(self, tasks, tasks_folders: Collection[str]):
-        super().__init__(tasks)
+    def __init__(self, tasks, tasks_folders: Collection[str], version=None):
+        super().__init__(tasks, version=version)
         self.tasks_folders = tasks_folders
         self.task_codes: set[str] = set()
+        # for each task, the stat_key of its info.json and its folder
+        # when it was last parsed; unchanged tasks are not parsed again
+        self.index: dict[str, tuple] = {}
 
     def load_once(self, repository: Repository) -> None:
         self.update(repository)
@@ -203,14 +229,19 @@ class InfoJsonSource(TaskDataSource):
                 code = task_dir.parts[-1]
                 cur_codes.add(code)
                 folder = task_dir.relative_to(repository_root).parent
+                key = (stat_key(task_dir / "info.json"), folder)
+                if self.index.get(code) == key:
+                    continue
                 task_info = SingleTaskInfo(code, Path(folder))
                 task_info.update(self.parse_single(task_dir))
                 res[code] = task_info.to_dict()
+                self.index[code] = key
             except Exception:
                 logger.info("\n".join(format_exception(*exc_info())))
         # Remove tasks that are no longer available
         for code in self.task_codes - cur_codes:
             res[code] = None
+            self.index.pop(code, None)
         self.task_codes = cur_codes
         return res
 
@@ -252,10 +283,14 @@ class InfoJsonSource(TaskDataSource):
     def update(self, repository: Repository) -> None:
         start = time()
         with repository:
-            self.apply(self.load(repository))
-        logger.info(
-            "Parsed all info.json's in {}ms".format(int(1000 * (time() - start)))
-        )
+            data = self.load(repository)
+            self.apply(data)
+        if len(data) > 0:
+            logger.info(
+                "Parsed {} changed info.json's in {}ms".format(
+                    len(data), int(1000 * (time() - start))
+                )
+            )
 
     def task_iter(self, repository_root) -> Iterator[Path]:
         """iterates over all tasks, which are
@@ -277,10 +312,20 @@ class InfoJsonSource(TaskDataSource):
 
 
 class ContestConfigSource(TaskDataSource):
-    def __init__(self, tasks, contests_folders: Collection[str]) -> None:
-        super().__init__(tasks, is_annotator=True)
+    def __init__(
+        self, tasks, contests_folders: Collection[str], version=None
+    ) -> None:
+        super().__init__(tasks, is_annotator=True, version=version)
         self.contests_folders = contests_folders
         self.unconfirmed_usage: dict[str, list[dict]] = {}
+        # stat_key of .unconfirmed_usage.json and the usage loaded from
+        # it, to avoid parsing it again if unchanged
+        self.usage_key = None
+        self.usage: dict = {}
+        # for each contest folder, the stat_key of the folder and of its
+        # contest-config.py and the parsed config (None if the contest
+        # has no default group), to avoid executing it again if unchanged
+        self.contest_configs: dict[Path, tuple[tuple, ContestConfig | None]] = {}
 
     def load_once(self, repository: Repository) -> None:
         self.apply(self.load_usage(Path(repository.path)))
@@ -317,8 +362,15 @@ class ContestConfigSource(TaskDataSource):
         )
 
     def load_usage(self, repository_root: Path) -> dict:
+        usage_path = repository_root / ".unconfirmed_usage.json"
+        key = stat_key(usage_path)
+        if key is not None and key == self.usage_key:
+            # the usage still has to be applied again, since
+            # InfoJsonSource might have replaced the annotated data
+            return self.usage
+        self.usage_key = None
         try:
-            with open(repository_root / ".unconfirmed_usage.json", "r") as f:
+            with open(usage_path, "r") as f:
                 data = f.read().splitlines()
         except FileNotFoundError:
             return {}
@@ -352,6 +404,8 @@ class ContestConfigSource(TaskDataSource):
                 u, c = u["uses"], u["confirmed"]
                 u["confirmed"] = c
                 res[task_code]["uses"].append(u)
+        self.usage_key = key
+        self.usage = res
         return res
 
     @staticmethod
@@ -408,23 +462,8 @@ class ContestConfigSource(TaskDataSource):
         for contest_dir in self.contest_iter(repository_root):
             try:
                 contest_code = contest_dir.parts[-1]
-                with chdir(contest_dir):
-                    contestconfig = ContestConfig(
-                        contest_dir / ".rules",
-                        contest_code,
-                        ignore_latex=True,
-                        minimal=True,
-                    )
-                    with contextlib.redirect_stdout(None):
-                        # _parseconfig doesn't perform any actions, so we suppress
-                        # log messages like "Creating ..."
-                        contestconfig._parseconfig("contest-config.py")
-                if contestconfig.defaultgroup is None:
-                    logger.info(
-                        'Contest "{}" has no default group, ignoring.'.format(
-                            contest_dir
-                        )
-                    )
+                contestconfig = self.parse_contest(contest_dir)
+                if contestconfig is None:
                     continue
                 # only update the usage after the contest ended
                 if datetime.now() < contestconfig.defaultgroup.stop:
@@ -465,6 +504,35 @@ class ContestConfigSource(TaskDataSource):
                 logger.error("\n".join(format_exception(*exc_info())))
         return untracked
 
+    def parse_contest(self, contest_dir: Path) -> ContestConfig | None:
+        """returns the parsed config of the contest, or None if it has no
+        default group; the config is executed again only if it or the
+        contents of the contest folder changed
+        """
+        key = (stat_key(contest_dir), stat_key(contest_dir / "contest-config.py"))
+        cached = self.contest_configs.get(contest_dir)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        contest_code = contest_dir.parts[-1]
+        with chdir(contest_dir):
+            contestconfig = ContestConfig(
+                contest_dir / ".rules",
+                contest_code,
+                ignore_latex=True,
+                minimal=True,
+            )
+            with contextlib.redirect_stdout(None):
+                # _parseconfig doesn't perform any actions, so we suppress
+                # log messages like "Creating ..."
+                contestconfig._parseconfig("contest-config.py")
+        if contestconfig.defaultgroup is None:
+            logger.info(
+                'Contest "{}" has no default group, ignoring.'.format(contest_dir)
+            )
+            contestconfig = None
+        self.contest_configs[contest_dir] = (key, contestconfig)
+        return contestconfig
+
     def store_usage(self, repository: Repository, untracked: list) -> None:
         repository_root = Path(repository.path)
         for v in untracked:
@@ -508,6 +576,9 @@ class ContestConfigSource(TaskDataSource):
                     continue
                 task["uses"] += [usage]
                 task["timestamp"] = time()
+                # task is a copy, we have to store it back
+                self.tasks[task_code] = task
+                self.changed()
                 if task_code not in self.unconfirmed_usage:
                     self.unconfirmed_usage[task_code] = []
                 self.unconfirmed_usage[task_code] += [
@@ -571,8 +642,8 @@ class ContestConfigSource(TaskDataSource):
 
 
 class TaskConfigSource(InfoJsonSource):
-    def __init__(self, tasks, tasks_folders: Collection[str]):
-        super().__init__(tasks, tasks_folders)
+    def __init__(self, tasks, tasks_folders: Collection[str], version=None):
+        super().__init__(tasks, tasks_folders, version=version)
         self._last_revision = None
 
     def load_once(self, repository: Repository) -> None:
@@ -665,7 +736,13 @@ class TaskConfigSource(InfoJsonSource):
 
 
 class TaskInfo:
-    tasks = Manager().dict()
+    # created in init, so that importing this module doesn't start the
+    # manager process
+    _manager = None
+    tasks = None
+    # increased whenever the tasks change, so that the web server only
+    # has to look at them again when needed
+    version = None
 
     @staticmethod
     def init(
@@ -679,10 +756,14 @@ class TaskInfo:
                 s.schedule(scheduler, repository)
             scheduler.run(blocking=True)
 
+        TaskInfo._manager = Manager()
+        TaskInfo.tasks = TaskInfo._manager.dict()
+        TaskInfo.version = TaskInfo._manager.Value("i", 0)
+
         sources: List[TaskDataSource] = [
-            InfoJsonSource(TaskInfo.tasks, tasks_folders),
-            ContestConfigSource(TaskInfo.tasks, contests_folders),
-            TaskConfigSource(TaskInfo.tasks, tasks_folders),
+            InfoJsonSource(TaskInfo.tasks, tasks_folders, TaskInfo.version),
+            ContestConfigSource(TaskInfo.tasks, contests_folders, TaskInfo.version),
+            TaskConfigSource(TaskInfo.tasks, tasks_folders, TaskInfo.version),
         ]
 
         # Load data once on start-up (otherwise tasks might get removed when
@@ -697,6 +778,10 @@ class TaskInfo:
         )
         TaskInfo.info_process.start()
 
+    @staticmethod
+    def get_version() -> int:
+        return TaskInfo.version.value
+
     @staticmethod
     def task_list() -> list:
         data = deepcopy(TaskInfo.tasks)
@@ -25,18 +25,25 @@ import functools
 import json
 import logging
 import socket
+import struct
 import traceback
 from typing import Any
 import typing
 import uuid
 from weakref import WeakSet
+import zlib
 
 import gevent
 import gevent.event
 import gevent.lock
 import gevent.socket
 
-from cms.conf import Address, ServiceCoord
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from cms.conf import Address, ServiceCoord, config
 from cms.util import get_service_address
 
 if typing.TYPE_CHECKING:
@@ -54,6 +61,37 @@ class RPCError(Exception):
 _T = typing.TypeVar("_T", bound=Callable)
 
 
+# The binary protocol. Messages are sent in frames made of a header
+# (FRAME_MARKER, the flags and the length of the payload) and the
+# payload, a dict encoded with JSON or msgpack (according to the flags)
+# and possibly compressed with zlib. As a JSON message starts with "{",
+# a reader can tell frames from the JSON lines of the old protocol.
+# Frames are sent only to peers that asked for them by calling the
+# PROTOCOL_METHOD pseudo-method, which old peers do not know.
+FRAME_MARKER = 0
+FRAME_HEADER = struct.Struct("!BBI")
+FRAME_MSGPACK = 1
+FRAME_ZLIB = 2
+PROTOCOL_METHOD = "__protocol"
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+COMPRESSION_ZLIB = "zlib"
+
+
+def _json_key(key: object) -> str:
+    """Convert a key of a dict as JSON would."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    raise ValueError("Invalid key %r." % (key,))
+
+
+def _json_object(pairs: list[tuple[object, object]]) -> dict:
+    """Build a dict decoded by msgpack with the keys JSON would give."""
+    return {_json_key(key): value for key, value in pairs}
+
+
 def rpc_method(func: _T) -> _T:
     """Decorator for a method that other services are allowed to call.
 
@@ -87,6 +125,11 @@ class RemoteServiceBase:
     # Incoming messages larger than 1 MiB are dropped to avoid DOS
     # attacks. XXX Check that this size is sensible.
     MAX_MESSAGE_SIZE = 1024 * 1024
+    # The limit for the payload of binary frames, before and after
+    # decompression, is configured by rpc_max_frame_size_mib (see
+    # _max_frame_size).
+    # Payloads of binary frames at least this large are compressed.
+    COMPRESSION_THRESHOLD = 64 * 1024
 
     def __init__(self, remote_address: Address):
         """Prepare to handle a connection with the given remote address.
@@ -109,6 +152,23 @@ class RemoteServiceBase:
         self._read_lock = gevent.lock.RLock()
         self._write_lock = gevent.lock.RLock()
 
+        # The format of the messages we send: None for JSON lines,
+        # otherwise the format of the payload of binary frames; and
+        # whether we compress them. Both are agreed with the peer.
+        self._frame_format: str | None = None
+        self._compress = False
+        # Whether we accept binary frames from the peer, which can
+        # only send them once we asked for (or agreed to) them.
+        self._accept_frames = False
+
+    @staticmethod
+    def _max_frame_size() -> int:
+        """Return the maximum size of the payload of binary frames, in
+        bytes.
+
+        """
+        return config.global_.rpc_max_frame_size_mib * 1024 * 1024
+
     @property
     def connected(self) -> bool:
         """Return whether we're connected to the other endpoint.
@@ -203,6 +263,9 @@ class RemoteServiceBase:
         self._reader = None
         self._writer = None
         self._local_address = None
+        self._frame_format = None
+        self._compress = False
+        self._accept_frames = False
         self._connection_event.clear()
 
         logger.info("Terminated connection with %s (local address: %s): %s",
@@ -233,10 +296,11 @@ class RemoteServiceBase:
     def _read(self) -> bytes:
         """Receive a message from the socket.
 
-        Read from the socket until a "\\r\\n" is found. That is what we
-        consider a "message" in the communication protocol.
+        Read from the socket a binary frame or, with the old protocol,
+        until a "\\r\\n" is found. That is what we consider a
+        "message" in the communication protocol.
 
-        return: the retrieved message.
+        return: the retrieved message (with the header for a frame).
 
         raise (OSError): if reading fails.
 
@@ -248,11 +312,23 @@ class RemoteServiceBase:
             with self._read_lock:
                 if not self.connected:
                     raise OSError("Not connected.")
-                data = self._reader.readline(self.MAX_MESSAGE_SIZE)
+                first = self._reader.peek(1)[:1]
+                if first == bytes([FRAME_MARKER]):
+                    if not self._accept_frames:
+                        # Don't let anyone make us buffer large frames
+                        # without having negotiated them.
+                        logger.error("The client sent an unexpected binary "
+                                     "message.")
+                        self.finalize("Client misbehaving.")
+                        raise OSError("Unexpected binary message.")
+                    data = self._read_frame()
+                else:
+                    data = self._reader.readline(self.MAX_MESSAGE_SIZE)
                 # If there weren't a "\r\n" between the last message
                 # and the EOF we would have a false positive here.
                 # Luckily there is one.
-                if len(data) > 0 and not data.endswith(b"\r\n"):
+                if len(data) > 0 and first != bytes([FRAME_MARKER]) \
+                        and not data.endswith(b"\r\n"):
                     logger.error(
                         "The client sent a message larger than %d bytes (that "
                         "is MAX_MESSAGE_SIZE). Consider raising that value if "
@@ -271,12 +347,142 @@ class RemoteServiceBase:
 
         return data
 
+    def _read_frame(self) -> bytes:
+        """Read a binary frame from the socket.
+
+        return: the frame, with its header.
+
+        raise (OSError): if reading fails or the frame is too large.
+
+        """
+        header = self._reader.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return b""
+        _marker, _flags, length = FRAME_HEADER.unpack(header)
+        if length > self._max_frame_size():
+            logger.error(
+                "The client sent a message larger than %d bytes (that is "
+                "rpc_max_frame_size_mib). Consider raising that value if "
+                "the message seemed legit.", self._max_frame_size())
+            self.finalize("Client misbehaving.")
+            raise OSError("Message too long.")
+        payload = self._reader.read(length)
+        if len(payload) < length:
+            return b""
+        return header + payload
+
+    def _encode(self, message: dict) -> bytes:
+        """Encode a message in the format agreed with the peer.
+
+        message: the message.
+
+        return: the encoded message, to be passed to _write.
+
+        raise (TypeError, ValueError): if the message cannot be
+            encoded.
+
+        """
+        if self._frame_format is None:
+            return json.dumps(message).encode('utf-8')
+        flags = 0
+        payload = None
+        if self._frame_format == FORMAT_MSGPACK:
+            try:
+                payload = msgpack.packb(message, use_bin_type=True)
+                flags |= FRAME_MSGPACK
+            except (TypeError, ValueError, OverflowError):
+                # Let JSON encode what msgpack cannot (e.g. huge
+                # integers), or fail in the same way.
+                pass
+        if payload is None:
+            payload = json.dumps(message).encode('utf-8')
+        # Messages too large for the peer are sent as they are, for
+        # _write to refuse them.
+        if self._compress and self.COMPRESSION_THRESHOLD <= len(payload) \
+                <= self._max_frame_size():
+            compressed = zlib.compress(payload, 1)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FRAME_ZLIB
+        return FRAME_HEADER.pack(FRAME_MARKER, flags, len(payload)) + payload
+
+    def _decode(self, data: bytes) -> dict:
+        """Decode a message read by _read.
+
+        data: a JSON line or a binary frame.
+
+        return: the message.
+
+        raise (ValueError): if the message cannot be decoded.
+
+        """
+        if data[:1] != bytes([FRAME_MARKER]):
+            return json.loads(data.decode('utf-8'))
+        _marker, flags, _length = FRAME_HEADER.unpack_from(data)
+        payload = data[FRAME_HEADER.size:]
+        if flags & FRAME_ZLIB:
+            try:
+                decompressor = zlib.decompressobj()
+                payload = decompressor.decompress(payload,
+                                                  self._max_frame_size())
+            except zlib.error as error:
+                raise ValueError("Invalid compressed message.") from error
+            if decompressor.unconsumed_tail:
+                raise ValueError("Message too long.")
+        if flags & FRAME_MSGPACK:
+            if msgpack is None:
+                raise ValueError("Cannot decode msgpack messages.")
+            try:
+                message = msgpack.unpackb(
+                    payload, object_pairs_hook=_json_object,
+                    strict_map_key=False, raw=False)
+            except (msgpack.UnpackException, TypeError) as error:
+                raise ValueError("Invalid message.") from error
+        else:
+            message = json.loads(payload.decode('utf-8'))
+        if not isinstance(message, dict):
+            raise ValueError("Invalid message.")
+        return message
+
+    @staticmethod
+    def _supported_protocol() -> dict:
+        """Return the frame formats and compressions we can handle,
+        in order of preference.
+
+        """
+        if not config.global_.rpc_binary_protocol:
+            return {"formats": [], "compressions": []}
+        formats = [FORMAT_JSON]
+        if msgpack is not None:
+            formats.insert(0, FORMAT_MSGPACK)
+        compressions = []
+        if config.global_.rpc_compression:
+            compressions.append(COMPRESSION_ZLIB)
+        return {"formats": formats, "compressions": compressions}
+
+    def _set_protocol(self, protocol: dict | None):
+        """Start sending messages in the given format.
+
+        protocol: the format of the frames and the compression (or
+            None) to use, or None for the JSON lines.
+
+        """
+        if protocol is None or protocol.get("format") is None:
+            self._frame_format = None
+            self._compress = False
+        else:
+            self._frame_format = protocol["format"]
+            self._compress = protocol.get("compression") == COMPRESSION_ZLIB
+        logger.debug("Sending messages to %s as %s.", self._repr_remote(),
+                     self._frame_format or "JSON lines")
+
     def _write(self, data: bytes):
         """Send a message to the socket.
 
-        Automatically append "\\r\\n" to make it a correct message.
+        Automatically append "\\r\\n" to make it a correct message,
+        unless it is a binary frame.
 
-        data: the message to transmit.
+        data: the message to transmit, as returned by _encode.
 
         raise (OSError): if writing fails.
 
@@ -284,12 +490,17 @@ class RemoteServiceBase:
         if not self.connected:
             raise OSError("Not connected.")
 
-        if len(data + b'\r\n') > self.MAX_MESSAGE_SIZE:
+        if data[:1] == bytes([FRAME_MARKER]):
+            max_size = self._max_frame_size() + FRAME_HEADER.size
+        else:
+            data += b'\r\n'
+            max_size = self.MAX_MESSAGE_SIZE
+        if len(data) > max_size:
             logger.error(
                 "A message wasn't sent to %r because it was larger than %d "
-                "bytes (that is MAX_MESSAGE_SIZE). Consider raising that "
-                "value if the message seemed legit.", self._repr_remote(),
-                self.MAX_MESSAGE_SIZE)
+                "bytes (that is MAX_MESSAGE_SIZE or rpc_max_frame_size_mib). "
+                "Consider raising that value if the message seemed legit.",
+                self._repr_remote(), max_size)
             # No need to call finalize.
             raise OSError("Message too long.")
 
@@ -298,7 +509,7 @@ class RemoteServiceBase:
                 if not self.connected:
                     raise OSError("Not connected.")
                 # Does the same as self._socket.sendall.
-                self._writer.write(data + b'\r\n')
+                self._writer.write(data)
                 self._writer.flush()
         except OSError as error:
             self.finalize("Write failed.")
@@ -367,7 +578,7 @@ class RemoteServiceServer(RemoteServiceBase):
     def process_data(self, data: bytes):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_request
+        Decode it and forward it to process_incoming_request
         (unconditionally!).
 
         data: the message read from the socket.
@@ -375,7 +586,7 @@ class RemoteServiceServer(RemoteServiceBase):
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data.decode('utf-8'))
+            message = self._decode(data)
         except ValueError:
             self.disconnect("Bad request received")
             logger.warning("Cannot parse incoming message, discarding.")
@@ -389,7 +600,7 @@ class RemoteServiceServer(RemoteServiceBase):
         Parse the request, execute the method it asks for, format the
         result and send the response.
 
-        request: the JSON-decoded request.
+        request: the decoded request.
 
         """
         # Validate the request.
@@ -410,8 +621,19 @@ class RemoteServiceServer(RemoteServiceBase):
                     "__error": None}
 
         method_name = request["__method"]
+        protocol = None
 
-        if not hasattr(self.local_service, method_name):
+        if method_name == PROTOCOL_METHOD:
+            try:
+                protocol = self._choose_protocol(**request["__data"])
+                response["__data"] = protocol
+                # The client sends frames only after our answer.
+                if protocol["format"] is not None:
+                    self._accept_frames = True
+            except Exception as error:
+                response["__error"] = "%s: %s" % \
+                    (error.__class__.__name__, error)
+        elif not hasattr(self.local_service, method_name):
             response["__error"] = "Method %s doesn't exist." % method_name
         else:
             method = getattr(self.local_service, method_name)
@@ -428,7 +650,7 @@ class RemoteServiceServer(RemoteServiceBase):
 
         # Encode it.
         try:
-            data = json.dumps(response).encode('utf-8')
+            data = self._encode(response)
         except (TypeError, ValueError):
             logger.warning("JSON encoding failed.", exc_info=True)
             return
@@ -440,6 +662,34 @@ class RemoteServiceServer(RemoteServiceBase):
             # Log messages have already been produced.
             return
 
+        # The answer to the negotiation was sent with the old format,
+        # the next messages use the new one.
+        if protocol is not None:
+            self._set_protocol(protocol)
+
+    def _choose_protocol(
+        self, formats: list[str], compressions: list[str]
+    ) -> dict:
+        """Choose the format of the messages sent to the client.
+
+        formats: the formats of binary frames supported by the client,
+            in order of preference.
+        compressions: the compressions supported by the client.
+
+        return: the chosen format (None for JSON lines) and
+            compression (None for no compression).
+
+        """
+        supported = self._supported_protocol()
+        frame_format = next((format_ for format_ in formats
+                             if format_ in supported["formats"]), None)
+        compression = None
+        if frame_format is not None \
+                and COMPRESSION_ZLIB in compressions \
+                and COMPRESSION_ZLIB in supported["compressions"]:
+            compression = COMPRESSION_ZLIB
+        return {"format": frame_format, "compression": compression}
+
 
 class RemoteServiceClient(RemoteServiceBase):
     """The client side of a RPC communication.
@@ -485,6 +735,35 @@ class RemoteServiceClient(RemoteServiceBase):
         """See RemoteServiceBase._repr_remote."""
         return f"{self.remote_address} ({self.remote_service_coord})"
 
+    def initialize(self, sock, plus):
+        """See RemoteServiceBase.initialize.
+
+        Also ask the server to send binary frames, if we support them.
+        Meanwhile, and if the server does not support them, the
+        messages are sent as JSON lines.
+
+        """
+        super().initialize(sock, plus)
+        supported = self._supported_protocol()
+        if len(supported["formats"]) > 0:
+            # The server can answer with frames as soon as it receives
+            # the request.
+            self._accept_frames = True
+            result = self.execute_rpc(PROTOCOL_METHOD, supported)
+            result.rawlink(self._on_protocol_chosen)
+
+    def _on_protocol_chosen(self, result: gevent.event.AsyncResult):
+        """Start using the protocol chosen by the server.
+
+        result: the result of the negotiation.
+
+        """
+        if result.successful():
+            self._set_protocol(result.value)
+        else:
+            logger.info("%s does not support binary messages.",
+                        self._repr_remote())
+
     def finalize(self, reason=""):
         """See RemoteServiceBase.finalize."""
         super().finalize(reason)
@@ -575,7 +854,7 @@ class RemoteServiceClient(RemoteServiceBase):
     def process_data(self, data: bytes):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_response
+        Decode it and forward it to process_incoming_response
         (unconditionally!).
 
         data: the message read from the socket.
@@ -583,7 +862,7 @@ class RemoteServiceClient(RemoteServiceBase):
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data.decode('utf-8'))
+            message = self._decode(data)
         except ValueError:
             self.disconnect("Bad response received")
             logger.warning("Cannot parse incoming message, discarding.")
@@ -597,7 +876,7 @@ class RemoteServiceClient(RemoteServiceBase):
         Parse the response, determine the request it's for and its
         associated result and fill it.
 
-        response: the JSON-decoded response.
+        response: the decoded response.
 
         """
         # Validate the response.
@@ -620,7 +899,9 @@ class RemoteServiceClient(RemoteServiceBase):
         if error is not None:
             err_msg = "%s signaled RPC for method %s was unsuccessful: %s." % (
                 self.remote_service_coord, request["__method"], error)
-            logger.error(err_msg)
+            # Old servers do not know the negotiation, and it's fine.
+            if request["__method"] != PROTOCOL_METHOD:
+                logger.error(err_msg)
             result.set_exception(RPCError(error))
         else:
             result.set(response["__data"])
@@ -648,7 +929,7 @@ class RemoteServiceClient(RemoteServiceBase):
 
         # Encode it.
         try:
-            data_encoded = json.dumps(request).encode("utf-8")
+            data_encoded = self._encode(request)
         except (TypeError, ValueError):
             logger.error("JSON encoding failed.", exc_info=True)
             result.set_exception(RPCError("JSON encoding failed."))
@@ -121,10 +121,17 @@ class WebService(Service):
         rpc_auth = parameters.pop('rpc_auth', None)
         auth_middleware = parameters.pop('auth_middleware', None)
         num_proxies_used = parameters.pop('num_proxies_used', None)
+        middlewares = parameters.pop('middlewares', [])
 
         self.wsgi_app = tornado.wsgi.WSGIApplication(handlers, **parameters)
         self.wsgi_app.service = self
 
+        # Middlewares given by the subclass, that see the requests as
+        # the handlers do (e.g., with the address of the client if we
+        # are behind a proxy).
+        for middleware in middlewares:
+            self.wsgi_app = middleware(self.wsgi_app)
+
         for entry in static_files:
             # TODO If we will introduce a flag to trigger autoreload in
             # Jinja2 templates, use it to disable the cache arg here.
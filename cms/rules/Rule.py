@@ -22,6 +22,7 @@ import hashlib
 import io
 import json
 import os
+import sqlite3
 import stat
 import subprocess
 import time
@@ -75,6 +76,120 @@ def deletefile(filename):
         os.remove(filename)
 
 
+class HashCache(object):
+    """An index of the hashes of files, stored in a SQLite database inside
+    a rules directory.
+
+    A hash is valid as long as the size, mtime, ctime and inode of the file
+    are the ones recorded with it. Hashes are only recorded for files whose
+    ctime is well in the past, so that a file modified just after being
+    hashed has a different ctime (even with coarse timestamps).
+
+    """
+    FILENAME = "hashcache.sqlite"
+    # Maximum number of paths looked up with a single query.
+    LOOKUP_BATCH_SIZE = 500
+    # Version of the database, stored as its user_version.
+    VERSION = 1
+
+    _instances = {}
+
+    @classmethod
+    def get(cls, rulesdir):
+        """Return the hash cache of the given rules directory.
+
+        Connections are not shared with forked processes.
+
+        """
+        key = (os.getpid(), os.path.abspath(rulesdir))
+        if key not in cls._instances:
+            cls._instances[key] = cls(rulesdir)
+        return cls._instances[key]
+
+    def __init__(self, rulesdir):
+        self.rulesdir = rulesdir
+        self._db = sqlite3.connect(os.path.join(rulesdir, self.FILENAME),
+                                   timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files ("
+                         "path TEXT PRIMARY KEY, "
+                         "size INTEGER NOT NULL, "
+                         "mtime_ns INTEGER NOT NULL, "
+                         "ctime_ns INTEGER NOT NULL, "
+                         "inode INTEGER NOT NULL, "
+                         "hash TEXT NOT NULL)")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] \
+                < self.VERSION:
+            self._migrate()
+            self._db.execute("PRAGMA user_version = %d" % self.VERSION)
+
+    def _migrate(self):
+        """Import (and delete) the hashes that older versions stored in one
+        file each, named after the hash of {'type': 'filehash', 'file': path}.
+        """
+        for name in os.listdir(self.rulesdir):
+            if len(name) != 64:
+                continue
+            hashfile = os.path.join(self.rulesdir, name)
+            try:
+                with io.open(hashfile, 'r', encoding='utf-8') as f:
+                    stahash = os.fstat(f.fileno())
+                    res = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(res, dict) or res.get('type') != 'filehash':
+                continue
+            try:
+                sta = os.lstat(res['file'])
+            except OSError:
+                sta = None
+            # Same validity check as the old cache.
+            if sta is not None and stat.S_ISREG(sta.st_mode) and \
+                    res['ctime'] == sta.st_ctime_ns and \
+                    sta.st_ctime_ns + 3000000000 < stahash.st_ctime_ns:
+                self.put(res['file'], sta, res['hash'])
+            os.remove(hashfile)
+
+    def lookup(self, paths):
+        """Return the known hashes of the given (absolute) paths.
+
+        Return a dictionary mapping each path for which a hash is recorded to
+        a tuple (size, mtime_ns, ctime_ns, inode, hash).
+
+        """
+        paths = list(set(paths))
+        result = {}
+        for i in range(0, len(paths), self.LOOKUP_BATCH_SIZE):
+            batch = paths[i:i + self.LOOKUP_BATCH_SIZE]
+            rows = self._db.execute(
+                "SELECT path, size, mtime_ns, ctime_ns, inode, hash "
+                "FROM files WHERE path IN (%s)" % ", ".join("?" * len(batch)),
+                batch)
+            for row in rows:
+                result[row[0]] = tuple(row[1:])
+        return result
+
+    def put(self, path, sta, hash_):
+        """Record the hash of the given (absolute) path, whose stat result
+        is sta.
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO files "
+            "(path, size, mtime_ns, ctime_ns, inode, hash) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, sta.st_size, sta.st_mtime_ns, sta.st_ctime_ns,
+             sta.st_ino, hash_))
+
+    @staticmethod
+    def matches(entry, sta):
+        """Whether the entry returned by lookup() is valid for a file whose
+        stat result is sta.
+        """
+        return entry[:4] == (sta.st_size, sta.st_mtime_ns, sta.st_ctime_ns,
+                             sta.st_ino)
+
+
 class Rule(object):
     """Base class for make-like rules.
     """
@@ -207,8 +322,12 @@ class RuleResult(object):
         self.log = dict(log)
         self.badfail = False
 
-    def hash_of_file(self, filename):
+    def hash_of_file(self, filename, known=None):
         """Return the hash of the given file.
+
+        known (dict): the result of HashCache.lookup() for a set of paths
+                      including this one, to avoid querying the cache again
+
         """
         filename = os.path.abspath(filename)
 
@@ -232,35 +351,21 @@ class RuleResult(object):
         # TODO Check that the following works reliably on all systems.
         # For example, getctime sometimes only has a precision of 1 second.
 
-        hasher = hashlib.sha256()
-        hasher.update(json.dumps({'type': 'filehash',
-                                  'file': filename},
-                                 sort_keys=True).encode('utf-8'))
-        hashfile = os.path.join(self.rulesdir, hasher.hexdigest())
-        if os.path.exists(hashfile):
-            with io.open(hashfile, "r") as f:
-                stahash = os.fstat(f.fileno())
-                res = json.load(f)
-                # Check that the ctime is the same as when we last computed
-                # the hash.
-                # Also check that the ctime is more than 3 seconds before
-                # the hashfile's ctime.
-                if res['type'] == 'filehash' and \
-                        res['file'] == filename and \
-                        res['ctime'] == sta.st_ctime_ns and \
-                        sta.st_ctime_ns + 3000000000 < stahash.st_ctime_ns:
-                    return res['hash']
+        cache = HashCache.get(self.rulesdir)
+        if known is None:
+            known = cache.lookup([filename])
+        if filename in known and HashCache.matches(known[filename], sta):
+            return known[filename][4]
 
         ## Only remember this hash if the file's ctime is at least 10 seconds ago.
         ## Thus, if the file changes after hashing, its ctime has to change, too.
         ## (Even if ctime has only low resolution!)
         ## See also https://mirrors.edge.kernel.org/pub/software/scm/git/docs/technical/racy-git.html.
-        time_before_hash = time.time()
+        time_before_hash = time.time_ns()
         #print("Reading {} to compute hash".format(filename))
         hash_ = compute_file_hash(filename)
-        if os.path.getctime(filename)+10 < time_before_hash:
-            with io.open(hashfile, 'w', encoding='utf-8') as f:
-                json.dump({'type': 'filehash', 'file': filename, 'ctime': sta.st_ctime_ns, 'hash': hash_}, f)
+        if sta.st_ctime_ns + 10000000000 < time_before_hash:
+            cache.put(filename, sta, hash_)
 
         return hash_
 
@@ -277,9 +382,15 @@ class RuleResult(object):
     def uptodate(self):
         """Whether the saved hash values all agree with the current files.
         """
+        known = None
+        if not config.germake.always_recompute_hash:
+            # Look up all the files at once.
+            known = HashCache.get(self.rulesdir).lookup(
+                os.path.abspath(filename)
+                for di in (self.dependencies, self.outputs) for filename in di)
         for di in (self.dependencies, self.outputs):
             for filename, oldhash in di.items():
-                newhash = self.hash_of_file(filename)
+                newhash = self.hash_of_file(filename, known)
                 if oldhash != newhash:
                     #print("Out of date: {}, old hash {}, new hash {}".format(filename, oldhash, newhash))
                     return False
@@ -249,6 +249,8 @@ class BaseHandler(CommonRequestHandler):
             self.service.add_notification(
                 make_datetime(),
                 "Operation successful.", "")
+            # CWS caches the contests, their groups and their tasks.
+            self.service.contests_changed()
             return True
 
     def get_current_user(self) -> Admin | None:
@@ -133,6 +133,8 @@ class QuestionReplyHandler(QuestionActionHandler):
                         question.participation.user.username,
                         question.participation.contest.name,
                         question.id)
+            self.service.communications_changed(
+                question.participation.contest_id, question.participation_id)
 
 class QuestionIgnoreHandler(QuestionActionHandler):
     """Called when the manager chooses to ignore or stop ignoring a
@@ -33,7 +33,8 @@ import io
 from sqlalchemy.orm import joinedload
 
 from cms.db import Contest
-from cms.grading.scoring import task_score
+from cms.grading.scoring import contest_scores_fingerprint, \
+    contest_task_scores
 from .base import BaseHandler, require_permission
 
 
@@ -41,22 +42,36 @@ class RankingHandler(BaseHandler):
     """Shows the ranking for a contest.
 
     """
+    def get_task_scores(
+        self, contest: Contest
+    ) -> dict[int, dict[int, tuple[float, bool]]]:
+        """Return the scores of the contest, from the cache if valid.
+
+        """
+        fingerprint = contest_scores_fingerprint(self.sql_session, contest)
+        cached = self.service.ranking_scores.get(contest.id)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        scores = contest_task_scores(self.sql_session, contest)
+        self.service.ranking_scores[contest.id] = (fingerprint, scores)
+        return scores
+
     @require_permission(BaseHandler.AUTHENTICATED)
     def get(self, contest_id, format="online"):
         # This validates the contest id.
         self.safe_get_item(Contest, contest_id)
 
-        # This massive joined load gets all the information which we will need
-        # to generating the rankings.
+        # The scores are computed separately, so the participations
+        # need only the data to show who they are.
         self.contest: Contest = (
             self.sql_session.query(Contest)
             .filter(Contest.id == contest_id)
             .options(joinedload("participations"))
-            .options(joinedload("participations.submissions"))
-            .options(joinedload("participations.submissions.token"))
-            .options(joinedload("participations.submissions.results"))
+            .options(joinedload("participations.user"))
+            .options(joinedload("participations.team"))
             .first()
         )
+        task_scores = self.get_task_scores(self.contest)
 
         # Preprocess participations: get data about teams, scores
         show_teams = False
@@ -66,8 +81,9 @@ class RankingHandler(BaseHandler):
             p.scores = []
             total_score = 0.0
             partial = False
+            p_scores = task_scores.get(p.id, {})
             for task in self.contest.tasks:
-                t_score, t_partial = task_score(p, task)
+                t_score, t_partial = p_scores.get(task.id, (0.0, False))
                 p.scores.append((t_score, t_partial))
                 total_score += t_score
                 partial = partial or t_partial
@@ -305,5 +305,7 @@ class MessageHandler(BaseHandler):
         if self.try_commit():
             logger.info("Message submitted to user %s in contest %s.",
                         user.username, self.contest.name)
+            self.service.communications_changed(self.contest.id,
+                                                participation.id)
 
         self.redirect(self.url("contest", contest_id, "user", user_id, "edit"))
@@ -298,6 +298,7 @@ class ActivateDatasetHandler(BaseHandler):
 
         r = re.compile('notify_([0-9]+)$')
         count = 0
+        participations = []
         for k in self.request.arguments:
             m = r.match(k)
             if not m:
@@ -308,12 +309,17 @@ class ActivateDatasetHandler(BaseHandler):
                               self.get_argument("message_text", ""),
                               participation=participation)
             self.sql_session.add(message)
+            participations.append((participation.contest_id,
+                                   participation.id))
             count += 1
 
         if self.try_commit():
             self.service.add_notification(
                 make_datetime(),
                 "Messages sent to %d users." % count, "")
+            for contest_id, participation_id in participations:
+                self.service.communications_changed(contest_id,
+                                                    participation_id)
 
         self.redirect(self.url("task", task.id))
 
@@ -75,6 +75,13 @@ class AdminWebServer(WebService):
         # A list of pending notifications.
         self.notifications: list[tuple[datetime, str, str]] = []
 
+        # For each contest ID, the fingerprint of the data the scores of
+        # its ranking were computed from, and the scores, as returned
+        # by contest_task_scores.
+        self.ranking_scores: \
+            dict[int, tuple[tuple,
+                            dict[int, dict[int, tuple[float, bool]]]]] = {}
+
         self.admin_web_server = self.connect_to(
             ServiceCoord("AdminWebServer", 0))
         self.evaluation_service = self.connect_to(
@@ -92,6 +99,10 @@ class AdminWebServer(WebService):
             self.resource_services.append(self.connect_to(
                 ServiceCoord("ResourceService", i)))
         self.logservice = self.connect_to(ServiceCoord("LogService", 0))
+        self.contest_web_servers = []
+        for i in range(get_service_shards("ContestWebServer")):
+            self.contest_web_servers.append(self.connect_to(
+                ServiceCoord("ContestWebServer", i)))
 
     def is_rpc_authorized(self, service: str, shard: int, method: str):
         return rpc_authorization_checker(self.auth_handler.admin_id,
@@ -108,6 +119,42 @@ class AdminWebServer(WebService):
         """
         self.notifications.append((timestamp, subject, text))
 
+    def contests_changed(self):
+        """Tell the ContestWebServers that the data of the contests
+        may have changed.
+
+        """
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.contests_changed()
+
+    def communications_changed(
+        self, contest_id: int, participation_id: int | None = None
+    ):
+        """Tell the ContestWebServers that there are new
+        communications for some contestants.
+
+        contest_id: the contest of the communications.
+        participation_id: the participation they are addressed to,
+            or None for all the participations of the contest.
+
+        """
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.communications_changed(
+                contest_id=contest_id, participation_id=participation_id)
+
+    @rpc_method
+    def scores_changed(self, contest_id: int):
+        """Discard the cached ranking of a contest.
+
+        Called by ScoringService after scoring submissions of the
+        contest, as the fingerprint of the ranking doesn't notice all
+        the changes of their scores.
+
+        contest_id: the contest.
+
+        """
+        self.ranking_scores.pop(contest_id, None)
+
     @staticmethod
     @rpc_method
     def submissions_status(contest_id: int | None) -> dict:
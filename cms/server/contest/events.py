@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2026 agent <agent@local>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stream of the events of each participation, for CWS.
+
+Contestants' pages receive on it a short event when something they
+show may have changed (the status of a submission, new
+communications), and only then ask the usual handlers for the new
+data, instead of polling them.
+
+"""
+
+import collections
+try:
+    collections.MutableMapping
+except:
+    # Monkey-patch: Tornado 4.5.3 does not work on Python 3.11 by default
+    collections.MutableMapping = collections.abc.MutableMapping
+
+import ipaddress
+import logging
+import re
+
+import tornado.web
+from werkzeug.exceptions import Forbidden, NotFound
+from werkzeug.wrappers import Request
+
+from cms.db import Contest, SessionGen
+from cms.server.contest.authentication import authenticate_request
+from cmscommon.datetime import make_datetime
+from cmscommon.eventsource import EventSource, Publisher, Subscriber
+
+
+logger = logging.getLogger(__name__)
+
+
+class ParticipationEventSource(EventSource):
+    """WSGI middleware serving the event stream of each participation.
+
+    Requests to the "events" path of a contest are served as a stream
+    of Server-Sent Events for the participation they authenticate as
+    (in the same way as the other requests of CWS); all other requests
+    are passed to the wrapped application.
+
+    The events are:
+    - "submission", when the status of a submission of the
+      participation changed; the data is a JSON object with the name
+      of the task ("task") and the opaque ID of the submission
+      ("submission");
+    - "notification", when there may be new communications or
+      notifications for the participation; there is no data.
+
+    """
+    # Each participation receives few events, there's no need to
+    # remember many of them for the clients that reconnect.
+    _CACHE_SIZE = 20
+
+    def __init__(self, app, cookie_secret: bytes,
+                 contest_id: int | None = None):
+        """Create the middleware.
+
+        app: the WSGI application to wrap.
+        cookie_secret: the secret used to sign the login cookies.
+        contest_id: the ID of the contest served by CWS, or None if
+            it serves all of them, each under its name.
+
+        """
+        super().__init__()
+        self.app = app
+        self.cookie_secret = cookie_secret
+        self.contest_id = contest_id
+        if contest_id is None:
+            self._path_re = re.compile(r"^/([^/]+)/events$")
+        else:
+            self._path_re = re.compile(r"^/events$")
+        # For each participation that connected at least once, its
+        # contest ID and its publisher.
+        self._publishers: dict[int, tuple[int, Publisher]] = {}
+
+    def __call__(self, environ, start_response):
+        """Serve the event streams, pass the rest to the application.
+
+        """
+        if self._path_re.match(environ.get("PATH_INFO", "")) is None:
+            return self.app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def send_to_participation(
+        self, participation_id: int, event: str, data: str | None = None
+    ):
+        """Send an event to the streams of a participation.
+
+        participation_id: the ID of the participation.
+        event: the type of the event.
+        data: the data of the event.
+
+        """
+        entry = self._publishers.get(participation_id)
+        # If it never connected, no one is waiting for its events.
+        if entry is not None:
+            entry[1].put(event, data)
+
+    def send_to_contest(
+        self, contest_id: int, event: str, data: str | None = None
+    ):
+        """Send an event to the streams of all the participations of
+        a contest.
+
+        contest_id: the ID of the contest.
+        event: the type of the event.
+        data: the data of the event.
+
+        """
+        for entry_contest_id, publisher in self._publishers.values():
+            if entry_contest_id == contest_id:
+                publisher.put(event, data)
+
+    def get_subscriber(
+        self, request: Request, last_event_id: str | None
+    ) -> Subscriber:
+        """Authenticate the request and subscribe to its events.
+
+        See EventSource.get_subscriber.
+
+        raise (NotFound): if the contest doesn't exist.
+        raise (Forbidden): if the request isn't authenticated.
+
+        """
+        with SessionGen() as session:
+            if self.contest_id is None:
+                contest_name = self._path_re.match(request.path).group(1)
+                contest = session.query(Contest)\
+                    .filter(Contest.name == contest_name).first()
+            else:
+                contest = Contest.get_from_id(self.contest_id, session)
+            if contest is None:
+                raise NotFound()
+
+            # As in ContestHandler.get_current_user, without refreshing
+            # the cookie.
+            cookie_name = contest.name + "_login"
+            cookie = tornado.web.decode_signed_value(
+                self.cookie_secret, cookie_name,
+                request.cookies.get(cookie_name))
+            authorization_header = request.headers.get("X-CMS-Authorization")
+            if authorization_header is not None:
+                authorization_header = tornado.web.decode_signed_value(
+                    self.cookie_secret, cookie_name, authorization_header)
+            try:
+                ip_address = ipaddress.ip_address(request.remote_addr)
+            except ValueError:
+                logger.warning("Invalid IP address provided by the "
+                               "server: %s", request.remote_addr)
+                raise Forbidden()
+
+            participation, _, _ = authenticate_request(
+                session, contest, make_datetime(), cookie,
+                authorization_header, ip_address)
+            if participation is None:
+                raise Forbidden()
+            participation_id = participation.id
+            contest_id = contest.id
+
+        entry = self._publishers.get(participation_id)
+        if entry is None:
+            entry = (contest_id, Publisher(self._CACHE_SIZE))
+            self._publishers[participation_id] = entry
+        return entry[1].get_subscriber(last_event_id)
+
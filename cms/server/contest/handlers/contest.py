@@ -51,7 +51,6 @@ import tornado.web
 
 from cms import config, TOKEN_MODE_MIXED
 from cms.db import Contest, Submission, Task, UserTest
-from cms.locale import filter_language_codes
 from cms.server import FileHandlerMixin
 from cms.server.contest.authentication import authenticate_request
 from cmscommon.datetime import get_timezone
@@ -84,14 +83,6 @@ class ContestHandler(BaseHandler):
     def prepare(self):
         self.choose_contest()
 
-        if self.contest.allowed_localizations:
-            lang_codes = filter_language_codes(
-                list(self.available_translations.keys()),
-                self.contest.allowed_localizations)
-            self.available_translations = dict(
-                (k, v) for k, v in self.available_translations.items()
-                if k in lang_codes)
-
         super().prepare()
 
         if self.is_multi_contest():
@@ -111,6 +102,8 @@ class ContestHandler(BaseHandler):
 
         If a contest was specified as argument to CWS, fill
         self.contest with that; otherwise extract it from the URL path.
+        Also restrict self.available_translations to those allowed in
+        the contest.
 
         """
         if self.is_multi_contest():
@@ -119,9 +112,8 @@ class ContestHandler(BaseHandler):
             contest_name = self.path_args[0]
 
             # Select the correct contest or return an error
-            self.contest = self.sql_session.query(Contest)\
-                .filter(Contest.name == contest_name).first()
-            if self.contest is None:
+            contest = self.service.get_contest(self.sql_session, contest_name)
+            if contest is None:
                 self.contest = Contest(
                     name=contest_name, description=contest_name)
                 # render_params in this class assumes the contest is loaded,
@@ -132,8 +124,8 @@ class ContestHandler(BaseHandler):
                 raise tornado.web.HTTPError(404)
         else:
             # Select the contest specified on the command line
-            self.contest = Contest.get_from_id(
-                self.service.contest_id, self.sql_session)
+            contest = self.service.get_contest(self.sql_session)
+        self.contest, self.available_translations = contest
 
     def get_current_user(self) -> Participation | None:
         """Return the currently logged in participation.
@@ -262,10 +254,11 @@ class ContestHandler(BaseHandler):
         return: the corresponding task object, if found.
 
         """
-        return self.sql_session.query(Task) \
-            .filter(Task.contest == self.contest) \
-            .filter(Task.name == task_name) \
-            .one_or_none()
+        # The tasks of the contest are already loaded.
+        for task in self.contest.tasks:
+            if task.name == task_name:
+                return task
+        return None
 
     def get_submission(self, task: Task, opaque_id: str | int) -> Submission | None:
         """Return the num-th contestant's submission on the given task.
@@ -311,7 +304,8 @@ class ContestHandler(BaseHandler):
         if text_params is not None:
             text %= text_params
         self.service.add_notification(self.current_user.user.username,
-                                      self.timestamp, subject, text, level)
+                                      self.timestamp, subject, text, level,
+                                      participation_id=self.current_user.id)
 
     def notify_success(
         self, subject: str, text: str, text_params: object | None = None
@@ -51,7 +51,6 @@ from sqlalchemy.orm import joinedload
 from cms import config, FEEDBACK_LEVEL_FULL
 from cms.db import Submission, SubmissionResult
 from cms.grading.languagemanager import get_language
-from cms.grading.scoring import task_score
 from cms.server import multi_contest
 from cms.server.contest.submission import get_submission_count, \
     UnacceptableSubmission, accept_submission
@@ -108,6 +107,7 @@ class SubmitHandler(ContestHandler):
         else:
             self.service.evaluation_service.new_submission(
                 submission_id=submission.id)
+            self.service.notify_submission_changed(submission)
             self.notify_success(N_("Submission received"),
                                 N_("Your submission has been received "
                                    "and is currently being evaluated."))
@@ -144,19 +144,9 @@ class TaskSubmissionsHandler(ContestHandler):
             .all()
         )
 
-        score_type = task.active_dataset.score_type_object
-
-        public_score, is_public_score_partial = task_score(
-            participation, task, public=True)
-        tokened_score, is_tokened_score_partial = task_score(
-            participation, task, only_tokened=True)
-        actual_score, is_actual_score_partial = task_score(
-            participation, task)
-
-        # The first two should be the same, anyway.
-        is_score_partial = \
-            is_public_score_partial or is_tokened_score_partial or \
-            (is_actual_score_partial and score_type.feedback() == "full")
+        public_score, tokened_score, actual_score, is_score_partial = \
+            self.service.get_task_scores(
+                self.sql_session, participation, task)
 
         submissions_left_contest = None
         if self.contest.max_submission_number is not None:
@@ -223,32 +213,17 @@ class SubmissionStatusHandler(ContestHandler):
             "task_is_score_partial" as partial info is the same for both.
 
         """
-        # Just to preload all information required to compute the task score.
-        self.sql_session.query(Submission)\
-            .filter(Submission.participation == participation)\
-            .filter(Submission.task == task)\
-            .options(joinedload(Submission.token))\
-            .options(joinedload(Submission.results))\
-            .all()
-
         score_type = task.active_dataset.score_type_object
 
-        data["task_public_score"], public_score_is_partial = \
-            task_score(participation, task, public=True)
-        data["task_tokened_score"], tokened_score_is_partial = \
-            task_score(participation, task, only_tokened=True)
-
+        scores = self.service.get_task_scores(
+            self.sql_session, participation, task)
+        data["task_public_score"] = scores.public_score
+        data["task_tokened_score"] = scores.tokened_score
         if score_type.feedback() == "full" or \
            self.r_params["actual_phase"] == 3:
-            data["task_actual_score"], actual_score_is_partial = \
-                task_score(participation, task)
+            data["task_actual_score"] = scores.score
+        data["task_score_is_partial"] = scores.partial
 
-        # These two should be the same, anyway.
-        data["task_score_is_partial"] = \
-            public_score_is_partial or tokened_score_is_partial or \
-            (score_type.feedback() == "full" and actual_score_is_partial)
-
-        score_type = task.active_dataset.score_type_object
         data["task_public_score_message"] = score_type.format_score(
             data["task_public_score"], score_type.max_public_score, None,
             translation=self.translation)
@@ -438,6 +413,7 @@ class UseTokenHandler(ContestHandler):
             # token has been played.
             self.service.proxy_service.submission_tokened(
                 submission_id=submission.id)
+            self.service.notify_submission_changed(submission)
 
             logger.info("Token played by user %s on task %s.",
                         self.current_user.user.username, task.name)
@@ -39,18 +39,27 @@
 """
 
 from datetime import datetime
+import json
 import logging
+import time
 
 try:
     from werkzeug.wsgi import SharedDataMiddleware
 except ImportError:
     from werkzeug.middleware.shared_data import SharedDataMiddleware
 
-from cms import ConfigError, ServiceCoord, config
-from cms.io import WebService
-from cms.locale import get_translations
+from cms import ConfigError, ServiceCoord, config, get_service_shards
+from sqlalchemy.orm import joinedload, selectinload
+
+from cms.db import Contest, Participation, Session, SessionGen, \
+    Submission, Task
+from cms.grading.scoring import TaskScores, participation_task_scores
+from cms.io import WebService, rpc_method
+from cms.locale import Translation, filter_language_codes, \
+    get_translations
 from cms.server.contest.jinja2_toolbox import CWS_ENVIRONMENT
 from cmscommon.binary import hex_to_bin
+from .events import ParticipationEventSource
 from .handlers import HANDLERS
 from .handlers.base import ContestListHandler
 from .handlers.main import MainHandler
@@ -66,6 +75,11 @@ class ContestWebServer(WebService):
     """Service that runs the web server serving the contestants.
 
     """
+    # AWS tells CWS when the data of the contests changes, but other
+    # tools (e.g., the importers) write to the database directly: the
+    # cached contests are reloaded at least this often (in seconds).
+    CONTEST_CACHE_MAX_AGE = 60.0
+
     def __init__(self, shard: int, contest_id: int | None = None):
         parameters = {
             "static_files": [("cms.server", "static"),
@@ -76,6 +90,7 @@ class ContestWebServer(WebService):
             "num_proxies_used": config.contest_web_server.num_proxies_used,
             "xsrf_cookies": True,
             "xsrf_cookie_kwargs": {"samesite": "Strict"},
+            "middlewares": [self._add_event_source],
         }
 
         try:
@@ -120,9 +135,29 @@ class ContestWebServer(WebService):
         # of tuples (timestamp, subject, text, level).
         self.notifications: dict[str, list[tuple[datetime, str, str, str]]] = {}
 
+        # For each participation ID and task ID, the scores. The entries
+        # of a participation are dropped when one of its submissions
+        # changes (see submission_changed), all of them when a contest
+        # changes (see contests_changed). The version increases each
+        # time they are invalidated, to discard the scores that were
+        # being computed at that time.
+        self.task_scores: dict[int, dict[int, TaskScores]] = {}
+        self._task_scores_version = 0
+
         # Retrieve the available translations.
         self.translations = get_translations()
 
+        # For each contest (by name if serving all of them, by ID
+        # otherwise), when it was loaded, the contest with its groups
+        # and tasks, detached from any session, and the translations
+        # its contestants can choose from. The version increases each
+        # time they are invalidated, to discard the contests that were
+        # being loaded at that time.
+        self._contests: \
+            dict[str | int, tuple[float, Contest, dict[str, Translation]]] \
+            = {}
+        self._contests_version = 0
+
         self.evaluation_service = self.connect_to(
             ServiceCoord("EvaluationService", 0))
         self.scoring_service = self.connect_to(
@@ -133,8 +168,24 @@ class ContestWebServer(WebService):
             ServiceCoord("ProxyService", 0),
             must_be_present=ranking_enabled)
 
+        # All the ContestWebServers (this one included), to tell them
+        # about the changes made by the contestants.
+        self.contest_web_servers = [
+            self.connect_to(ServiceCoord("ContestWebServer", i))
+            for i in range(get_service_shards("ContestWebServer"))]
+
+    def _add_event_source(self, app):
+        """Wrap the application with the event streams of the
+        participations.
+
+        """
+        self.event_source = ParticipationEventSource(
+            app, hex_to_bin(config.web_server.secret_key), self.contest_id)
+        return self.event_source
+
     def add_notification(
-        self, username: str, timestamp: datetime, subject: str, text: str, level: str
+        self, username: str, timestamp: datetime, subject: str, text: str,
+        level: str, participation_id: int | None = None,
     ):
         """Store a new notification to send to a user at the first
         opportunity (i.e., at the first request fot db notifications).
@@ -144,8 +195,170 @@ class ContestWebServer(WebService):
         subject: subject of the notification.
         text: body of the notification.
         level: one of NOTIFICATION_* (defined above)
+        participation_id: the participation of the user, if known, to
+            tell its pages to fetch the notification immediately.
 
         """
         if username not in self.notifications:
             self.notifications[username] = []
         self.notifications[username].append((timestamp, subject, text, level))
+        if participation_id is not None:
+            self.event_source.send_to_participation(
+                participation_id, "notification")
+
+    def get_contest(
+        self, session: Session, contest_name: str | None = None
+    ) -> tuple[Contest, dict[str, Translation]] | None:
+        """Return a contest, from the cache if valid.
+
+        The contest, its groups, its tasks and their active datasets,
+        statements and attachments are attached to the session without
+        querying the database; the other data is loaded when accessed.
+
+        session: the session to attach the contest to.
+        contest_name: the name of the contest, if serving all of them;
+            None to return the one given on the command line.
+
+        return: the contest and the translations its contestants can
+            choose from, or None if there is no such contest.
+
+        """
+        key = contest_name if contest_name is not None else self.contest_id
+        entry = self._contests.get(key)
+        if entry is None \
+                or time.monotonic() - entry[0] > self.CONTEST_CACHE_MAX_AGE:
+            version = self._contests_version
+            entry = self._load_contest(contest_name)
+            if entry is None:
+                return None
+            if version == self._contests_version:
+                self._contests[key] = entry
+        _, contest, translations = entry
+        return session.merge(contest, load=False), translations
+
+    def _load_contest(
+        self, contest_name: str | None
+    ) -> tuple[float, Contest, dict[str, Translation]] | None:
+        """Load a contest to cache, see get_contest.
+
+        """
+        loaded_at = time.monotonic()
+        with SessionGen() as session:
+            query = session.query(Contest)\
+                .options(joinedload(Contest.main_group))\
+                .options(selectinload(Contest.groups))\
+                .options(selectinload(Contest.tasks)
+                         .joinedload(Task.active_dataset))\
+                .options(selectinload(Contest.tasks)
+                         .selectinload(Task.statements))\
+                .options(selectinload(Contest.tasks)
+                         .selectinload(Task.attachments))
+            if contest_name is not None:
+                contest = query.filter(Contest.name == contest_name).first()
+            else:
+                contest = query.filter(Contest.id == self.contest_id).first()
+            if contest is None:
+                return None
+            # Closing the session would expire them.
+            session.expunge_all()
+
+        translations = self.translations
+        if contest.allowed_localizations:
+            lang_codes = filter_language_codes(
+                list(translations.keys()), contest.allowed_localizations)
+            translations = dict((k, v) for k, v in translations.items()
+                                if k in lang_codes)
+        return loaded_at, contest, translations
+
+    @rpc_method
+    def contests_changed(self):
+        """Discard the cached contests.
+
+        Called by AdminWebServer after any change to the database.
+
+        """
+        self._contests.clear()
+        self._contests_version += 1
+        # The change might affect the scores (e.g. a new active
+        # dataset).
+        self.task_scores.clear()
+        self._task_scores_version += 1
+
+    def get_task_scores(
+        self, session: Session, participation: Participation, task: Task
+    ) -> TaskScores:
+        """Return the scores of a participation on a task, from the
+        cache if there.
+
+        session: the session to use.
+        participation: the participation.
+        task: the task.
+
+        return: the scores, as returned by participation_task_scores.
+
+        """
+        scores = self.task_scores.get(participation.id, {}).get(task.id)
+        if scores is None:
+            version = self._task_scores_version
+            scores = participation_task_scores(session, participation, task)
+            if version == self._task_scores_version:
+                self.task_scores.setdefault(participation.id, {})[task.id] = \
+                    scores
+        return scores
+
+    def notify_submission_changed(self, submission: Submission):
+        """Tell all the ContestWebServers that a contestant changed one
+        of their submissions (by submitting it or playing a token).
+
+        submission: the submission.
+
+        """
+        # Our pages must see the change right away.
+        self.task_scores.pop(submission.participation_id, None)
+        self._task_scores_version += 1
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.submission_changed(
+                participation_id=submission.participation_id,
+                task_name=submission.task.name,
+                opaque_id=submission.opaque_id)
+
+    @rpc_method
+    def submission_changed(
+        self, participation_id: int, task_name: str, opaque_id: int
+    ):
+        """Tell the pages of a participation that the status of one of
+        its submissions changed.
+
+        Called by EvaluationService, ScoringService and the
+        ContestWebServers.
+
+        participation_id: the participation of the submission.
+        task_name: the name of the task of the submission.
+        opaque_id: the opaque ID of the submission.
+
+        """
+        self.task_scores.pop(participation_id, None)
+        self._task_scores_version += 1
+        self.event_source.send_to_participation(
+            participation_id, "submission",
+            json.dumps({"task": task_name, "submission": str(opaque_id)}))
+
+    @rpc_method
+    def communications_changed(
+        self, contest_id: int, participation_id: int | None = None
+    ):
+        """Tell the pages of some participations that there may be new
+        communications (announcements, messages, answers) for them.
+
+        Called by AdminWebServer.
+
+        contest_id: the contest of the communications.
+        participation_id: the participation they are addressed to,
+            or None for all the participations of the contest.
+
+        """
+        if participation_id is None:
+            self.event_source.send_to_contest(contest_id, "notification")
+        else:
+            self.event_source.send_to_participation(
+                participation_id, "notification")
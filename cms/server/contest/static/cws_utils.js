@@ -44,6 +44,7 @@ CMS.CWSUtils = function(url_root, contest_root, contest_name, timestamp, timezon
     this.remaining_div = null;
     this.unread_count = localStorage.getItem(this.contest_name + "_unread_count");
     this.unread_count = this.unread_count !== null ? parseInt(this.unread_count) : 0;
+    this.events = null;
 };
 
 
@@ -83,6 +84,56 @@ CMS.CWSUtils.prototype.update_notifications = function(hush) {
         }, "json");
 };
 
+/**
+ * Open the stream of the events of the participation, on which the
+ * server tells when there are new notifications or submission
+ * statuses, so that they are fetched only then. Pages should keep
+ * polling while it is not connected (see events_connected).
+ */
+CMS.CWSUtils.prototype.listen_events = function() {
+    if (typeof(EventSource) === "undefined") {
+        return;
+    }
+    var self = this;
+    var reconnection = false;
+    this.events = new EventSource(this.contest_url("events"));
+    this.add_event_listener("notification", function() {
+        self.update_notifications();
+    });
+    this.add_event_listener("open", function() {
+        // We might have missed some events while disconnected.
+        if (reconnection) {
+            self.update_notifications();
+        }
+        reconnection = true;
+    });
+    this.add_event_listener("reinit", function() {
+        self.update_notifications();
+    });
+};
+
+
+CMS.CWSUtils.prototype.events_connected = function() {
+    return this.events !== null
+        && this.events.readyState === EventSource.OPEN;
+};
+
+
+/**
+ * Call callback with the (JSON-decoded) data of each event of the
+ * given type (including "open", at each connection, and "reinit",
+ * when the server lost events the client missed).
+ */
+CMS.CWSUtils.prototype.add_event_listener = function(type, callback) {
+    if (this.events === null) {
+        return;
+    }
+    this.events.addEventListener(type, function(event) {
+        callback(event.data ? JSON.parse(event.data) : null);
+    });
+};
+
+
 function get_cookie(name) {
     var r = document.cookie.match("(^|;)\\s*" + name + "=([^;]*)(;|$)");
     return r ? r[2] : void(0);
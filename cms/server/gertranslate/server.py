@@ -21,11 +21,13 @@
 import importlib.resources
 import json
 import logging
+import os
 
 from tornado.ioloop import IOLoop
 from tornado.web import RequestHandler, Application
 
 from cms import config
+from cms.io.BuildCache import BuildCache
 from cms.io.TaskTranslateInfo import TaskTranslateInfo
 from cms.io.TaskAccess import TaskAccess, unpack_code
 from cms.io.Repository import Repository
@@ -184,7 +186,12 @@ class GerTranslateWebServer:
                                 config.gertranslate.auto_sync,
                                 auto_push=True)
 
-        TaskAccess.init(repository, config.gertranslate.max_compilations)
+        build_cache = BuildCache(
+            os.path.join(config.global_.cache_dir, "statements"),
+            config.gertranslate.build_cache_max_size_mib)
+
+        TaskAccess.init(repository, config.gertranslate.max_compilations,
+                        build_cache)
         TaskTranslateInfo.init(repository)
 
         self.app = Application(handlers, **params)
@@ -20,11 +20,17 @@
 import importlib.resources
 import json
 import logging
+import os
+from datetime import timedelta
 
-from tornado.ioloop import IOLoop
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.iostream import StreamClosedError
+from tornado.locks import Condition
 from tornado.web import RequestHandler, Application, MissingArgumentError
 
 from cms import config
+from cms.io.BuildCache import BuildCache
 from cms.io.TaskInfo import TaskInfo
 from cms.io.TaskFetch import TaskFetch
 from cms.io.Repository import Repository
@@ -33,6 +39,32 @@ from cms.io.Repository import Repository
 logger = logging.getLogger(__name__)
 
 
+class TaskList:
+    """The list of the tasks sent to the clients (see TaskInfo.task_list),
+       computed again only when the tasks changed
+    """
+
+    # how often to check whether the tasks changed (in milliseconds)
+    POLL_INTERVAL = 500
+
+    def __init__(self):
+        self.version = None
+        self.json = None
+        # notified whenever the list changes
+        self.changed = Condition()
+
+    def refresh(self):
+        version = TaskInfo.get_version()
+        if version != self.version:
+            self.version = version
+            self.json = json.dumps(TaskInfo.task_list())
+            self.changed.notify_all()
+
+    def get(self) -> str:
+        self.refresh()
+        return self.json
+
+
 class MainHandler(RequestHandler):
     def get(self):
         self.render("overview.html")
@@ -94,11 +126,53 @@ class DownloadHandler(RequestHandler):
 
 
 class ListHandler(RequestHandler):
+    def initialize(self, task_list):
+        self.task_list = task_list
+
     def get(self):
-        self.write(json.dumps(TaskInfo.task_list()))
+        self.write(self.task_list.get())
         self.flush()
 
 
+class EventsHandler(RequestHandler):
+    """Server-Sent Events stream sending the list of the tasks (as
+       ListHandler) whenever it changes, so that the clients don't have
+       to poll it
+    """
+
+    # how long to wait before sending a comment to keep the connection
+    # open (in seconds)
+    PING_INTERVAL = 30
+
+    def initialize(self, task_list):
+        self.task_list = task_list
+        self.closed = False
+
+    def on_connection_close(self):
+        self.closed = True
+
+    @gen.coroutine
+    def get(self):
+        self.set_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")
+        self.task_list.refresh()
+        version = None
+        while not self.closed:
+            if version != self.task_list.version:
+                version = self.task_list.version
+                self.write("event: list\ndata: {}\n\n".format(self.task_list.json))
+            else:
+                self.write(":\n")
+            try:
+                yield self.flush()
+            except StreamClosedError:
+                return
+            yield self.task_list.changed.wait(
+                timeout=timedelta(seconds=self.PING_INTERVAL)
+            )
+
+
 class InfoHandler(RequestHandler):
     def get(self):
         t = json.loads(self.get_argument("tasks"))
@@ -113,8 +187,10 @@ class TaskOverviewWebServer:
     """
 
     def __init__(self):
+        self.task_list = TaskList()
         handlers = [(r"/", MainHandler),
-                    (r"/list", ListHandler),
+                    (r"/list", ListHandler, {"task_list": self.task_list}),
+                    (r"/events", EventsHandler, {"task_list": self.task_list}),
                     (r"/info", InfoHandler),
                     (r"/compile", TaskCompileHandler),
                     (r"/download/(.*)", DownloadHandler)]
@@ -134,7 +210,14 @@ class TaskOverviewWebServer:
             auto_push=True,
         )
 
-        TaskFetch.init(repository, config.taskoverview.max_compilations)
+        build_cache = BuildCache(
+            os.path.join(config.global_.cache_dir, "statements"),
+            config.taskoverview.build_cache_max_size_mib,
+        )
+
+        TaskFetch.init(
+            repository, config.taskoverview.max_compilations, build_cache
+        )
         TaskInfo.init(
             repository,
             config.taskoverview.tasks_folders,
@@ -148,6 +231,7 @@ class TaskOverviewWebServer:
             config.taskoverview.listen_port,
             address=config.taskoverview.listen_address,
         )
+        PeriodicCallback(self.task_list.refresh, TaskList.POLL_INTERVAL).start()
 
         try:
             IOLoop.instance().start()
@@ -1,6 +1,10 @@
 var __info = {};
 var __tasks = [];
 var __task_dict = {};
+// Stream of the changes of the list of the tasks, and the last list
+// received but not yet shown (while a modal is opened).
+var __events = null;
+var __pending_list = null;
 
 function parse_info(info)
 {
@@ -41,69 +45,94 @@ function fill_table(new_tasks, updated_tasks, removed_tasks, show_col, criteria,
 
 function update(init=false, sliders=false)
 {
-    function on_list(l)
-    {
-        var response = JSON.parse(l);
+    $.get(__url_root + "/list", "", (l) => update_from_list(l, init, sliders));
+}
 
-        var available_tasks = [];
-        var available_tasks_dict = {};
-        for(var i = 0; i < response.length; ++i)
-        {
-            available_tasks.push(response[i].task);
-            available_tasks_dict[response[i].task] = response[i].timestamp;
-        }
+function listen_events()
+{
+    if (typeof EventSource === "undefined")
+        return;
+    __events = new EventSource(__url_root + "/events");
+    __events.addEventListener("list", function(event) {
+        __pending_list = event.data;
+        apply_pending_list();
+    });
+}
 
-        var new_tasks = [];
-        var updated_tasks = [];
+function events_connected()
+{
+    return __events !== null && __events.readyState == EventSource.OPEN;
+}
 
-        for(var i = 0; i < available_tasks.length; ++i)
-        {
-            var t = available_tasks[i];
-
-            if(!(t in __task_dict))
-            {
-                new_tasks.push(t);
-                __task_dict[t] = available_tasks_dict[t];
-            }
-
-            if(__task_dict[t] < available_tasks_dict[t])
-            {
-                updated_tasks.push(t);
-                __task_dict[t] = available_tasks_dict[t];
-            }
-        }
+function apply_pending_list()
+{
+    if (__pending_list === null || is_modal_opened())
+        return;
+    var l = __pending_list;
+    __pending_list = null;
+    update_from_list(l);
+}
+
+function update_from_list(l, init=false, sliders=false)
+{
+    var response = JSON.parse(l);
+
+    var available_tasks = [];
+    var available_tasks_dict = {};
+    for(var i = 0; i < response.length; ++i)
+    {
+        available_tasks.push(response[i].task);
+        available_tasks_dict[response[i].task] = response[i].timestamp;
+    }
 
-        var removed_tasks = {};
+    var new_tasks = [];
+    var updated_tasks = [];
 
-        for(var i = 0; i < __tasks.length; ++i)
-            if(!(__tasks[i] in available_tasks_dict))
-                removed_tasks[__tasks[i]] = true;
+    for(var i = 0; i < available_tasks.length; ++i)
+    {
+        var t = available_tasks[i];
 
-        function on_info(i)
+        if(!(t in __task_dict))
         {
-            var info = JSON.parse(i);
-            for(var i = 0; i < new_tasks.length; ++i)
-                __info[new_tasks[i]] = parse_info(info[new_tasks[i]]);
-            for(var i = 0; i < updated_tasks.length; ++i)
-                __info[updated_tasks[i]] = parse_info(info[updated_tasks[i]]);
-
-            fill_table(new_tasks, updated_tasks, removed_tasks, show_col, null, init);
-            if(sliders) update_sliders(init);
+            new_tasks.push(t);
+            __task_dict[t] = available_tasks_dict[t];
         }
 
-        if(new_tasks.length > 0 || updated_tasks.length > 0)
+        if(__task_dict[t] < available_tasks_dict[t])
         {
-            $.get(__url_root + "/info", {"tasks": JSON.stringify(new_tasks.concat(updated_tasks))}, on_info);
+            updated_tasks.push(t);
+            __task_dict[t] = available_tasks_dict[t];
         }
+    }
 
-        else
-        {
-            fill_table(new_tasks, updated_tasks, removed_tasks, show_col, null, init);
-            if(sliders) update_sliders(init);
-        }
+    var removed_tasks = {};
+
+    for(var i = 0; i < __tasks.length; ++i)
+        if(!(__tasks[i] in available_tasks_dict))
+            removed_tasks[__tasks[i]] = true;
+
+    function on_info(i)
+    {
+        var info = JSON.parse(i);
+        for(var i = 0; i < new_tasks.length; ++i)
+            __info[new_tasks[i]] = parse_info(info[new_tasks[i]]);
+        for(var i = 0; i < updated_tasks.length; ++i)
+            __info[updated_tasks[i]] = parse_info(info[updated_tasks[i]]);
+
+        fill_table(new_tasks, updated_tasks, removed_tasks, show_col, null, init);
+        if(sliders) update_sliders(init);
     }
 
-    $.get(__url_root + "/list", "", on_list);
+    if(new_tasks.length > 0 || updated_tasks.length > 0)
+    {
+        $.get(__url_root + "/info", {"tasks": JSON.stringify(new_tasks.concat(updated_tasks))}, on_info);
+    }
+
+    else
+    {
+        fill_table(new_tasks, updated_tasks, removed_tasks, show_col, null, init);
+        if(sliders) update_sliders(init);
+    }
 }
 
 function update_sliders(init=false)
@@ -31,12 +31,14 @@ the current ranking.
 """
 
 import logging
-from collections import defaultdict
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from functools import wraps
 
 import gevent.lock
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
 from cms import ServiceCoord, get_service_shards
@@ -44,7 +46,7 @@ from cms.db.session import Session
 from cms.io.priorityqueue import QueueEntry, QueueEntryDict, QueueItem
 from cmscommon.datetime import make_timestamp
 from cms.db import SessionGen, Digest, Dataset, Evaluation, Submission, \
-    SubmissionResult, Testcase, UserTest, UserTestResult, get_submissions, \
+    SubmissionResult, UserTest, UserTestResult, get_submissions, \
     get_submission_results, get_datasets_to_judge
 from cms.grading.Job import Job, JobGroup
 from cms.io import Executor, TriggeredService, rpc_method
@@ -64,6 +66,11 @@ class EvaluationExecutor(Executor[ESOperation]):
     # Real maximum number of operations to be sent to a worker.
     MAX_OPERATIONS_PER_BATCH = 25
 
+    # Time we would like a worker to spend on a batch. Batches of
+    # slow operations are made smaller, so that they are spread
+    # among more workers, and less work is lost if a worker dies.
+    TARGET_BATCH_DURATION = timedelta(seconds=15)
+
     def __init__(self, evaluation_service: "EvaluationService"):
         """Create the single executor for ES.
 
@@ -89,6 +96,15 @@ class EvaluationExecutor(Executor[ESOperation]):
         # the testcase codename) and keeps track of multiplicity.
         self.queue_status_cumulative: dict[tuple, QueueEntryDict] = dict()
 
+        # The first operation of the batch being formed, used to
+        # decide the size of the batch.
+        self._batch_head: ESOperation | None = None
+        # How the size of the last batch was decided, both for the
+        # batch being formed and for the last batch sent to each
+        # worker (indexed by shard).
+        self._batch_sizing: dict = dict()
+        self.batch_sizing_by_worker: dict[int, dict] = dict()
+
         for i in range(get_service_shards("Worker")):
             worker = ServiceCoord("Worker", i)
             self.pool.add_worker(worker)
@@ -111,15 +127,45 @@ class EvaluationExecutor(Executor[ESOperation]):
         """Return the maximum number of operations per batch.
 
         We derive the number from the length of the queue divided by
-        the number of workers, with a cap at MAX_OPERATIONS_PER_BATCH.
+        the number of workers, with a cap at MAX_OPERATIONS_PER_BATCH
+        for each job slot of the workers (evaluations can run in
+        parallel in a worker). If we know how long operations similar
+        to the first one in the batch take, we also cap it so that the
+        batch takes about TARGET_BATCH_DURATION. A batch of evaluations
+        is never smaller than the number of job slots, as otherwise a
+        worker executing it would leave some of them unused.
 
         """
         # TODO: len(self.pool) is the total number of workers,
         # included those that are disabled.
+        job_slots = 1
+        if self._batch_head is not None \
+                and self._batch_head.type_ == ESOperation.EVALUATION:
+            job_slots = self.pool.max_job_slots()
         ratio = len(self._operation_queue) // len(self.pool) + 1
-        ret = min(max(ratio, 1), EvaluationExecutor.MAX_OPERATIONS_PER_BATCH)
-        logger.info("Ratio is %d, executing %d operations together.",
-                    ratio, ret)
+        ret = min(max(ratio, 1),
+                  EvaluationExecutor.MAX_OPERATIONS_PER_BATCH * job_slots)
+        expected_duration = None
+        if self._batch_head is not None:
+            expected_duration = \
+                self.pool.expected_duration(self._batch_head)
+        if expected_duration is not None and expected_duration > 0:
+            duration_cap = int(
+                EvaluationExecutor.TARGET_BATCH_DURATION.total_seconds()
+                * job_slots / expected_duration)
+            ret = min(ret, max(duration_cap, 1))
+        ret = max(ret, job_slots)
+        self._batch_sizing = {
+            "ratio": ratio,
+            "expected_operation_duration": expected_duration,
+            "job_slots": job_slots,
+            "max_operations": ret,
+        }
+        logger.info("Ratio is %d, expected duration is %s, %d job slots, "
+                    "executing %d operations together.", ratio,
+                    "%.3fs" % expected_duration
+                    if expected_duration is not None else "unknown",
+                    job_slots, ret)
         return ret
 
     def execute(self, entries: list[QueueEntry[ESOperation]]):
@@ -142,13 +188,32 @@ class EvaluationExecutor(Executor[ESOperation]):
                 # re-enqueue it.
                 operation.side_data = (entry.priority, entry.timestamp)
                 self._currently_executing.append(operation)
+        # For a bounded time, we prefer waiting for a busy worker that
+        # already has the files needed by the operations to giving
+        # them to an idle worker that would need to fetch them.
+        affinity_deadline = time.monotonic() + \
+            WorkerPool.MAX_AFFINITY_WAIT.total_seconds()
+        wait_for_affinity = True
         while len(self._currently_executing) > 0:
-            self.pool.wait_for_workers()
+            if wait_for_affinity:
+                # Past the deadline, try again at once without waiting
+                # for affinity: an idle worker that we skipped doesn't
+                # make the pool signal that workers are available.
+                self.pool.wait_for_workers(
+                    max(affinity_deadline - time.monotonic(), 0))
+                wait_for_affinity = time.monotonic() < affinity_deadline
+            else:
+                self.pool.wait_for_workers()
             with self._current_execution_lock:
                 if len(self._currently_executing) == 0:
                     break
-                res = self.pool.acquire_worker(self._currently_executing)
+                res = self.pool.acquire_worker(
+                    self._currently_executing,
+                    wait_for_affinity=wait_for_affinity)
                 if res is not None:
+                    self.batch_sizing_by_worker[res] = dict(
+                        self._batch_sizing,
+                        operations=len(self._currently_executing))
                     self._currently_executing = []
                     break
 
@@ -192,6 +257,9 @@ class EvaluationExecutor(Executor[ESOperation]):
     def _pop(self, wait=False):
         queue_entry = super()._pop(wait=wait)
         self._remove_from_cumulative_status(queue_entry)
+        # The first operation popped is the head of the next batch.
+        if wait:
+            self._batch_head = queue_entry.item
         return queue_entry
 
     def _remove_from_cumulative_status(self, queue_entry: QueueEntry[ESOperation]):
@@ -290,6 +358,34 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         self.scoring_service = self.connect_to(
             ServiceCoord("ScoringService", 0))
 
+        # To tell the contestants' pages when their submissions start
+        # being evaluated.
+        self.contest_web_servers = [
+            self.connect_to(ServiceCoord("ContestWebServer", i))
+            for i in range(get_service_shards("ContestWebServer"))]
+
+        # Maximum submission and user test ids seen at the start of
+        # the last (at most) two sweeps. Sweeps are incremental: they
+        # look for objects without results only among those with an id
+        # greater than the oldest of these watermarks, so that objects
+        # whose transaction was still open during the previous sweep
+        # are not missed. Until we have two watermarks, or when a full
+        # sweep is requested, we look at all objects.
+        self._sweep_watermarks: deque[tuple[int, int]] = deque(maxlen=2)
+        self._full_sweep_requested = False
+
+        # Number of evaluations in the DB for the submission results
+        # being evaluated, indexed by (submission id, dataset id). It is
+        # loaded from the DB when missing and updated when we write
+        # evaluations, so that we can tell when a submission result is
+        # completely evaluated without counting its evaluations every
+        # time. Entries are dropped whenever evaluations might be
+        # removed by someone else.
+        self._evaluation_counts: dict[tuple[int, int], int] = dict()
+        # IDs of the testcases of each dataset the last time we wrote
+        # results for it.
+        self._testcase_ids: dict[int, frozenset[int]] = dict()
+
         self.add_executor(EvaluationExecutor(self))
         self.start_sweeper(117.0)
 
@@ -358,31 +454,67 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         the queue.
 
         """
+        full_sweep = self._full_sweep_requested \
+            or len(self._sweep_watermarks) < self._sweep_watermarks.maxlen
+        self._full_sweep_requested = False
+
+        if full_sweep:
+            min_submission_id, min_user_test_id = None, None
+        else:
+            min_submission_id, min_user_test_id = self._sweep_watermarks[0]
+
         counter = 0
         with SessionGen() as session:
+            max_submission_id = \
+                session.query(func.max(Submission.id)).scalar() or 0
+            max_user_test_id = \
+                session.query(func.max(UserTest.id)).scalar() or 0
 
-            for operation, priority, timestamp in \
-                    get_submissions_operations(session, self.contest_id):
+            for operation, priority, timestamp in get_submissions_operations(
+                    session, self.contest_id, min_submission_id):
                 if self.enqueue(operation, priority, timestamp):
                     counter += 1
 
-            for operation, priority, timestamp in \
-                    get_user_tests_operations(session, self.contest_id):
+            for operation, priority, timestamp in get_user_tests_operations(
+                    session, self.contest_id, min_user_test_id):
                 if self.enqueue(operation, priority, timestamp):
                     counter += 1
 
+        self._sweep_watermarks.append((max_submission_id, max_user_test_id))
+        logger.debug("Finished %s sweep, watermarks are now %s.",
+                     "full" if full_sweep else "incremental",
+                     list(self._sweep_watermarks))
+
         return counter
 
+    @rpc_method
+    def search_operations_not_done(self):
+        """Make the sweeper loop fire a full sweep as soon as possible.
+
+        Callers use this when old submissions may need work (e.g., a
+        dataset became judged), so the incremental sweep, which only
+        looks for missing results of recent submissions, is not enough.
+
+        """
+        self._full_sweep_requested = True
+        super().search_operations_not_done()
+
     @rpc_method
     def workers_status(self) -> dict:
         """Returns a dictionary (indexed by shard number) whose values
         are the information about the corresponding worker. See
-        WorkerPool.get_status for more details.
+        WorkerPool.get_status for more details; in addition, we
+        report how the size of the last batch sent to the worker was
+        decided.
 
         returns: the dict with the workers information.
 
         """
-        return self.get_executor().pool.get_status()
+        executor = self.get_executor()
+        status = executor.pool.get_status()
+        for shard, sizing in executor.batch_sizing_by_worker.items():
+            status["%d" % shard]["batch_sizing"] = sizing
+        return status
 
     def check_workers_timeout(self):
         """We ask WorkerPool for the unresponsive workers, and we put
@@ -433,14 +565,16 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         return super().enqueue(operation, priority, timestamp) > 0
 
     @with_post_finish_lock
-    def action_finished(self, data: dict, shard: int, error=None):
+    def action_finished(self, data: dict, plus: list[int], error=None):
         """Callback from a worker, to signal that is finished some
         action (compilation or evaluation).
 
         data: the JobGroup, exported to dict.
-        shard: the shard finishing the action.
+        plus: the shard finishing the action and the ID of the batch
+            it finished.
 
         """
+        shard, batch_id = plus
         # We notify the pool that the worker is available again for
         # further work (no matter how the current request turned out,
         # even if the worker encountered an error). If the pool
@@ -449,7 +583,8 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         # this method and do nothing because in that case we know the
         # operation has returned to the queue and perhaps already been
         # reassigned to another worker.
-        to_ignore = self.get_executor().pool.release_worker(shard)
+        to_ignore = self.get_executor().pool.release_worker(
+            shard, batch_id=batch_id)
         if to_ignore is True:
             logger.info("Ignored result from worker %s as requested.", shard)
             return
@@ -493,6 +628,13 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         retrieving datasets and submission results only once instead
         of once for every result.
 
+        Successful evaluations of submissions, by far the most common
+        results, are written with a single multi-row INSERT, and the
+        number of evaluations of each submission result is tracked in
+        memory to decide when it is completely evaluated. All other
+        results (and successful evaluations, if the bulk write fails)
+        are written one by one.
+
         items: the results received by ES but not yet written to the db.
 
         """
@@ -502,7 +644,7 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         # operation type (i.e., group together the testcase
         # evaluations for the same submission and dataset).
         by_object_and_type: defaultdict[
-            tuple[str, int, int], list[tuple[ESOperation, Result]]
+            tuple[str, int, int, bool], list[tuple[ESOperation, Result]]
         ]
         by_object_and_type = defaultdict(list)
         for operation, result in items:
@@ -510,6 +652,14 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
             by_object_and_type[t].append((operation, result))
 
         with SessionGen() as session:
+            datasets: dict[int, Dataset] = dict()
+            object_results: dict[
+                tuple[str, int, int, bool], SubmissionResult | UserTestResult
+            ] = dict()
+            bulk_evaluations: dict[
+                tuple[str, int, int, bool],
+                list[tuple[ESOperation, Result, dict]]
+            ] = dict()
             for key, operation_results in by_object_and_type.items():
                 type_, object_id, dataset_id, archive_sandbox = key
 
@@ -518,6 +668,7 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
                     logger.error("Could not find dataset %d in the database.",
                                  dataset_id)
                     continue
+                datasets[dataset_id] = dataset
 
                 # Get submission or user test results.
                 if type_ in [ESOperation.COMPILATION, ESOperation.EVALUATION]:
@@ -534,28 +685,56 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
                                      "in the database.", object_id)
                         continue
                     object_result = object_.get_result_or_create(dataset)
+                object_results[key] = object_result
 
-                self.write_results_one_object_and_type(
-                    session, object_result, operation_results)
+                if type_ == ESOperation.EVALUATION:
+                    bulk_evaluations[key], operation_results = \
+                        self.prepare_bulk_evaluations(
+                            dataset, object_id, operation_results)
+
+                if len(operation_results) > 0:
+                    if type_ in [ESOperation.COMPILATION,
+                                 ESOperation.EVALUATION]:
+                        # Writing these results might add or remove
+                        # evaluations, we will need to count them again.
+                        self._evaluation_counts.pop(
+                            (object_id, dataset_id), None)
+                    self.write_results_one_object_and_type(
+                        session, object_result, operation_results)
+
+            inserted_evaluations = self.write_evaluations_in_bulk(
+                session, object_results, bulk_evaluations)
 
             logger.info("Committing evaluations...")
             session.commit()
 
-            num_testcases_per_dataset = dict()
+            for submission_id, dataset_id in inserted_evaluations:
+                self._evaluation_counts[(submission_id, dataset_id)] += 1
+
+            # Testcases might have been added, removed or replaced
+            # (together with their evaluations) since we last looked at
+            # the dataset; if so, the counts for it cannot be trusted
+            # anymore. Replacing a testcase gives it a new ID.
+            for dataset_id, dataset in datasets.items():
+                testcase_ids = frozenset(
+                    testcase.id for testcase in dataset.testcases.values())
+                if self._testcase_ids.get(dataset_id, testcase_ids) \
+                        != testcase_ids:
+                    for key in list(self._evaluation_counts):
+                        if key[1] == dataset_id:
+                            del self._evaluation_counts[key]
+                self._testcase_ids[dataset_id] = testcase_ids
+
             for type_, object_id, dataset_id, archive_sandbox in by_object_and_type.keys():
-                if type_ == ESOperation.EVALUATION:
-                    if dataset_id not in num_testcases_per_dataset:
-                        num_testcases_per_dataset[dataset_id] = session\
-                            .query(func.count(Testcase.id))\
-                            .filter(Testcase.dataset_id == dataset_id).scalar()
-                    num_evaluations = session\
-                        .query(func.count(Evaluation.id)) \
-                        .filter(Evaluation.dataset_id == dataset_id) \
-                        .filter(Evaluation.submission_id == object_id).scalar()
-                    if num_evaluations == num_testcases_per_dataset[dataset_id]:
+                if type_ == ESOperation.EVALUATION \
+                        and dataset_id in datasets:
+                    if self.num_evaluations(
+                            session, object_id, dataset_id) \
+                            == len(datasets[dataset_id].testcases):
                         submission_result = SubmissionResult.get_from_id(
                             (object_id, dataset_id), session)
                         submission_result.set_evaluation_outcome()
+                        del self._evaluation_counts[(object_id, dataset_id)]
 
             logger.info("Committing evaluation outcomes...")
             session.commit()
@@ -583,6 +762,145 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
 
         logger.info("Done")
 
+    def prepare_bulk_evaluations(
+        self,
+        dataset: Dataset,
+        submission_id: int,
+        operation_results: list[tuple[ESOperation, Result]],
+    ) -> tuple[list[tuple[ESOperation, Result, dict]],
+               list[tuple[ESOperation, Result]]]:
+        """Select the evaluation results that can be written in bulk.
+
+        dataset: the dataset of the evaluations.
+        submission_id: the id of the submission evaluated.
+        operation_results: the evaluation operations and corresponding
+            worker results for the submission and dataset.
+
+        return: the operations, results and row values of the
+            successful evaluations to write in bulk, and the operations
+            and results of all the others, to be written one by one.
+
+        """
+        bulk = []
+        others = []
+        for operation, result in operation_results:
+            if not result.job_success:
+                others.append((operation, result))
+                continue
+            try:
+                values = result.job.get_evaluation_values()
+                values.update({
+                    "submission_id": submission_id,
+                    "dataset_id": dataset.id,
+                    "testcase_id":
+                        dataset.testcases[operation.testcase_codename].id,
+                })
+            except Exception:
+                # The row-by-row path will take care of logging.
+                others.append((operation, result))
+            else:
+                bulk.append((operation, result, values))
+        return bulk, others
+
+    def write_evaluations_in_bulk(
+        self,
+        session: Session,
+        object_results: dict[tuple, SubmissionResult | UserTestResult],
+        bulk_evaluations: dict[tuple, list[tuple[ESOperation, Result, dict]]],
+    ) -> list[tuple[int, int]]:
+        """Write to the DB the evaluations in a single INSERT.
+
+        Evaluations for testcases that already have one are skipped,
+        as the row-by-row path would do. If the INSERT fails, we fall
+        back to the row-by-row path.
+
+        session: the DB session to use.
+        object_results: the submission results of the evaluations,
+            indexed by the same key as bulk_evaluations.
+        bulk_evaluations: the operations, results and row values
+            returned by prepare_bulk_evaluations, indexed by the
+            (type, object id, dataset id, archive sandbox) key.
+
+        return: the (submission id, dataset id) pair of each inserted
+            evaluation, to update the evaluation counts after commit.
+
+        """
+        rows = [values
+                for evaluations in bulk_evaluations.values()
+                for _, _, values in evaluations]
+        if len(rows) == 0:
+            return []
+
+        # Submission results might have just been created, and we need
+        # their current number of evaluations before inserting.
+        session.flush()
+        self.seed_evaluation_counts(session, set(
+            (values["submission_id"], values["dataset_id"])
+            for values in rows))
+
+        logger.info("Writing %d evaluations to db in bulk.", len(rows))
+        try:
+            with session.begin_nested():
+                return session.execute(
+                    insert(Evaluation.__table__)
+                    .values(rows)
+                    .on_conflict_do_nothing(index_elements=[
+                        Evaluation.submission_id,
+                        Evaluation.dataset_id,
+                        Evaluation.testcase_id])
+                    .returning(Evaluation.submission_id,
+                               Evaluation.dataset_id)).fetchall()
+        except Exception:
+            logger.error("Bulk insertion of evaluations failed, writing "
+                         "them one by one.", exc_info=True)
+
+        for key, evaluations in bulk_evaluations.items():
+            _, object_id, dataset_id, _ = key
+            self._evaluation_counts.pop((object_id, dataset_id), None)
+            self.write_results_one_object_and_type(
+                session, object_results[key],
+                [(operation, result) for operation, result, _ in evaluations])
+        return []
+
+    def seed_evaluation_counts(
+        self, session: Session, keys: set[tuple[int, int]]
+    ):
+        """Load from the DB the evaluation counts we do not know.
+
+        session: the DB session to use.
+        keys: the (submission id, dataset id) pairs whose count we need.
+
+        """
+        missing = [key for key in keys if key not in self._evaluation_counts]
+        if len(missing) == 0:
+            return
+        for key in missing:
+            self._evaluation_counts[key] = 0
+        for submission_id, dataset_id, count in session\
+                .query(Evaluation.submission_id, Evaluation.dataset_id,
+                       func.count(Evaluation.id))\
+                .filter(tuple_(Evaluation.submission_id,
+                               Evaluation.dataset_id).in_(missing))\
+                .group_by(Evaluation.submission_id, Evaluation.dataset_id):
+            self._evaluation_counts[(submission_id, dataset_id)] = count
+
+    def num_evaluations(
+        self, session: Session, submission_id: int, dataset_id: int
+    ) -> int:
+        """Return the number of evaluations of a submission result.
+
+        The count is taken from memory if known, from the DB otherwise.
+
+        session: the DB session to use.
+        submission_id: the id of the submission.
+        dataset_id: the id of the dataset.
+
+        return: the number of evaluations written in the DB.
+
+        """
+        self.seed_evaluation_counts(session, {(submission_id, dataset_id)})
+        return self._evaluation_counts[(submission_id, dataset_id)]
+
     def write_results_one_object_and_type(
         self,
         session: Session,
@@ -688,11 +1006,19 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         """
         submission = submission_result.submission
 
-        # If compilation was ok, we emit a satisfied log message.
+        # If compilation was ok, we emit a satisfied log message, and
+        # tell the contestant it is being evaluated.
         if submission_result.compilation_succeeded():
             logger.info("Submission %d(%d) was compiled successfully.",
                         submission_result.submission_id,
                         submission_result.dataset_id)
+            if submission_result.dataset_id \
+                    == submission.task.active_dataset_id:
+                for contest_web_server in self.contest_web_servers:
+                    contest_web_server.submission_changed(
+                        participation_id=submission.participation_id,
+                        task_name=submission.task.name,
+                        opaque_id=submission.opaque_id)
 
         # If instead submission failed compilation, we inform
         # ScoringService of the new submission. We need to commit
@@ -932,6 +1258,9 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         if contest_id is None:
             contest_id = self.contest_id
 
+        # Evaluations are going to be deleted.
+        self._evaluation_counts.clear()
+
         with SessionGen() as session:
             # When invalidating a dataset we need to know the task_id,
             # otherwise get_submissions will return all the submissions of
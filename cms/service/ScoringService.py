@@ -28,8 +28,12 @@
 
 import logging
 
-from cms import ServiceCoord, config
-from cms.db import SessionGen, Submission, Dataset, get_submission_results
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, subqueryload
+
+from cms import ServiceCoord, config, get_service_shards
+from cms.db import Session, SessionGen, Submission, SubmissionResult, \
+    Dataset, get_submission_results
 from cms.io import Executor, TriggeredService, rpc_method
 from cms.io.priorityqueue import QueueEntry
 from cmscommon.datetime import make_datetime
@@ -40,86 +44,159 @@ logger = logging.getLogger(__name__)
 
 
 class ScoringExecutor(Executor[ScoringOperation]):
-    def __init__(self, proxy_service):
-        super().__init__()
+    # The maximum number of submission results scored in the same
+    # transaction.
+    MAX_OPERATIONS_PER_BATCH = 100
+
+    def __init__(self, proxy_service, contest_web_servers,
+                 admin_web_servers):
+        super().__init__(batch_executions=True)
         self.proxy_service = proxy_service
+        self.contest_web_servers = contest_web_servers
+        self.admin_web_servers = admin_web_servers
+
+    def max_operations_per_batch(self) -> int:
+        """See Executor.max_operations_per_batch."""
+        return self.MAX_OPERATIONS_PER_BATCH
+
+    def execute(self, entries: list[QueueEntry[ScoringOperation]]):
+        """Assign a score to a batch of submission results.
 
-    def execute(self, entry: QueueEntry[ScoringOperation]):
-        """Assign a score to a submission result.
+        This is the core of ScoringService: here we retrieve the
+        results from the database, check if they are in the correct
+        status, instantiate their ScoreType, compute their score,
+        store them back in the database and tell ProxyService to
+        update RWS if needed.
 
-        This is the core of ScoringService: here we retrieve the result
-        from the database, check if it is in the correct status,
-        instantiate its ScoreType, compute its score, store it back in
-        the database and tell ProxyService to update RWS if needed.
+        All the results are loaded with a single query and stored
+        with a single commit. An error in an operation is logged, its
+        changes are rolled back (so that the sweeper tries it again)
+        and it doesn't prevent the others from being performed.
 
-        entry: entry containing the operation to perform.
+        entries: entries containing the operations to perform.
 
         """
-        operation = entry.item
+        # ID, participation ID, task name and opaque ID of the scored
+        # submissions, and the contests they belong to, to notify the
+        # other services.
+        scored_submissions = []
+        contest_ids = set()
         with SessionGen() as session:
-            # Obtain submission.
-            submission = Submission.get_from_id(operation.submission_id,
-                                                session)
-            if submission is None:
-                raise ValueError("Submission %d not found in the database." %
-                                 operation.submission_id)
-
-            # Obtain dataset.
-            dataset = Dataset.get_from_id(operation.dataset_id, session)
-            if dataset is None:
-                raise ValueError("Dataset %d not found in the database." %
-                                 operation.dataset_id)
-
-            # Obtain submission result.
-            submission_result = submission.get_result(dataset)
-
-            # It means it was not even compiled (for some reason).
-            if submission_result is None:
-                raise ValueError("Submission result %d(%d) was not found." %
+            # Load the results, with what is needed to score them,
+            # into the identity map of the session (which holds only
+            # weak references, hence the unused variable).
+            keys = [(entry.item.submission_id, entry.item.dataset_id)
+                    for entry in entries]
+            _submission_results = session.query(SubmissionResult)\
+                .filter(tuple_(SubmissionResult.submission_id,
+                               SubmissionResult.dataset_id).in_(keys))\
+                .options(joinedload(SubmissionResult.submission)
+                         .joinedload(Submission.task))\
+                .options(subqueryload(SubmissionResult.evaluations))\
+                .all()
+
+            for entry in entries:
+                try:
+                    with session.begin_nested():
+                        active = self.score(session, entry.item)
+                    if active:
+                        submission = Submission.get_from_id(
+                            entry.item.submission_id, session)
+                        scored_submissions.append(
+                            (submission.id, submission.participation_id,
+                             submission.task.name, submission.opaque_id))
+                        contest_ids.add(submission.task.contest_id)
+                except Exception:
+                    logger.error("Unexpected error when scoring `%s'.",
+                                 entry.item, exc_info=True)
+
+            # Store them.
+            session.commit()
+
+        for submission_id, participation_id, task_name, opaque_id \
+                in scored_submissions:
+            self.proxy_service.submission_scored(submission_id=submission_id)
+            for contest_web_server in self.contest_web_servers:
+                contest_web_server.submission_changed(
+                    participation_id=participation_id, task_name=task_name,
+                    opaque_id=opaque_id)
+        for contest_id in contest_ids:
+            for admin_web_server in self.admin_web_servers:
+                admin_web_server.scores_changed(contest_id=contest_id)
+
+    def score(self, session: Session, operation: ScoringOperation) -> bool:
+        """Assign a score to a submission result, without committing.
+
+        session: the session to use.
+        operation: the operation to perform.
+
+        return: whether the result is on the active dataset, and RWS
+            has to be updated.
+
+        """
+        # Obtain submission.
+        submission = Submission.get_from_id(operation.submission_id,
+                                            session)
+        if submission is None:
+            raise ValueError("Submission %d not found in the database." %
+                             operation.submission_id)
+
+        # Obtain dataset.
+        dataset = Dataset.get_from_id(operation.dataset_id, session)
+        if dataset is None:
+            raise ValueError("Dataset %d not found in the database." %
+                             operation.dataset_id)
+
+        # Obtain submission result.
+        submission_result = submission.get_result(dataset)
+
+        # It means it was not even compiled (for some reason).
+        if submission_result is None:
+            raise ValueError("Submission result %d(%d) was not found." %
+                             (operation.submission_id,
+                              operation.dataset_id))
+
+        # Check if it's ready to be scored.
+        if not submission_result.needs_scoring():
+            if submission_result.scored():
+                logger.info("Submission result %d(%d) is already scored.",
+                            operation.submission_id, operation.dataset_id)
+                return False
+            else:
+                raise ValueError("The state of the submission result "
+                                 "%d(%d) doesn't allow scoring." %
                                  (operation.submission_id,
                                   operation.dataset_id))
 
-            # Check if it's ready to be scored.
-            if not submission_result.needs_scoring():
-                if submission_result.scored():
-                    logger.info("Submission result %d(%d) is already scored.",
-                                operation.submission_id, operation.dataset_id)
-                    return
-                else:
-                    raise ValueError("The state of the submission result "
-                                     "%d(%d) doesn't allow scoring." %
-                                     (operation.submission_id,
-                                      operation.dataset_id))
-
-            # Instantiate the score type.
-            score_type = dataset.score_type_object
-
-            # Compute score and fill it in the database.
-            submission_result.score, \
-                submission_result.score_details, \
-                submission_result.public_score, \
-                submission_result.public_score_details, \
-                submission_result.ranking_score_details = \
-                score_type.compute_score(submission_result)
-
-            # Compute unit test score.
-            submission_result.unit_test_score_details = \
-                score_type.compute_unit_test_score(submission_result,
-                                                   submission.additional_info)
-
-            if submission_result.scored_at is None:
-                submission_result.scored_at = make_datetime()
-
-            # Store it.
-            session.commit()
-
-            # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                logger.info(
-                    "Submission scored %.1f seconds after submission",
-                    (make_datetime() - submission.timestamp).total_seconds())
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+        # Instantiate the score type.
+        score_type = dataset.score_type_object
+
+        # Compute score and unit test score, and only then fill them
+        # in the database, so that a failure leaves nothing half done.
+        score, score_details, public_score, public_score_details, \
+            ranking_score_details = \
+            score_type.compute_score(submission_result)
+        unit_test_score_details = \
+            score_type.compute_unit_test_score(submission_result,
+                                               submission.additional_info)
+
+        submission_result.score = score
+        submission_result.score_details = score_details
+        submission_result.public_score = public_score
+        submission_result.public_score_details = public_score_details
+        submission_result.ranking_score_details = ranking_score_details
+        submission_result.unit_test_score_details = unit_test_score_details
+
+        if submission_result.scored_at is None:
+            submission_result.scored_at = make_datetime()
+
+        # If dataset is the active one, update RWS.
+        if dataset is not submission.task.active_dataset:
+            return False
+        logger.info(
+            "Submission scored %.1f seconds after submission",
+            (make_datetime() - submission.timestamp).total_seconds())
+        return True
 
 
 class ScoringService(TriggeredService[ScoringOperation, ScoringExecutor]):
@@ -147,7 +224,19 @@ class ScoringService(TriggeredService[ScoringOperation, ScoringExecutor]):
             ServiceCoord("ProxyService", 0),
             must_be_present=ranking_enabled)
 
-        self.add_executor(ScoringExecutor(self.proxy_service))
+        # Set up communication with the ContestWebServers, to tell the
+        # contestants' pages when their submissions are scored.
+        contest_web_servers = [
+            self.connect_to(ServiceCoord("ContestWebServer", i))
+            for i in range(get_service_shards("ContestWebServer"))]
+        # And with the AdminWebServers, to update their rankings.
+        admin_web_servers = [
+            self.connect_to(ServiceCoord("AdminWebServer", i))
+            for i in range(get_service_shards("AdminWebServer"))]
+
+        self.add_executor(ScoringExecutor(self.proxy_service,
+                                          contest_web_servers,
+                                          admin_web_servers))
         self.start_sweeper(347.0)
 
     def _missing_operations(self):
@@ -28,13 +28,20 @@
 import logging
 import time
 
+import gevent
 import gevent.lock
+import gevent.pool
 
-from cms.db import SessionGen, Contest, enumerate_files
+from cms import config
+from cms.db import SessionGen, Contest, Digest, enumerate_files
+from cms.db.session import Session
 from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
-from cms.grading.Job import CompilationJob, EvaluationJob, JobGroup
+from cms.grading.Job import CompilationJob, EvaluationJob, Job, JobGroup
+from cms.grading.Sandbox import SandboxPool
 from cms.grading.tasktypes import get_task_type
+from cms.grading.tasktypes.util import BOXES_PER_JOB_SLOT, set_job_slot, \
+    set_sandbox_pool
 from cms.io import Service, rpc_method
 
 
@@ -52,11 +59,18 @@ class Worker(Service):
     JOB_TYPE_COMPILATION = "compile"
     JOB_TYPE_EVALUATION = "evaluate"
 
+    # Maximum number of files downloaded at the same time when
+    # precaching.
+    PRECACHE_CONCURRENCY = 4
+
     def __init__(self, shard: int, fake_worker_time: float | None = None):
         Service.__init__(self, shard)
         self.file_cacher = FileCacher(self)
 
         self.work_lock = gevent.lock.RLock()
+        # Whether a job group is waiting for the current one to finish
+        # (only allowed when ES prefetches batches).
+        self._job_group_waiting = False
         self._last_end_time = None
         self._total_free_time = 0
         self._total_busy_time = 0
@@ -64,10 +78,102 @@ class Worker(Service):
 
         self._fake_worker_time = fake_worker_time
 
+        # Progress of the last precaching done by this worker.
+        self._precache_status: dict | None = None
+
+        # Sandboxes reused between jobs; they are created when the
+        # worker starts, or on demand if that failed.
+        self.sandbox_pool: SandboxPool | None = None
+        if config.worker.sandbox_pool_size > 0:
+            self.sandbox_pool = SandboxPool(
+                shard, config.worker.sandbox_pool_size,
+                config.worker.sandbox_pool_reset)
+
+        # Number of evaluation jobs executed at the same time, each in
+        # its own job slot (see set_job_slot).
+        self.parallel_jobs = config.worker.parallel_jobs
+        max_parallel_jobs = SandboxPool.BOX_INDEX_BASE // BOXES_PER_JOB_SLOT
+        if not 1 <= self.parallel_jobs <= max_parallel_jobs:
+            raise ValueError("The number of parallel jobs must be between "
+                             "1 and %d." % max_parallel_jobs)
+
+    def run(self) -> bool:
+        """See Service.run.
+
+        The task types take their sandboxes from the pool only while
+        the worker runs.
+
+        """
+        if self.sandbox_pool is not None:
+            self.sandbox_pool.warm()
+        set_sandbox_pool(self.sandbox_pool)
+        try:
+            return Service.run(self)
+        finally:
+            set_sandbox_pool(None)
+            if self.sandbox_pool is not None:
+                self.sandbox_pool.close()
+
+    @staticmethod
+    def _files_to_precache(session: Session, contest: Contest) -> list[str]:
+        """Return the digests of the files to precache for a contest.
+
+        The files are sorted by how soon they are likely to be needed:
+        first the managers and then the testcases of the active
+        datasets, then those of the other datasets, and finally the
+        remaining files of the contest (statements, attachments, ...).
+
+        session: the session to use.
+        contest: the contest.
+
+        return: the digests, without duplicates.
+
+        """
+        tiers: list[list[str]] = [[], [], [], []]
+        for task in contest.tasks:
+            for dataset in task.datasets:
+                offset = 0 if dataset is task.active_dataset else 2
+                tiers[offset].extend(
+                    manager.digest for manager in dataset.managers.values())
+                for codename in sorted(dataset.testcases):
+                    testcase = dataset.testcases[codename]
+                    tiers[offset + 1].extend([testcase.input,
+                                              testcase.output])
+        tiers.append(sorted(enumerate_files(session,
+                                            contest,
+                                            skip_submissions=True,
+                                            skip_user_tests=True)))
+
+        digests = dict()
+        for tier in tiers:
+            for digest in tier:
+                digests[digest] = None
+        digests.pop(Digest.TOMBSTONE, None)
+        return list(digests)
+
+    def _precache_file(self, digest: str):
+        """Load a file into the cache, updating the precache status.
+
+        digest: the digest of the file.
+
+        """
+        try:
+            self.file_cacher.cache_file(digest)
+        except KeyError:
+            # No problem (at this stage) if we cannot find the file.
+            self._precache_status["missing"] += 1
+        self._precache_status["done"] += 1
+
     @rpc_method
     def precache_files(self, contest_id: int):
         """RPC to ask the worker to precache of files in the contest.
 
+        The files are downloaded PRECACHE_CONCURRENCY at a time, those
+        most likely to be needed first. Files already in the cache are
+        not downloaded again, so if the precaching is interrupted (for
+        example, because the worker was restarted) calling this again
+        resumes it.
+
         contest_id: the id of the contest
 
         """
@@ -86,24 +192,151 @@ class Worker(Service):
             logger.info("Precaching files for contest %d.", contest_id)
             with SessionGen() as session:
                 contest = Contest.get_from_id(contest_id, session)
-                files = enumerate_files(session,
-                                        contest,
-                                        skip_submissions=True,
-                                        skip_user_tests=True)
-            for digest in files:
-                try:
-                    self.file_cacher.cache_file(digest)
-                except KeyError:
-                    # No problem (at this stage) if we cannot find the
-                    # file
-                    pass
-
-            logger.info("Precaching finished.")
+                digests = self._files_to_precache(session, contest)
+
+            misses = self.file_cacher.stats["misses"]
+            self._precache_status = {
+                "contest_id": contest_id,
+                "running": True,
+                "total": len(digests),
+                "done": 0,
+                "missing": 0,
+                "downloaded": 0,
+            }
+            try:
+                pool = gevent.pool.Pool(self.PRECACHE_CONCURRENCY)
+                for _ in pool.imap_unordered(self._precache_file, digests):
+                    self._precache_status["downloaded"] = \
+                        self.file_cacher.stats["misses"] - misses
+            finally:
+                self._precache_status["running"] = False
+
+            logger.info("Precaching finished, %d files downloaded.",
+                        self._precache_status["downloaded"])
+
+    @rpc_method
+    def precache_status(self) -> dict | None:
+        """Return the progress of the precaching done by this worker.
+
+        return: None if this worker never precached files, otherwise
+            the contest, whether the precaching is still running, the
+            number of files to precache, of those processed so far,
+            of those not found and of those that were not already in
+            the cache.
+
+        """
+        if self._precache_status is None:
+            return None
+        return dict(self._precache_status)
+
+    @rpc_method
+    def sandbox_pool_status(self) -> dict | None:
+        """Return the usage of the pool of sandboxes of this worker.
+
+        return: None if the pool is disabled, otherwise its size, the
+            number of sandboxes in use and ready to be reused, how many
+            were created, reused, reset and failed to reset, and the
+            time spent creating and resetting them.
+
+        """
+        if self.sandbox_pool is None:
+            return None
+        return self.sandbox_pool.get_status()
+
+    @rpc_method
+    def job_slots(self) -> int:
+        """Return the number of jobs this worker executes at the same
+        time.
+
+        """
+        return self.parallel_jobs
+
+    def _slot_cpus(self, slot: int) -> set[int] | None:
+        """Return the CPUs the sandboxes of a job slot are pinned to.
+
+        slot: the index of the job slot.
+
+        return: the CPUs, or None if the sandboxes are not pinned.
+
+        """
+        cpus = config.worker.pinned_cpus
+        if len(cpus) == 0:
+            return None
+        return {cpus[(self.shard * self.parallel_jobs + slot) % len(cpus)]}
+
+    def _execute_job(self, job: Job, slot: int = 0):
+        """Execute a job in a job slot, storing the results in it.
+
+        job: the job.
+        slot: the index of the job slot to use.
+
+        """
+        logger.info("Starting job.", extra={"operation": job.info})
+
+        job.shard = self.shard
+        set_job_slot(slot, self._slot_cpus(slot))
+
+        if self._fake_worker_time is None:
+            task_type = get_task_type(job.task_type,
+                                      job.task_type_parameters)
+            try:
+                task_type.execute_job(job, self.file_cacher)
+            except TombstoneError:
+                job.success = False
+                job.plus = {"tombstone": True}
+        else:
+            self._fake_work(job)
+
+        logger.info("Finished job.", extra={"operation": job.info})
+
+    def _execute_jobs(self, jobs: list[Job]):
+        """Execute the jobs of a group.
+
+        Up to parallel_jobs evaluation jobs run at the same time, each
+        in a distinct job slot; the other jobs run alone.
+
+        jobs: the jobs.
+
+        raise (Exception): the exception raised by the first job that
+            failed, if any, once the jobs being executed have finished.
+
+        """
+        if self.parallel_jobs == 1:
+            for job in jobs:
+                self._execute_job(job)
+            return
+
+        pool = gevent.pool.Pool(self.parallel_jobs)
+        free_slots = list(reversed(range(self.parallel_jobs)))
+        greenlets = []
+
+        def execute_in_free_slot(job: Job):
+            slot = free_slots.pop()
+            try:
+                self._execute_job(job, slot)
+            finally:
+                free_slots.append(slot)
+
+        try:
+            for job in jobs:
+                if isinstance(job, EvaluationJob):
+                    greenlets.append(pool.spawn(execute_in_free_slot, job))
+                else:
+                    pool.join()
+                    self._execute_job(job)
+                if any(greenlet.exception is not None
+                       for greenlet in greenlets):
+                    break
+        finally:
+            pool.join()
+        for greenlet in greenlets:
+            if greenlet.exception is not None:
+                raise greenlet.exception
 
     @rpc_method
     def execute_job_group(self, job_group_dict: dict) -> dict:
-        """Receive a group of jobs in a list format and executes them one by
-        one.
+        """Receive a group of jobs in a list format and executes them,
+        up to parallel_jobs evaluations at a time.
 
         job_group_dict: a JobGroup exported to dict.
 
@@ -111,32 +344,25 @@ class Worker(Service):
             the results.
 
         """
-        start_time = time.time()
         job_group = JobGroup.import_from_dict(job_group_dict)
 
-        if self.work_lock.acquire(False):
+        acquired = self.work_lock.acquire(False)
+        if not acquired and config.worker.prefetch_batch \
+                and not self._job_group_waiting:
+            # ES sent us the next batch in advance: we start it as
+            # soon as we finish the current one.
+            logger.info("Job group received while busy, waiting.")
+            self._job_group_waiting = True
             try:
-                logger.info("Starting job group.")
-                for job in job_group.jobs:
-                    logger.info("Starting job.",
-                                extra={"operation": job.info})
-
-                    job.shard = self.shard
-
-                    if self._fake_worker_time is None:
-                        task_type = get_task_type(job.task_type,
-                                                  job.task_type_parameters)
-                        try:
-                            task_type.execute_job(job, self.file_cacher)
-                        except TombstoneError:
-                            job.success = False
-                            job.plus = {"tombstone": True}
-                    else:
-                        self._fake_work(job)
-
-                    logger.info("Finished job.",
-                                extra={"operation": job.info})
+                acquired = self.work_lock.acquire()
+            finally:
+                self._job_group_waiting = False
 
+        start_time = time.time()
+        if acquired:
+            try:
+                logger.info("Starting job group.")
+                self._execute_jobs(job_group.jobs)
                 logger.info("Finished job group.")
                 return job_group.export_to_dict()
 
@@ -160,7 +386,7 @@ class Worker(Service):
 
     def _fake_work(self, job):
         """Fill the job with fake success data after waiting for some time."""
-        time.sleep(self._fake_worker_time)
+        gevent.sleep(self._fake_worker_time)
         job.success = True
         job.text = ["ok"]
         job.plus = {
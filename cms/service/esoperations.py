@@ -46,6 +46,10 @@ MAX_EVALUATION_TRIES = 3
 MAX_USER_TEST_COMPILATION_TRIES = 3
 MAX_USER_TEST_EVALUATION_TRIES = 3
 
+# Number of rows fetched at a time from the server-side cursors used
+# when looking for missing operations.
+SWEEP_BATCH_SIZE = 1000
+
 
 FILTER_SUBMISSION_DATASETS_TO_JUDGE = (
     (Dataset.id == Task.active_dataset_id) |
@@ -301,30 +305,42 @@ def get_relevant_operations(
 
 
 def get_submissions_operations(
-    session: Session, contest_id: int | None = None
-) -> list[tuple["ESOperation", int, datetime]]:
-    """Return all the operations to do for submissions in the contest.
+    session: Session,
+    contest_id: int | None = None,
+    min_submission_id: int | None = None,
+) -> Generator[tuple["ESOperation", int, datetime]]:
+    """Generate all the operations to do for submissions in the contest.
+
+    The rows are streamed from the database through server-side
+    cursors, so the operations are never all held in memory at once.
 
     session: the database session to use.
     contest_id: the contest for which we want the operations.
         If none, get operations for any contest.
+    min_submission_id: if not None, only submissions with a greater id
+        are considered when looking for missing submission results;
+        existing submission results are always considered, as they are
+        cheap to find through the partial indices on the table.
 
-    return: a list of tuples of operation, priority and timestamp.
+    yield: tuples of operation, priority and timestamp.
 
     """
-    operations = []
-
     if contest_id is None:
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
 
+    if min_submission_id is None:
+        new_submission_filter = literal(True)
+    else:
+        new_submission_filter = Submission.id > min_submission_id
+
     # Retrieve the compilation operations for all submissions without
     # the corresponding result for a dataset to judge. Since we have
     # no SubmissionResult, we cannot join regularly with dataset;
     # instead we take the cartesian product with all the datasets for
     # the correct task.
-    to_compile = session.query(Submission)\
+    to_compile_without_result = session.query(Submission)\
         .join(Submission.task)\
         .join(Task.datasets)\
         .outerjoin(SubmissionResult,
@@ -332,6 +348,7 @@ def get_submissions_operations(
                    (Submission.id == SubmissionResult.submission_id))\
         .filter(
             contest_filter &
+            new_submission_filter &
             (FILTER_SUBMISSION_DATASETS_TO_JUDGE) &
             (SubmissionResult.dataset_id.is_(None)))\
         .with_entities(Submission.id, Dataset.id,
@@ -340,11 +357,11 @@ def get_submissions_operations(
                             literal(PriorityQueue.PRIORITY_EXTRA_LOW))
                            ], else_=literal(PriorityQueue.PRIORITY_HIGH)),
                        Submission.timestamp)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
     # Retrieve all the compilation operations for submissions
     # already having a result for a dataset to judge.
-    to_compile += session.query(Submission)\
+    to_compile_with_result = session.query(Submission)\
         .join(Submission.task)\
         .join(Submission.results)\
         .join(SubmissionResult.dataset)\
@@ -360,13 +377,14 @@ def get_submissions_operations(
                             literal(PriorityQueue.PRIORITY_HIGH))
                            ], else_=literal(PriorityQueue.PRIORITY_MEDIUM)),
                        Submission.timestamp)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
-    for data in to_compile:
-        submission_id, dataset_id, priority, timestamp = data
-        operations.append((
-            ESOperation(ESOperation.COMPILATION, submission_id, dataset_id),
-            priority, timestamp))
+    for to_compile in (to_compile_without_result, to_compile_with_result):
+        for data in to_compile:
+            submission_id, dataset_id, priority, timestamp = data
+            yield ESOperation(ESOperation.COMPILATION,
+                              submission_id, dataset_id), \
+                priority, timestamp
 
     # Retrieve all the evaluation operations for a dataset to
     # judge. Again we need to pick all tuples (submission, dataset,
@@ -396,43 +414,48 @@ def get_submissions_operations(
                            ], else_=literal(PriorityQueue.PRIORITY_LOW)),
                        Submission.timestamp,
                        Testcase.codename)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
     for data in to_evaluate:
         submission_id, dataset_id, priority, timestamp, codename = data
-        operations.append((
-            ESOperation(
-                ESOperation.EVALUATION, submission_id, dataset_id, codename),
-            priority, timestamp))
-
-    return operations
+        yield ESOperation(ESOperation.EVALUATION,
+                          submission_id, dataset_id, codename), \
+            priority, timestamp
 
 
 def get_user_tests_operations(
-    session: Session, contest_id: int | None = None
-) -> list[tuple["ESOperation", int, datetime]]:
-    """Return all the operations to do for user tests in the contest.
+    session: Session,
+    contest_id: int | None = None,
+    min_user_test_id: int | None = None,
+) -> Generator[tuple["ESOperation", int, datetime]]:
+    """Generate all the operations to do for user tests in the contest.
 
     session: the database session to use.
     contest_id: the contest for which we want the operations.
         If none, get operations for any contest.
+    min_user_test_id: if not None, only user tests with a greater id
+        are considered when looking for missing user test results (see
+        get_submissions_operations).
 
-    return: a list of tuples of operation, priority and timestamp.
+    yield: tuples of operation, priority and timestamp.
 
     """
-    operations = []
-
     if contest_id is None:
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
 
+    if min_user_test_id is None:
+        new_user_test_filter = literal(True)
+    else:
+        new_user_test_filter = UserTest.id > min_user_test_id
+
     # Retrieve the compilation operations for all user tests without
     # the corresponding result for a dataset to judge. Since we have
     # no UserTestResult, we cannot join regularly with dataset;
     # instead we take the cartesian product with all the datasets for
     # the correct task.
-    to_compile = session.query(UserTest)\
+    to_compile_without_result = session.query(UserTest)\
         .join(UserTest.task)\
         .join(Task.datasets)\
         .outerjoin(UserTestResult,
@@ -440,6 +463,7 @@ def get_user_tests_operations(
                    (UserTest.id == UserTestResult.user_test_id))\
         .filter(
             contest_filter &
+            new_user_test_filter &
             (FILTER_USER_TEST_DATASETS_TO_JUDGE) &
             (UserTestResult.dataset_id.is_(None)))\
         .with_entities(UserTest.id, Dataset.id,
@@ -448,11 +472,11 @@ def get_user_tests_operations(
                             literal(PriorityQueue.PRIORITY_EXTRA_LOW))
                            ], else_=literal(PriorityQueue.PRIORITY_HIGH)),
                        UserTest.timestamp)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
     # Retrieve all the compilation operations for user_tests
     # already having a result for a dataset to judge.
-    to_compile += session.query(UserTest)\
+    to_compile_with_result = session.query(UserTest)\
         .join(UserTest.task)\
         .join(UserTest.results)\
         .join(UserTestResult.dataset)\
@@ -468,14 +492,14 @@ def get_user_tests_operations(
                             literal(PriorityQueue.PRIORITY_HIGH))
                            ], else_=literal(PriorityQueue.PRIORITY_MEDIUM)),
                        UserTest.timestamp)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
-    for data in to_compile:
-        user_test_id, dataset_id, priority, timestamp = data
-        operations.append((
-            ESOperation(ESOperation.USER_TEST_COMPILATION,
-                        user_test_id, dataset_id),
-            priority, timestamp))
+    for to_compile in (to_compile_without_result, to_compile_with_result):
+        for data in to_compile:
+            user_test_id, dataset_id, priority, timestamp = data
+            yield ESOperation(ESOperation.USER_TEST_COMPILATION,
+                              user_test_id, dataset_id), \
+                priority, timestamp
 
     # Retrieve all the evaluation operations for a dataset to judge,
     # that is, all pairs (user_test, dataset) for which we have a
@@ -496,16 +520,13 @@ def get_user_tests_operations(
                             literal(PriorityQueue.PRIORITY_MEDIUM))
                            ], else_=literal(PriorityQueue.PRIORITY_LOW)),
                        UserTest.timestamp)\
-        .all()
+        .yield_per(SWEEP_BATCH_SIZE)
 
     for data in to_evaluate:
         user_test_id, dataset_id, priority, timestamp = data
-        operations.append((
-            ESOperation(
-                ESOperation.USER_TEST_EVALUATION, user_test_id, dataset_id),
-            priority, timestamp))
-
-    return operations
+        yield ESOperation(ESOperation.USER_TEST_EVALUATION,
+                          user_test_id, dataset_id), \
+            priority, timestamp
 
 
 class ESOperation(QueueItem):
@@ -25,17 +25,20 @@
 
 """
 
+import itertools
 import logging
 import random
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 import typing
 
 import gevent.lock
 from gevent.event import Event
 
+from cms import config
 from cms.conf import ServiceCoord
 from cms.db import SessionGen
-from cms.grading.Job import JobGroup
+from cms.grading.Job import DatasetJobCache
 from cmscommon.datetime import make_datetime, make_timestamp
 from cms.service.esoperations import ESOperation
 
@@ -58,6 +61,17 @@ class WorkerPool:
     # Seconds after which we declare a worker stale.
     WORKER_TIMEOUT = timedelta(seconds=600)
 
+    # Maximum time we keep a batch of operations waiting for a busy
+    # worker that already has their files, when other workers are idle.
+    MAX_AFFINITY_WAIT = timedelta(seconds=3)
+
+    # Maximum number of affinity keys remembered for each worker.
+    MAX_AFFINITY_KEYS = 10000
+
+    # Weight of the newest observation in the moving average of the
+    # duration of operations.
+    DURATION_SMOOTHING = 0.3
+
     def __init__(self, service: "EvaluationService"):
         """
         service: the EvaluationService using this WorkerPool.
@@ -72,13 +86,37 @@ class WorkerPool:
         # operations are also discarded because we already re-assigned
         # it. Ignore is true if the next results coming from the
         # worker should be discarded. Operations is the list of
-        # operations currently executing. Operations to ignore is the
-        # list of operations to ignore in the next batch of results.
+        # operations currently assigned to the worker, and batches
+        # splits them in the batches sent to the worker, in order
+        # (there are two of them if the worker has a prefetched
+        # batch), each with its ID. Operations to ignore is the list of operations
+        # whose results are to be ignored. Start time is the time
+        # the worker started executing the first batch.
         self._operations: dict[int, list[ESOperation]] = {}
+        self._batches: dict[int, deque[tuple[int, list[ESOperation]]]] = {}
+        # Source of the IDs of the batches, which are sent to the
+        # workers with the batches to know which one finished.
+        self._batch_ids = itertools.count()
         self._operations_to_ignore: dict[int, list[ESOperation]] = {}
         self._start_time: dict[int, datetime | None] = {}
         self._schedule_disabling: dict[int, bool] = {}
         self._ignore: dict[int, bool] = {}
+        # The affinity keys (see _affinity_keys) of the operations
+        # recently sent to each worker, in least recently used order.
+        # They tell us which executables and testcases the worker is
+        # likely to have in its file cache.
+        self._affinity: dict[int, OrderedDict[tuple, None]] = {}
+
+        # Whether to send a second batch to busy workers, so that
+        # they can start it as soon as they finish the current one.
+        self._prefetch = config.worker.prefetch_batch
+
+        # The dataset data needed to build the jobs.
+        self._job_cache = DatasetJobCache()
+
+        # Moving average of the time (in seconds) taken by an
+        # operation, indexed by type and dataset of the operation.
+        self._durations: dict[tuple[str, int], float] = {}
 
         # TODO: given the number of pieces data associated to each
         # worker, this class could be simplified by creating a new
@@ -88,6 +126,10 @@ class WorkerPool:
         # checks cannot be excluded. A refactoring of this class
         # should take that into account.
 
+        # Number of evaluations each worker executes at the same time,
+        # as the worker tells us when it connects.
+        self._job_slots: dict[int, int] = {}
+
         # A reverse lookup dictionary mapping operations to shards.
         self._operations_reverse: dict[ESOperation, int] = {}
 
@@ -118,27 +160,183 @@ class WorkerPool:
         with self._operation_lock:
             operations = self._operations[shard]
             self._operations[shard] = new_operation
+            self._batches[shard].clear()
             if isinstance(operations, list):
                 for operation in operations:
                     del self._operations_reverse[operation]
 
-    def _add_operations(self, shard: int, operations: list[ESOperation]):
-        """Assigns new operations to a currently inactive worker.
+    def _find_batch(self, shard: int, batch_id: int | None) -> int | None:
+        """Return the position of a batch among those of a worker.
+
+        shard: the worker.
+        batch_id: the ID of the batch, or None for the first one.
+
+        return: the position of the batch, or None if the worker has
+            no such batch.
+
+        """
+        for index, (id_, _) in enumerate(self._batches[shard]):
+            if batch_id is None or id_ == batch_id:
+                return index
+        return None
+
+    def _remove_batch(self, shard: int, index: int) -> list[ESOperation]:
+        """Safely remove a batch of operations from a worker that has
+        another batch assigned.
+
+        shard: the worker from which to remove operations.
+        index: the position of the batch among those of the worker.
+
+        return: the operations removed.
+
+        """
+        with self._operation_lock:
+            _, batch = self._batches[shard][index]
+            del self._batches[shard][index]
+            self._operations[shard] = [operation
+                                       for operation in self._operations[shard]
+                                       if operation not in batch]
+            for operation in batch:
+                del self._operations_reverse[operation]
+        return batch
+
+    def _add_operations(
+        self, shard: int, operations: list[ESOperation]
+    ) -> int:
+        """Assigns new operations to a currently inactive worker, or
+        to a worker that can receive a prefetched batch.
 
         shard: shard of the worker.
         operations: operations to assign to the worker.
 
+        return: the ID of the new batch.
+
         """
-        if self._operations[shard] != WorkerPool.WORKER_INACTIVE:
+        if self._operations[shard] != WorkerPool.WORKER_INACTIVE \
+                and not self._can_prefetch(shard):
             raise ValueError("Shard %s is already doing an operation.", shard)
         with self._operation_lock:
-            self._operations[shard] = operations
+            if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
+                self._operations[shard] = list(operations)
+            else:
+                self._operations[shard] = \
+                    self._operations[shard] + list(operations)
+            batch_id = next(self._batch_ids)
+            self._batches[shard].append((batch_id, list(operations)))
             for operation in operations:
                 self._operations_reverse[operation] = shard
+        return batch_id
+
+    def _can_prefetch(self, shard: int) -> bool:
+        """Return whether the worker can receive a prefetched batch.
+
+        shard: the worker.
+
+        return: True if prefetching is enabled and the worker is
+            executing exactly one batch which we are not going to
+            discard.
+
+        """
+        return (self._prefetch
+                and isinstance(self._operations[shard], list)
+                and len(self._batches[shard]) == 1
+                and not self._schedule_disabling[shard]
+                and not self._ignore[shard])
+
+    @staticmethod
+    def _duration_key(operation: ESOperation) -> tuple[str, int]:
+        return (operation.type_, operation.dataset_id)
+
+    @staticmethod
+    def _parallel_operations(operations: list[ESOperation],
+                             job_slots: int) -> int:
+        """Return how many operations of a batch a worker executes at
+        the same time.
+
+        operations: the operations of the batch.
+        job_slots: the number of job slots of the worker.
+
+        return: the number of job slots the batch keeps busy (only
+            evaluations run in parallel).
+
+        """
+        if any(operation.type_ != ESOperation.EVALUATION
+               for operation in operations):
+            return 1
+        return max(min(job_slots, len(operations)), 1)
+
+    def _record_durations(self, operations: list[ESOperation],
+                          elapsed: timedelta, job_slots: int = 1):
+        """Update the moving averages of the operations' durations.
+
+        We only know how long the whole batch took, so each operation
+        in the batch is assumed to have taken the same time. The
+        durations are those of an operation running in a single job
+        slot: a worker with several of them executes several
+        evaluations of the batch at the same time.
+
+        operations: the operations of a batch that just finished.
+        elapsed: how long the worker took to execute them.
+        job_slots: the number of job slots of the worker.
+
+        """
+        if len(operations) == 0:
+            return
+        duration = elapsed.total_seconds() \
+            * WorkerPool._parallel_operations(operations, job_slots) \
+            / len(operations)
+        alpha = WorkerPool.DURATION_SMOOTHING
+        for key in {WorkerPool._duration_key(operation)
+                    for operation in operations}:
+            if key in self._durations:
+                self._durations[key] = \
+                    alpha * duration + (1 - alpha) * self._durations[key]
+            else:
+                self._durations[key] = duration
+
+    def expected_duration(self, operation: ESOperation) -> float | None:
+        """Return how long we expect the operation to take.
+
+        operation: the operation.
+
+        return: the average duration (in seconds) of the operations
+            with the same type and dataset, or None if we have not
+            executed any yet.
+
+        """
+        return self._durations.get(WorkerPool._duration_key(operation))
+
+    def max_job_slots(self) -> int:
+        """Return the largest number of job slots of a connected worker.
+
+        """
+        return max((self._job_slots[shard]
+                    for shard, worker in self._worker.items()
+                    if worker.connected), default=1)
+
+    def _set_job_slots(self, data: int | None, shard: int,
+                       error: str | None = None):
+        """Store the number of job slots of a worker.
+
+        data: the number of job slots, as returned by the worker.
+        shard: the worker.
+        error: the error of the call, if any (for example because the
+            worker does not support parallel jobs).
 
-    def wait_for_workers(self):
-        """Wait until a worker might be available."""
-        self._workers_available_event.wait()
+        """
+        if error is not None or not isinstance(data, int) or data < 1:
+            data = 1
+        self._job_slots[shard] = data
+        logger.info("Worker %s has %d job slots.", shard, data)
+
+    def wait_for_workers(self, timeout: float | None = None):
+        """Wait until a worker might be available.
+
+        timeout: maximum time to wait in seconds, or None to wait
+            indefinitely.
+
+        """
+        self._workers_available_event.wait(timeout)
 
     def add_worker(self, worker_coord: ServiceCoord):
         """Add a new worker to the worker pool.
@@ -154,10 +352,13 @@ class WorkerPool:
 
         # And we fill all data.
         self._operations[shard] = WorkerPool.WORKER_INACTIVE
+        self._batches[shard] = deque()
         self._operations_to_ignore[shard] = []
         self._start_time[shard] = None
         self._schedule_disabling[shard] = False
         self._ignore[shard] = False
+        self._affinity[shard] = OrderedDict()
+        self._job_slots[shard] = 1
         self._workers_available_event.set()
         logger.debug("Worker %s added.", shard)
 
@@ -172,6 +373,11 @@ class WorkerPool:
         """
         shard = worker_coord.shard
         logger.info("Worker %s online again.", shard)
+        # The worker might have been restarted with an empty cache, or
+        # with a different number of job slots.
+        self._affinity[shard].clear()
+        self._worker[shard].job_slots(callback=self._set_job_slots,
+                                      plus=shard)
         if self._service.contest_id is not None:
             self._worker[shard].precache_files(
                 contest_id=self._service.contest_id
@@ -183,35 +389,155 @@ class WorkerPool:
         # so we wake up the consumers.
         self._workers_available_event.set()
 
-    def acquire_worker(self, operations: list[ESOperation]) -> int | None:
+    @staticmethod
+    def _affinity_keys(operation: ESOperation) -> list[tuple]:
+        """Return the keys identifying the files needed by an operation.
+
+        Workers that already executed operations with the same keys
+        have these files in their cache. The executable of a submission
+        or user test is identified by the object and the dataset (and
+        it is in the cache of the worker that compiled it, too), a
+        testcase by the dataset and its codename.
+
+        operation: the operation.
+
+        return: the affinity keys of the operation.
+
+        """
+        keys: list[tuple] = [("executable", operation.for_submission(),
+                              operation.object_id, operation.dataset_id)]
+        if operation.type_ == ESOperation.EVALUATION:
+            keys.append(("testcase", operation.dataset_id,
+                         operation.testcase_codename))
+        return keys
+
+    def _affinity_score(self, shard: int, operations: list[ESOperation]) -> int:
+        """Return how many of the files needed by the operations the
+        worker is likely to have in its cache.
+
+        shard: the worker.
+        operations: the operations to assign.
+
+        return: the number of affinity keys of the operations that
+            were sent to the worker recently.
+
+        """
+        affinity = self._affinity[shard]
+        return sum(1
+                   for operation in operations
+                   for key in WorkerPool._affinity_keys(operation)
+                   if key in affinity)
+
+    def _record_affinity(self, shard: int, operations: list[ESOperation]):
+        """Remember that the worker received the files for the
+        operations.
+
+        shard: the worker.
+        operations: the operations assigned to the worker.
+
+        """
+        affinity = self._affinity[shard]
+        for operation in operations:
+            for key in WorkerPool._affinity_keys(operation):
+                affinity[key] = None
+                affinity.move_to_end(key)
+        while len(affinity) > WorkerPool.MAX_AFFINITY_KEYS:
+            affinity.popitem(last=False)
+
+    def _choose_worker(
+        self, operations: list[ESOperation], wait_for_affinity: bool
+    ) -> int | None:
+        """Choose the worker to assign the operations to.
+
+        We prefer the idle workers which are likely to have in their
+        cache the most files needed by the operations, choosing at
+        random among the best ones. If no idle worker has any of them
+        but a busy one does, we might prefer to prefetch the batch on
+        it, or to wait for it. If no worker is idle, we prefetch the
+        batch on a busy worker, if enabled.
+
+        operations: the operations to assign.
+        wait_for_affinity: whether to return None instead of an idle
+            worker without any of the files, if a busy worker has some.
+
+        return: the chosen worker, or None if we should wait.
+
+        raise (LookupError): if no worker is available.
+
+        """
+        scores: dict[int, int] = {}
+        prefetch_scores: dict[int, int] = {}
+        busy_with_affinity = False
+        for shard, worker_operations in self._operations.items():
+            if not self._worker[shard].connected:
+                continue
+            if worker_operations == WorkerPool.WORKER_INACTIVE:
+                scores[shard] = self._affinity_score(shard, operations)
+            elif isinstance(worker_operations, list) \
+                    and not self._schedule_disabling[shard]:
+                score = self._affinity_score(shard, operations)
+                busy_with_affinity = busy_with_affinity or score > 0
+                if self._can_prefetch(shard):
+                    prefetch_scores[shard] = score
+
+        if len(scores) == 0:
+            if len(prefetch_scores) == 0:
+                raise LookupError("No available worker.")
+            scores = prefetch_scores
+
+        best_score = max(scores.values())
+        if best_score == 0 and busy_with_affinity:
+            if max(prefetch_scores.values(), default=0) > 0:
+                scores = prefetch_scores
+                best_score = max(scores.values())
+            elif wait_for_affinity:
+                logger.debug("Waiting for a busy worker with affinity for "
+                             "`%s'.", operations[0])
+                return None
+        return random.choice([shard for shard, score in scores.items()
+                              if score == best_score])
+
+    def acquire_worker(
+        self, operations: list[ESOperation], wait_for_affinity: bool = False
+    ) -> int | None:
         """Tries to assign an operation to an available worker. If no workers
         are available then this returns None, otherwise this returns
         the chosen worker.
 
         operations: the operations to assign to a worker.
+        wait_for_affinity: whether we prefer to wait for a busy worker
+            that is likely to have the files needed by the operations,
+            rather than using an idle worker without any of them.
 
-        return: None if no workers are available, the worker
-            assigned to the operation otherwise.
+        return: None if no workers are available (or if we decided
+            to wait for a specific one), the worker assigned to the
+            operation otherwise.
 
         """
         # We look for an available worker.
         try:
-            shard = self.find_worker(WorkerPool.WORKER_INACTIVE,
-                                     require_connection=True,
-                                     random_worker=True)
+            shard = self._choose_worker(operations, wait_for_affinity)
         except LookupError:
+            shard = None
+        if shard is None:
             self._workers_available_event.clear()
             return None
 
-        # Then we fill the info for future memory.
-        self._add_operations(shard, operations)
+        # Then we fill the info for future memory. A prefetched batch
+        # starts when the worker finishes the current one.
+        prefetched = self._operations[shard] != WorkerPool.WORKER_INACTIVE
+        batch_id = self._add_operations(shard, operations)
+        self._record_affinity(shard, operations)
 
-        logger.debug("Worker %s acquired.", shard)
-        self._start_time[shard] = make_datetime()
+        if prefetched:
+            logger.debug("Worker %s acquired for a prefetched batch.", shard)
+        else:
+            logger.debug("Worker %s acquired.", shard)
+            self._start_time[shard] = make_datetime()
 
         with SessionGen() as session:
             job_group_dict = \
-                JobGroup.from_operations(operations, session).export_to_dict()
+                self._job_cache.export_job_group(operations, session)
 
         logger.info("Asking worker %s to %s.", shard,
                     ", ".join("`%s'" % operation for operation in operations))
@@ -219,10 +545,13 @@ class WorkerPool:
         self._worker[shard].execute_job_group(
             job_group_dict=job_group_dict,
             callback=self._service.action_finished,
-            plus=shard)
+            plus=(shard, batch_id))
         return shard
 
-    def release_worker(self, shard: int) -> bool | list[ESOperation]:
+    def release_worker(
+        self, shard: int, all_batches: bool = False,
+        batch_id: int | None = None
+    ) -> bool | list[ESOperation]:
         """To be called by ES when it receives a notification that an
         operation finished.
 
@@ -231,35 +560,79 @@ class WorkerPool:
         by the worker.
 
         shard: the worker to release.
+        all_batches: whether to release also the prefetched batch (if
+            any), instead of only the one the worker was executing.
+        batch_id: the ID of the batch that finished (as sent to the
+            worker), or None for the one the worker was executing.
 
         return: if boolean, whether the result is to be ignored; if a list,
             the list of operation for which the results should be ignored.
 
         """
-        if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
-            err_msg = "Trying to release worker while it's inactive."
-            logger.error(err_msg)
-            raise ValueError(err_msg)
-
         # If the worker has already been disabled, ignore the result
         # and keep the worker disabled.
         if self._operations[shard] == WorkerPool.WORKER_DISABLED:
             return True
 
+        # The batches don't necessarily finish in order: the call for
+        # the prefetched one might fail while the first one is running.
+        index = self._find_batch(shard, batch_id)
+        if index is None and batch_id is not None:
+            logger.warning("Ignoring result of unknown batch %s of "
+                           "worker %s.", batch_id, shard)
+            return True
+
+        if self._operations[shard] == WorkerPool.WORKER_INACTIVE:
+            err_msg = "Trying to release worker while it's inactive."
+            logger.error(err_msg)
+            raise ValueError(err_msg)
+
+        now = make_datetime()
         ret = self._ignore[shard]
+        running = index == 0
+        release_all = all_batches or self._schedule_disabling[shard] \
+            or len(self._batches[shard]) <= 1
         with self._operation_lock:
-            to_ignore = self._operations_to_ignore[shard]
-            self._operations_to_ignore[shard] = []
-        self._start_time[shard] = None
-        self._ignore[shard] = False
+            if release_all:
+                batch = self._operations[shard]
+            else:
+                batch = self._batches[shard][index][1]
+            to_ignore = [operation
+                         for operation in self._operations_to_ignore[shard]
+                         if operation in batch]
+            self._operations_to_ignore[shard] = [
+                operation for operation in self._operations_to_ignore[shard]
+                if operation not in batch]
+        if ret is False and running and self._start_time[shard] is not None:
+            self._record_durations(self._batches[shard][0][1],
+                                   now - self._start_time[shard],
+                                   self._job_slots[shard])
         if self._schedule_disabling[shard]:
+            self._start_time[shard] = None
+            self._ignore[shard] = False
             self._remove_operations(shard, WorkerPool.WORKER_DISABLED)
             self._schedule_disabling[shard] = False
             logger.info("Worker %s released and disabled.", shard)
-        else:
+        elif release_all:
+            self._start_time[shard] = None
+            self._ignore[shard] = False
             self._remove_operations(shard, WorkerPool.WORKER_INACTIVE)
             self._workers_available_event.set()
             logger.debug("Worker %s released.", shard)
+        elif running:
+            # The worker starts the prefetched batch right away, and
+            # can receive a new one.
+            self._remove_batch(shard, index)
+            self._start_time[shard] = now
+            self._workers_available_event.set()
+            logger.debug("Worker %s released from its first batch.", shard)
+        else:
+            # The prefetched batch was lost, the worker is still
+            # executing the first one and can receive a new one.
+            self._remove_batch(shard, index)
+            self._workers_available_event.set()
+            logger.debug("Worker %s released from its prefetched batch.",
+                         shard)
         if ret is False and to_ignore != []:
             return to_ignore
         else:
@@ -322,9 +695,9 @@ class WorkerPool:
         """Returns a dict with info about the current status of all
         workers.
 
-        return: dict of info: current operation, starting time,
-            number of errors, and additional data specified in the
-            operation.
+        return: dict of info: current operations, prefetched
+            operations, starting time, number of job slots, number of
+            errors, and additional data specified in the operation.
 
         """
         result = dict()
@@ -332,13 +705,23 @@ class WorkerPool:
             s_time = self._start_time[shard]
             s_time = make_timestamp(s_time) if s_time is not None else None
 
+            if isinstance(self._operations[shard], list):
+                batches = [batch for _, batch in self._batches[shard]]
+                operations = [operation.to_dict()
+                              for operation in batches[0]]
+                prefetched_operations = [operation.to_dict()
+                                         for batch in batches[1:]
+                                         for operation in batch]
+            else:
+                operations = self._operations[shard]
+                prefetched_operations = []
+
             result["%d" % shard] = {
                 'connected': self._worker[shard].connected,
-                'operations': [operation.to_dict()
-                               for operation in self._operations[shard]]
-                if isinstance(self._operations[shard], list)
-                else self._operations[shard],
-                'start_time': s_time}
+                'operations': operations,
+                'prefetched_operations': prefetched_operations,
+                'start_time': s_time,
+                'job_slots': self._job_slots[shard]}
         return result
 
     def check_timeouts(self) -> list[ESOperation]:
@@ -463,6 +846,6 @@ class WorkerPool:
                         WorkerPool.WORKER_INACTIVE]:
                 if not self._ignore[shard]:
                     lost_operations += self._operations[shard]
-                self.release_worker(shard)
+                self.release_worker(shard, all_batches=True)
 
         return lost_operations
@@ -25,7 +25,7 @@ from weakref import WeakSet
 from gevent import Timeout
 from gevent.pywsgi import WSGIHandler
 from gevent.queue import Queue, Empty
-from werkzeug.exceptions import NotAcceptable
+from werkzeug.exceptions import HTTPException, NotAcceptable
 from werkzeug.wrappers import Request
 
 
@@ -232,6 +232,25 @@ class EventSource:
         """
         self._pub.put(event, data)
 
+    def get_subscriber(
+        self, request: Request, last_event_id: str | None
+    ) -> Subscriber:
+        """Return the subscriber for the events to send on a request.
+
+        Intended for subclasses that send different events to
+        different clients, or that restrict who can receive them. It
+        is called before the response is started, so it can refuse
+        the request by raising a werkzeug HTTPException.
+
+        request: the request of the client.
+        last_event_id: the ID of the last event the client received,
+            if given (see Publisher.get_subscriber).
+
+        return: a subscriber.
+
+        """
+        return self._pub.get_subscriber(last_event_id)
+
     def __call__(self, environ, start_response):
         """Execute this instance as a WSGI application.
 
@@ -298,14 +317,36 @@ class EventSource:
         if request.accept_mimetypes.quality("text/event-stream") <= 0:
             return NotAcceptable()(environ, start_response)
 
+        # As for the Server-Sent Events [1] spec., this is the way for
+        # the client to tell us the ID of the last event it received
+        # and to ask us to send it the ones that happened since then.
+        # [1] http://www.w3.org/TR/eventsource/
+        # The spec. requires implementations to retry the connection
+        # when it fails, adding the "Last-Event-ID" HTTP header. But in
+        # case of an error they stop, and we have to (manually) delete
+        # the EventSource and create a new one. To obtain that behavior
+        # again we give the "last_event_id" as a URL query parameter
+        # (with lower priority, to have the header override it).
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id is None:
+            last_event_id = request.args.get("last_event_id")
+
+        # We subscribe to the publisher to receive events.
+        try:
+            sub = self.get_subscriber(request, last_event_id)
+        except HTTPException as exc:
+            return exc(environ, start_response)
+
         # Initialize the response and get the write() callback. The
         # Cache-Control header is useless for conforming clients, as
         # the spec. already imposes that behavior on them, but we set
         # it explicitly to avoid unwanted caching by unaware proxies and
-        # middlewares.
+        # middlewares. The X-Accel-Buffering header asks nginx not to
+        # buffer the response even when proxy_buffering is on.
         write = start_response(
             "200 OK", [("Content-Type", "text/event-stream; charset=utf-8"),
-                       ("Cache-Control", "no-cache")])
+                       ("Cache-Control", "no-cache"),
+                       ("X-Accel-Buffering", "no")])
 
         # This is a part of the fourth hack (see above).
         if hasattr(start_response, "__self__") and \
@@ -332,23 +373,6 @@ class EventSource:
         else:
             one_shot = False
 
-        # As for the Server-Sent Events [1] spec., this is the way for
-        # the client to tell us the ID of the last event it received
-        # and to ask us to send it the ones that happened since then.
-        # [1] http://www.w3.org/TR/eventsource/
-        # The spec. requires implementations to retry the connection
-        # when it fails, adding the "Last-Event-ID" HTTP header. But in
-        # case of an error they stop, and we have to (manually) delete
-        # the EventSource and create a new one. To obtain that behavior
-        # again we give the "last_event_id" as a URL query parameter
-        # (with lower priority, to have the header override it).
-        last_event_id = request.headers.get("Last-Event-ID")
-        if last_event_id is None:
-            last_event_id = request.args.get("last_event_id")
-
-        # We subscribe to the publisher to receive events.
-        sub = self._pub.get_subscriber(last_event_id)
-
         # Send some data down the pipe. We need that to make the user
         # agent announces the connection (see the spec.). Since it's a
         # comment it will be ignored.
@@ -125,4 +125,10 @@ CREATE INDEX ix_spoilers_task_id ON spoilers USING btree (task_id);
 ALTER TABLE spoilers ADD CONSTRAINT spoilers_task_id_fkey FOREIGN KEY (task_id)
     REFERENCES tasks(id) ON UPDATE CASCADE ON DELETE CASCADE;
 
+-- Partial indices for the EvaluationService sweep
+CREATE INDEX ix_submission_results_to_compile ON submission_results USING btree (dataset_id) WHERE (compilation_outcome IS NULL);
+CREATE INDEX ix_submission_results_to_evaluate ON submission_results USING btree (dataset_id) WHERE ((compilation_outcome = 'ok') AND (evaluation_outcome IS NULL));
+CREATE INDEX ix_user_test_results_to_compile ON user_test_results USING btree (dataset_id) WHERE (compilation_outcome IS NULL);
+CREATE INDEX ix_user_test_results_to_evaluate ON user_test_results USING btree (dataset_id) WHERE ((compilation_outcome = 'ok') AND (evaluation_outcome IS NULL));
+
 COMMIT;
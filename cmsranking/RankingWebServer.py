@@ -19,6 +19,7 @@
 import argparse
 import atexit
 import functools
+import gzip
 import importlib.resources
 import json
 import logging
@@ -28,7 +29,7 @@ import re
 import shutil
 import signal
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 
 import gevent
 from gevent.pywsgi import WSGIServer
@@ -328,55 +329,159 @@ class SubListHandler:
         return response(environ, start_response)
 
 
+class JSONSnapshot:
+    """A JSON document served as it is to many clients.
+
+    It is encoded (and compressed) once, and then served with the
+    headers that allow clients to revalidate their copy.
+
+    """
+    # Bodies smaller than this are not worth compressing.
+    GZIP_MIN_SIZE = 1024
+
+    def __init__(self, data: object, etag: str):
+        self.body = json.dumps(data).encode('utf-8')
+        self.gzipped_body = gzip.compress(self.body) \
+            if len(self.body) >= self.GZIP_MIN_SIZE else None
+        self.etag = etag
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def make_response(self, request: Request) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.mimetype = "application/json"
+        response.set_etag(self.etag)
+        response.last_modified = self.last_modified
+        response.vary.add("Accept-Encoding")
+        if self.gzipped_body is not None and \
+                request.accept_encodings["gzip"] > 0:
+            response.content_encoding = "gzip"
+            response.data = self.gzipped_body
+        else:
+            response.data = self.body
+        return response.make_conditional(request)
+
+
 class HistoryHandler:
+    """Serve the global history of score changes.
+
+    A client can ask only for the changes that follow the ones it
+    already has, by passing as the since parameter the value of the
+    History-Position header of its last response. The entries in the
+    response replace the ones the client has from the position given
+    in the History-Offset header on, which is 0 (i.e., the whole
+    history is sent) if the history was changed other than by
+    appending entries to it.
+
+    """
+
+    # How many of the responses to incremental requests to keep.
+    MAX_CACHED_INCREMENTS = 64
 
     def __init__(self, stores: dict[str, Store]):
         self.scoring_store: ScoringStore = stores["scoring"]
 
+        # Distinguishes the positions in the history of this process
+        # from the ones of previous runs.
+        self._instance = "%x" % time.time_ns()
+        # The position the cached responses are for, and the responses
+        # (by offset).
+        self._position: tuple[int, int] | None = None
+        self._snapshots: dict[int, JSONSnapshot] = dict()
+
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)
 
+    def _get_snapshot(self, offset: int) -> tuple[JSONSnapshot, str]:
+        history = self.scoring_store.get_global_history()
+        position = (self.scoring_store.history_epoch, len(history))
+        if position != self._position:
+            self._position = position
+            self._snapshots.clear()
+        token = "%s.%d.%d" % (self._instance, *position)
+        if offset not in self._snapshots:
+            if len(self._snapshots) >= self.MAX_CACHED_INCREMENTS:
+                self._snapshots.clear()
+            self._snapshots[offset] = JSONSnapshot(
+                history[offset:], "%s.%d" % (token, offset))
+        return self._snapshots[offset], token
+
     def wsgi_app(self, environ, start_response):
         request = Request(environ)
 
         if request.accept_mimetypes.quality("application/json") <= 0:
             raise NotAcceptable()
 
-        result = list(self.scoring_store.get_global_history())
-
-        response = Response()
-        response.status_code = 200
-        response.mimetype = "application/json"
-        response.data = json.dumps(result)
+        offset = 0
+        since = request.args.get("since")
+        if since is not None:
+            match = re.match(r"^([0-9a-f]+)\.([0-9]+)\.([0-9]+)$", since)
+            if match is None:
+                return BadRequest()(environ, start_response)
+            epoch, length = int(match.group(2)), int(match.group(3))
+            history = self.scoring_store.get_global_history()
+            if match.group(1) == self._instance and \
+                    epoch == self.scoring_store.history_epoch and \
+                    length <= len(history):
+                offset = length
+
+        snapshot, token = self._get_snapshot(offset)
+        response = snapshot.make_response(request)
+        response.headers['History-Position'] = token
+        response.headers['History-Offset'] = "%d" % offset
 
         return response(environ, start_response)
 
 
 class ScoreHandler:
+    """Serve the current (positive) scores of all users.
+
+    The scores are kept up to date by the callbacks of the scoring
+    store, and encoded again only when asked for after a change.
+
+    """
 
     def __init__(self, stores: dict[str, Store]):
         self.scoring_store: ScoringStore = stores["scoring"]
 
+        # The response is cached until the scores change; the instance
+        # distinguishes the versions of this process from the ones of
+        # previous runs.
+        self._instance = "%x" % time.time_ns()
+        self._version = 0
+        self._snapshot: JSONSnapshot | None = None
+
+        self._scores: dict[str, dict[str, float]] = dict()
+        for u_id, tasks in self.scoring_store._scores.items():
+            for t_id, score in tasks.items():
+                self.score_callback(u_id, t_id, score.get_score())
+        self.scoring_store.add_score_callback(self.score_callback)
+
     def __call__(self, environ, start_response):
         return self.wsgi_app(environ, start_response)
 
+    def score_callback(self, user: str, task: str, score: float):
+        if score > 0.0:
+            self._scores.setdefault(user, dict())[task] = score
+        elif task in self._scores.get(user, ()):
+            del self._scores[user][task]
+            if len(self._scores[user]) == 0:
+                del self._scores[user]
+        self._snapshot = None
+
     def wsgi_app(self, environ, start_response):
         request = Request(environ)
 
         if request.accept_mimetypes.quality("application/json") <= 0:
             raise NotAcceptable()
 
-        result: dict[str, dict[str, float]] = dict()
-        for u_id, tasks in self.scoring_store._scores.items():
-            for t_id, score in tasks.items():
-                if score.get_score() > 0.0:
-                    result.setdefault(u_id, dict())[t_id] = score.get_score()
+        if self._snapshot is None:
+            self._version += 1
+            self._snapshot = JSONSnapshot(
+                self._scores, "%s.%d" % (self._instance, self._version))
 
-        response = Response()
-        response.status_code = 200
+        response = self._snapshot.make_response(request)
         response.headers['Timestamp'] = "%0.6f" % time.time()
-        response.mimetype = "application/json"
-        response.data = json.dumps(result)
 
         return response(environ, start_response)
 
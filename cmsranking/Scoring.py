@@ -19,11 +19,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 from collections.abc import Callable, Generator
+from contextlib import contextmanager
 import heapq
 import logging
 from itertools import zip_longest
-from typing import Any
+from typing import Any, NamedTuple
 
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
@@ -66,6 +68,17 @@ class NumberSet:
         del self._impl[:]
 
 
+class _Checkpoint(NamedTuple):
+    """What a change overwrote, to be able to undo it."""
+    score: float
+    token: bool
+    extra: list[str]
+    last: Submission | None
+    history_length: int
+    maxima: list[float] | None
+    submissions_version: int
+
+
 class Score:
     """The score of a user for a task.
 
@@ -85,8 +98,15 @@ class Score:
         # The submissions in their current status.
         self._submissions: dict[str, Submission] = dict()
 
-        # The list of changes of the submissions.
+        # The list of changes of the submissions, sorted by time and
+        # key, and the changes by key.
         self._changes: list[Subchange] = list()
+        self._changes_by_key: dict[str, Subchange] = dict()
+
+        # For each applied change, what it overwrote. Changes that
+        # come after a modified one are undone using these, and then
+        # applied again, instead of replaying the whole history.
+        self._checkpoints: list[_Checkpoint] = list()
 
         # The set of the scores of the currently released submissions.
         self._released = NumberSet()
@@ -94,43 +114,101 @@ class Score:
         # The last submitted submission (with at least one subchange).
         self._last: Submission | None = None
 
+        # For each subtask, the maximum score among the submissions
+        # (in max and max-subtask score modes, the former having a
+        # single "subtask"), or None if it has to be recomputed.
+        self._maxima: list[float] | None = None
+        # Incremented when the set of submissions or the score mode
+        # change, which makes the maxima saved in the checkpoints
+        # stale.
+        self._submissions_version = 0
+
         # The history of score changes (the actual "output" of this
         # object).
         self._history: list[tuple[int, float]] = list()
 
         self._score_mode: str = score_mode
 
+        # Whether the changes are being batched: then they are applied
+        # only when the batch ends.
+        self._batching = False
+
+    @staticmethod
+    def _sort_key(change: Subchange) -> tuple[int, str]:
+        return change.time, change.key
+
+    def _subtask_scores(self, submission: Submission) -> list[float]:
+        if self._score_mode == SCORE_MODE_MAX:
+            return [submission.score]
+        return list(map(float, submission.extra or [submission.score]))
+
+    def _compute_maxima(self) -> list[float]:
+        scores_by_submission = (self._subtask_scores(s)
+                                for s in self._submissions.values())
+        scores_by_subtask = zip_longest(*scores_by_submission,
+                                        fillvalue=0.0)
+        return [max(s) for s in scores_by_subtask]
+
+    def _update_maxima(self, old_scores: list[float],
+                       new_scores: list[float]):
+        # Cheap update, unless a maximum may decrease: then they are
+        # recomputed. Missing subtasks count as 0.0, as in
+        # _compute_maxima.
+        if self._maxima is None or \
+                len(new_scores) < len(old_scores) == len(self._maxima):
+            self._maxima = None
+            return
+        for idx in range(len(self._maxima), len(new_scores)):
+            # Subtasks that no other submission has.
+            self._maxima.append(
+                0.0 if len(self._submissions) > 1 else new_scores[idx])
+        for idx, maximum in enumerate(self._maxima):
+            old = old_scores[idx] if idx < len(old_scores) else 0.0
+            new = new_scores[idx] if idx < len(new_scores) else 0.0
+            if new >= maximum:
+                self._maxima[idx] = new
+            elif old == maximum:
+                self._maxima = None
+                return
+
     def append_change(self, change: Subchange):
-        # Remove from released submission (if needed), apply changes,
-        # add back to released submissions (if needed) and check if
-        # it's the last. Compute the new score and, if it changed,
-        # append it to the history.
+        # Remember what the change is going to overwrite, remove from
+        # released submission (if needed), apply changes, add back to
+        # released submissions (if needed) and check if it's the
+        # last. Compute the new score and, if it changed, append it to
+        # the history.
         s_id = change.submission
-        if self._submissions[s_id].token:
-            self._released.remove(self._submissions[s_id].score)
+        submission = self._submissions[s_id]
+        self._checkpoints.append(_Checkpoint(
+            submission.score, submission.token, submission.extra,
+            self._last, len(self._history),
+            list(self._maxima) if self._maxima is not None else None,
+            self._submissions_version))
+        old_scores = self._subtask_scores(submission)
+        if submission.token:
+            self._released.remove(submission.score)
         if change.score is not None:
-            self._submissions[s_id].score = change.score
+            submission.score = change.score
         if change.token is not None:
-            self._submissions[s_id].token = change.token
+            submission.token = change.token
         if change.extra is not None:
-            self._submissions[s_id].extra = change.extra
-        if self._submissions[s_id].token:
-            self._released.insert(self._submissions[s_id].score)
+            submission.extra = change.extra
+        if submission.token:
+            self._released.insert(submission.score)
         if change.score is not None and \
                 (self._last is None or
-                 self._submissions[s_id].time > self._last.time):
-            self._last = self._submissions[s_id]
-
+                 submission.time > self._last.time):
+            self._last = submission
+
+        if self._score_mode in (SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK):
+            self._update_maxima(old_scores,
+                                self._subtask_scores(submission))
+            if self._maxima is None:
+                self._maxima = self._compute_maxima()
         if self._score_mode == SCORE_MODE_MAX:
-            score = max((submission.score
-                         for submission in self._submissions.values()),
-                        default=0.0)
+            score = self._maxima[0] if self._maxima else 0.0
         elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
-            scores_by_submission = (map(float, s.extra or [s.score])
-                                    for s in self._submissions.values())
-            scores_by_subtask = zip_longest(*scores_by_submission,
-                                            fillvalue=0.0)
-            score = float(sum(max(s) for s in scores_by_subtask))
+            score = float(sum(self._maxima))
         elif self._score_mode == SCORE_MODE_MAX_TOKENED_LAST:
             score = max(self._released.query(),
                         self._last.score if self._last is not None else 0.0)
@@ -143,10 +221,65 @@ class Score:
     def get_score(self) -> float:
         return self._history[-1][1] if len(self._history) > 0 else 0.0
 
+    def _rewind(self, index: int):
+        # Undo the changes from the last one down to the one at the
+        # given index (included).
+        while len(self._checkpoints) > index:
+            change = self._changes[len(self._checkpoints) - 1]
+            checkpoint = self._checkpoints.pop()
+            submission = self._submissions[change.submission]
+            if submission.token:
+                self._released.remove(submission.score)
+            submission.score = checkpoint.score
+            submission.token = checkpoint.token
+            submission.extra = checkpoint.extra
+            if submission.token:
+                self._released.insert(submission.score)
+            self._last = checkpoint.last
+            del self._history[checkpoint.history_length:]
+            if checkpoint.submissions_version == self._submissions_version:
+                self._maxima = checkpoint.maxima
+            else:
+                self._maxima = None
+
+    def _replay(self, index: int):
+        # Apply again the changes from the given index on, after they
+        # have been undone.
+        for change in self._changes[index:]:
+            self.append_change(change)
+
+    def _catch_up(self):
+        # Apply the changes that have not been applied yet, unless they
+        # are being batched.
+        if not self._batching:
+            self._replay(len(self._checkpoints))
+
+    def begin_batch(self):
+        """Stop applying changes until end_batch is called.
+
+        Changes that modify the history are then applied once, from
+        the earliest one, instead of once for each of them. Until
+        then, the score and the history are the ones of an
+        unspecified point in the past.
+
+        """
+        self._batching = True
+
+    def end_batch(self):
+        """Apply the changes received since begin_batch was called."""
+        self._batching = False
+        self._catch_up()
+
     def reset_history(self):
+        self._reset()
+        self._catch_up()
+
+    def _reset(self):
         # Delete everything except the submissions and the subchanges.
         self._last = None
         self._released.clear()
+        self._maxima = None
+        del self._checkpoints[:]
         del self._history[:]
 
         # Reset the submissions at their default value.
@@ -155,52 +288,69 @@ class Score:
             sub.token = False
             sub.extra = list()
 
-        # Append each change, one at a time.
-        for change in self._changes:
-            self.append_change(change)
-
     def create_subchange(self, key: str, subchange: Subchange):
         # Insert the subchange at the right position inside the
-        # (sorted) list and call the appropriate method (append_change
-        # or reset_history)
-        if len(self._changes) == 0 or \
-                subchange.time > self._changes[-1].time or \
-                (subchange.time == self._changes[-1].time and
-                 subchange.key > self._changes[-1].key):
+        # (sorted) list and, if it is not the last one, recompute the
+        # history from there.
+        idx = bisect.bisect_right(self._changes, self._sort_key(subchange),
+                                  key=self._sort_key)
+        self._changes_by_key[key] = subchange
+        if idx == len(self._changes):
             self._changes.append(subchange)
-            self.append_change(subchange)
+            self._catch_up()
         else:
-            for idx, val in enumerate(self._changes):
-                if subchange.time < val.time or \
-                   (subchange.time == val.time and subchange.key < val.key):
-                    self._changes.insert(idx, subchange)
-                    break
-            self.reset_history()
-            logger.info("Reset history for user '%s' and task '%s' after "
-                        "creating subchange '%s' for submission '%s'",
+            self._rewind(idx)
+            self._changes.insert(idx, subchange)
+            self._catch_up()
+            if self._batching:
+                return
+            logger.info("Recomputed history for user '%s' and task '%s' "
+                        "from change %d of %d after creating subchange "
+                        "'%s' for submission '%s'",
                         self._submissions[subchange.submission].user,
                         self._submissions[subchange.submission].task,
-                        key, subchange.submission)
+                        idx, len(self._changes), key, subchange.submission)
+
+    def _index(self, key: str) -> int:
+        # The position of the subchange with the given key in the
+        # sorted list.
+        return bisect.bisect_left(
+            self._changes, self._sort_key(self._changes_by_key[key]),
+            key=self._sort_key)
 
     def update_subchange(self, key: str, subchange: Subchange):
-        # Update the subchange inside the (sorted) list and,
-        # regardless of its position in that list, reset the history.
-        for i in range(len(self._changes)):
-            if self._changes[i].key == key:
-                self._changes[i] = subchange
-        self.reset_history()
-        logger.info("Reset history for user '%s' and task '%s' after "
-                    "creating subchange '%s' for submission '%s'",
+        # Move the subchange to its new position inside the (sorted)
+        # list and recompute the history from the earliest of the old
+        # and new positions.
+        old_idx = self._index(key)
+        idx = min(old_idx, bisect.bisect_right(
+            self._changes, self._sort_key(subchange), key=self._sort_key))
+        self._rewind(idx)
+        del self._changes[old_idx]
+        self._changes_by_key[key] = subchange
+        bisect.insort_right(self._changes, subchange, key=self._sort_key)
+        self._catch_up()
+        if self._batching:
+            return
+        logger.info("Recomputed history for user '%s' and task '%s' "
+                    "from change %d of %d after updating subchange '%s' "
+                    "for submission '%s'",
                     self._submissions[subchange.submission].user,
                     self._submissions[subchange.submission].task,
-                    key, subchange.submission)
+                    idx, len(self._changes), key, subchange.submission)
 
     def delete_subchange(self, key: str):
-        # Delete the subchange from the (sorted) list and reset the
-        # history.
-        self._changes = [c for c in self._changes if c.key != key]
-        self.reset_history()
-        logger.info("Reset history after deleting subchange '%s'", key)
+        # Delete the subchange from the (sorted) list and recompute
+        # the history from its position.
+        idx = self._index(key)
+        self._rewind(idx)
+        del self._changes[idx]
+        del self._changes_by_key[key]
+        self._catch_up()
+        if self._batching:
+            return
+        logger.info("Recomputed history from change %d of %d after "
+                    "deleting subchange '%s'", idx, len(self._changes), key)
 
     def create_submission(self, key: str, submission: Submission):
         # A new submission never triggers an update in the history,
@@ -209,12 +359,15 @@ class Score:
         submission.token = False
         submission.extra = list()
         self._submissions[key] = submission
+        self._submissions_version += 1
+        self._maxima = None
 
     def update_submission(self, key: str, submission: Submission):
         # An updated submission may cause an update in history because
         # it may change the "last" submission at some point in
         # history.
         self._submissions[key] = submission
+        self._submissions_version += 1
         self.reset_history()
 
     def delete_submission(self, key: str):
@@ -223,12 +376,16 @@ class Score:
         # but we reset it just to be sure...
         if key in self._submissions:
             del self._submissions[key]
+            self._submissions_version += 1
             # Delete all its subchanges.
             self._changes = [c for c in self._changes if c.submission != key]
+            self._changes_by_key = {c.key: c for c in self._changes}
             self.reset_history()
 
     def update_score_mode(self, score_mode: str):
         self._score_mode = score_mode
+        self._submissions_version += 1
+        self._maxima = None
 
 
 class ScoringStore:
@@ -236,8 +393,10 @@ class ScoringStore:
 
     It listens to the events of submission_store and subchange_store and
     redirects them to the corresponding Score (based on their user/task).
-    When asked to provide a global history of score changes it takes the
-    ones of each Score and combines them toghether (using a binary heap).
+    It also keeps the global history of score changes, i.e., the ones
+    of each Score combined together (using a binary heap). Changes that
+    only append to the history of a Score are appended to it; any other
+    change makes it be merged again when it is next asked for.
 
     """
     # We can do an important assumption here too: since the data has
@@ -258,10 +417,27 @@ class ScoringStore:
         self.subchange_store.add_create_callback(self.create_subchange)
         self.subchange_store.add_update_callback(self.update_subchange)
         self.subchange_store.add_delete_callback(self.delete_subchange)
+        self.submission_store.add_batch_callback(self.batch)
+        self.subchange_store.add_batch_callback(self.batch)
 
         self._scores: dict[str, dict[str, Score]] = dict()
         self._callbacks: list[Callable[[str, str, float], Any]] = list()
 
+        # The global history, or None if it has to be merged again.
+        self._global_history: list[tuple[str, str, int, float]] | None = \
+            list()
+        # Incremented every time the global history changes other than
+        # by appending entries to it, so that who read a prefix of it
+        # can tell whether the prefix is still valid.
+        self.history_epoch = 0
+
+        # While batching, the score and the history of each Score
+        # changed in the batch before the batch began.
+        self._batch_depth = 0
+        self._batch_changes: \
+            dict[tuple[str, str], tuple[float, list[tuple[int, float]]]] = \
+            dict()
+
     def init_store(self):
         """Load the scores from the stores.
 
@@ -269,10 +445,11 @@ class ScoringStore:
         finishes loading the data from disk.
 
         """
-        for key, value in self.submission_store._store.items():
-            self.create_submission(key, value)
-        for key, value in sorted(self.subchange_store._store.items()):
-            self.create_subchange(key, value)
+        with self.batch():
+            for key, value in self.submission_store._store.items():
+                self.create_submission(key, value)
+            for key, value in sorted(self.subchange_store._store.items()):
+                self.create_subchange(key, value)
 
     def add_score_callback(self, callback: Callable[[str, str, float], Any]):
         """Add a callback to be called when a score changes.
@@ -287,6 +464,105 @@ class ScoringStore:
         for call in self._callbacks:
             call(user, task, score)
 
+    @contextmanager
+    def batch(self) -> Generator[None]:
+        """Batch the changes made while in this context.
+
+        The histories of the Scores they affect are recomputed when
+        the (outermost) context ends, once for each Score, and only
+        then the callbacks are notified, once for each changed score.
+
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._end_batch()
+
+    def _end_batch(self):
+        changes = self._batch_changes
+        self._batch_changes = dict()
+        updates = list()
+        for (user, task), (old_score, old_history) in changes.items():
+            score_obj = self._scores.get(user, {}).get(task)
+            if score_obj is not None:
+                score_obj.end_batch()
+                updates.append((user, task, old_score, old_history,
+                                score_obj.get_score(), score_obj._history))
+            else:
+                # All its submissions were deleted.
+                updates.append((user, task, old_score, old_history,
+                                0.0, []))
+        self._update_global_history(updates)
+        for user, task, old_score, _, new_score, _ in updates:
+            if old_score != new_score:
+                self.notify_callbacks(user, task, new_score)
+        if len(changes) > 0:
+            logger.info("Recomputed %d scores after a batch of changes.",
+                        len(changes))
+
+    def _apply(self, user: str, task: str,
+               operation: Callable[[Score], Any]):
+        """Run an operation on the Score of a user for a task.
+
+        Then bring the global history up to date with the history of
+        the Score and, if the score changed, notify the callbacks. In
+        a batch, do this when it ends.
+
+        """
+        score_obj = self._scores[user][task]
+        if self._batch_depth > 0:
+            if (user, task) not in self._batch_changes:
+                self._batch_changes[user, task] = \
+                    (score_obj.get_score(), list(score_obj._history))
+                score_obj.begin_batch()
+            operation(score_obj)
+            return
+        old_score = score_obj.get_score()
+        old_history = list(score_obj._history)
+        operation(score_obj)
+        new_score = score_obj.get_score()
+        self._update_global_history([(user, task, old_score, old_history,
+                                      new_score, score_obj._history)])
+        if old_score != new_score:
+            self.notify_callbacks(user, task, new_score)
+
+    def _update_global_history(
+        self,
+        updates: list[tuple[str, str, float, list[tuple[int, float]],
+                            float, list[tuple[int, float]]]],
+    ):
+        # Extend the global history if the histories of the Scores
+        # have only been extended and the new entries come last in the
+        # merged order, otherwise have it merged again. The updates
+        # are (user, task, old score, old history, new score, new
+        # history).
+        global_history = self._global_history
+        if global_history is None:
+            return
+        appended: list[list[tuple[tuple[int, float], str, str]]] = list()
+        for user, task, _, old_history, _, new_history in updates:
+            if new_history == old_history:
+                continue
+            if new_history[:len(old_history)] != old_history:
+                break
+            appended.append([(entry, user, task)
+                             for entry in new_history[len(old_history):]])
+        else:
+            if len(appended) == 0:
+                return
+            entries = list(heapq.merge(*appended))
+            if len(global_history) == 0 or entries[0] >= (
+                    global_history[-1][2:], *global_history[-1][:2]):
+                global_history.extend((user, task, time, score)
+                                      for (time, score), user, task
+                                      in entries)
+                return
+        self._global_history = None
+        self.history_epoch += 1
+
     def create_submission(self, key: str, submission: Submission):
         if submission.user not in self._scores:
             self._scores[submission.user] = dict()
@@ -295,12 +571,9 @@ class ScoringStore:
             self._scores[submission.user][submission.task] = \
                 Score(score_mode=task["score_mode"])
 
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.create_submission(key, submission)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._apply(submission.user, submission.task,
+                    lambda score_obj: score_obj.create_submission(
+                        key, submission))
 
     def update_submission(
         self, key: str, old_submission: Submission, submission: Submission
@@ -315,21 +588,15 @@ class ScoringStore:
 
         task = self.task_store.retrieve(submission.task)
 
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.update_submission(key, submission)
-        score_obj.update_score_mode(task["score_mode"])
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        def operation(score_obj: Score):
+            score_obj.update_submission(key, submission)
+            score_obj.update_score_mode(task["score_mode"])
+
+        self._apply(submission.user, submission.task, operation)
 
     def delete_submission(self, key: str, submission: Submission):
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.delete_submission(key)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._apply(submission.user, submission.task,
+                    lambda score_obj: score_obj.delete_submission(key))
 
         if len(self._scores[submission.user][submission.task]
                ._submissions) == 0:
@@ -339,12 +606,9 @@ class ScoringStore:
 
     def create_subchange(self, key: str, subchange: Subchange):
         submission = self.submission_store._store[subchange.submission]
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.create_subchange(key, subchange)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._apply(submission.user, submission.task,
+                    lambda score_obj: score_obj.create_subchange(
+                        key, subchange))
 
     def update_subchange(
         self, key: str, old_subchange: Subchange, subchange: Subchange
@@ -355,12 +619,9 @@ class ScoringStore:
             return
 
         submission = self.submission_store._store[subchange.submission]
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.update_subchange(key, subchange)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._apply(submission.user, submission.task,
+                    lambda score_obj: score_obj.update_subchange(
+                        key, subchange))
 
     def delete_subchange(self, key: str, subchange: Subchange):
         if subchange.submission not in self.submission_store:
@@ -369,12 +630,8 @@ class ScoringStore:
             # But the delete_submission callback will do it for us!
             return
         submission = self.submission_store._store[subchange.submission]
-        score_obj = self._scores[submission.user][submission.task]
-        old_score = score_obj.get_score()
-        score_obj.delete_subchange(key)
-        new_score = score_obj.get_score()
-        if old_score != new_score:
-            self.notify_callbacks(submission.user, submission.task, new_score)
+        self._apply(submission.user, submission.task,
+                    lambda score_obj: score_obj.delete_subchange(key))
 
     def get_score(self, user: str, task: str) -> float:
         if user not in self._scores or task not in self._scores[user]:
@@ -388,7 +645,21 @@ class ScoringStore:
             return dict()
         return self._scores[user][task]._submissions
 
-    def get_global_history(self) -> Generator[tuple[str, str, int, float]]:
+    def get_global_history(self) -> list[tuple[str, str, int, float]]:
+        """Return the global history of score changes.
+
+        It is the merge of all per-user/per-task histories, in the
+        form (user_id, task_id, time, score). The returned list is the
+        one kept by this object: it must not be modified, and until
+        history_epoch changes the changes that follow only append to
+        it.
+
+        """
+        if self._global_history is None:
+            self._global_history = list(self._merge_histories())
+        return self._global_history
+
+    def _merge_histories(self) -> Generator[tuple[str, str, int, float]]:
         """Merge all individual histories into a global one.
 
         Take all per-user/per-task histories and merge them, providing
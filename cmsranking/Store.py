@@ -17,6 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections.abc import Callable
+from contextlib import AbstractContextManager, ExitStack
 import json
 import logging
 import os
@@ -48,7 +49,21 @@ class Store(Generic[EntityT]):
     get notified when something changes by providing appropriate
     callbacks.
 
+    The entities are persisted in a directory, as a snapshot of all of
+    them and a journal of the changes that followed, to which each
+    change is appended. When the journal grows longer than the
+    snapshot, the snapshot is written again and the journal emptied.
+    Entities found as single JSON files in the directory (the layout
+    of older versions) are moved into the snapshot when loading.
+
     """
+    SNAPSHOT_NAME = "store-snapshot.json"
+    JOURNAL_NAME = "store-journal.jsonl"
+
+    # The journal is never compacted while it has less entries than
+    # this.
+    MIN_COMPACTION_ENTRIES = 1000
+
     def __init__(
         self,
         entity: type[EntityT],
@@ -76,6 +91,22 @@ class Store(Generic[EntityT]):
         self._create_callbacks: list[Callable[[str, EntityT], Any]] = list()
         self._update_callbacks: list[Callable[[str, EntityT, EntityT], Any]] = list()
         self._delete_callbacks: list[Callable[[str, EntityT], Any]] = list()
+        self._batch_callbacks: \
+            list[Callable[[], AbstractContextManager[Any]]] = list()
+        # The number of changes in the journal.
+        self._journal_entries = 0
+        # Whether the data on disk couldn't be loaded: then it must
+        # not be replaced by a snapshot of what we have.
+        self._load_failed = False
+        # Whether some changes couldn't be appended to the journal:
+        # then the next change writes a snapshot instead.
+        self._needs_compaction = False
+
+    def _make_item(self, key: str, data: dict) -> EntityT:
+        item = self._entity()
+        item.set(data)
+        item.key = key
+        return item
 
     def load_from_disk(self):
         """Load the initial data for this store from the disk.
@@ -87,25 +118,168 @@ class Store(Generic[EntityT]):
             # it's ok: it means the directory already exists
             pass
 
+        snapshot_path = os.path.join(self._path, self.SNAPSHOT_NAME)
+        journal_path = os.path.join(self._path, self.JOURNAL_NAME)
         try:
-            for name in os.listdir(self._path):
-                # TODO check that the key is '[A-Za-z0-9_]+'
-                if name[-5:] == '.json' and name[:-5] != '':
-                    with open(os.path.join(self._path, name), 'rb') as rec:
-                        item = self._entity()
-                        item.set(json.load(rec))
-                        item.key = name[:-5]
-                        self._store[name[:-5]] = item
+            if os.path.exists(snapshot_path):
+                with open(snapshot_path, 'rb') as rec:
+                    for key, data in json.load(rec).items():
+                        self._store[key] = self._make_item(key, data)
+            if os.path.exists(journal_path):
+                self._load_journal(journal_path)
+            self._convert_entity_files()
         except OSError:
-            # the path isn't a directory or is inaccessible
+            self._load_failed = True
             logger.error("Path is not a directory or is not accessible "
                          "(or other I/O error occurred)", exc_info=True)
-        except ValueError:
-            logger.error("Invalid JSON", exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
-        except InvalidData as exc:
-            logger.error(str(exc), exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
+        except (ValueError, InvalidData) as exc:
+            self._load_failed = True
+            logger.error("Invalid data: %s" % exc, exc_info=False,
+                         extra={'location': self._path})
+
+    def _load_journal(self, journal_path: str):
+        """Apply the changes in the journal to the loaded snapshot.
+
+        A last line without its line break was being written when RWS
+        stopped: it is dropped from the journal. Other lines that can't
+        be decoded are skipped.
+
+        """
+        with open(journal_path, 'rb+') as journal:
+            content = journal.read()
+            length = content.rfind(b'\n') + 1
+            if length < len(content):
+                logger.warning("Dropping incomplete journal entry.",
+                               extra={'location': journal_path})
+                journal.truncate(length)
+        # Build only the last version of each entity.
+        last_data: dict[str, dict | None] = dict()
+        entries = 0
+        for number, line in enumerate(content[:length].splitlines(), 1):
+            try:
+                change = json.loads(line)
+                key = change[0]
+                data = change[1] if len(change) == 2 else None
+                if not isinstance(key, str) or \
+                        not isinstance(data, (dict, type(None))):
+                    raise ValueError("not a change")
+            except (ValueError, TypeError, IndexError, KeyError) as exc:
+                logger.warning("Skipping invalid journal entry on line "
+                               "%d: %s" % (number, exc),
+                               extra={'location': journal_path})
+                continue
+            last_data[key] = data
+            entries += 1
+        for key, data in last_data.items():
+            if data is None:
+                self._store.pop(key, None)
+                continue
+            try:
+                self._store[key] = self._make_item(key, data)
+            except InvalidData as exc:
+                logger.warning("Skipping invalid journal entry for %s: %s"
+                               % (key, exc),
+                               extra={'location': journal_path})
+        self._journal_entries = entries
+
+    def _convert_entity_files(self):
+        """Move the entities stored as single files into the snapshot.
+
+        """
+        names = [name for name in os.listdir(self._path)
+                 if name[-5:] == '.json'
+                 and re.match("^[A-Za-z0-9_]+$", name[:-5])]
+        converted: list[str] = list()
+        for name in names:
+            path = os.path.join(self._path, name)
+            try:
+                with open(path, 'rb') as rec:
+                    self._store[name[:-5]] = \
+                        self._make_item(name[:-5], json.load(rec))
+            except (OSError, ValueError, InvalidData) as exc:
+                logger.error("Not converting entity file: %s" % exc,
+                             exc_info=False, extra={'location': path})
+            else:
+                converted.append(path)
+        if len(converted) == 0 or not self._compact():
+            return
+        for path in converted:
+            os.remove(path)
+        logger.info("Converted %d entity files to a snapshot.",
+                    len(converted), extra={'location': self._path})
+
+    def _append(self, changes: list[list]):
+        """Append changes to the journal, compacting it if needed.
+
+        changes: the changes, as [key, data] for entities created or
+            updated, and as [key] for deleted ones.
+
+        """
+        # The snapshot also contains these changes, which are already
+        # applied to the entities.
+        if self._needs_compaction and self._compact():
+            return
+
+        journal_path = os.path.join(self._path, self.JOURNAL_NAME)
+        length = None
+        try:
+            with open(journal_path, 'ab') as journal:
+                length = journal.tell()
+                journal.write(b''.join(
+                    json.dumps(change).encode('utf-8') + b'\n'
+                    for change in changes))
+        except OSError:
+            logger.error("I/O error occured while writing the journal",
+                         exc_info=True)
+            # Remove what was written of these changes, so that the
+            # following ones don't end up on the same line.
+            if length is not None:
+                try:
+                    os.truncate(journal_path, length)
+                except OSError:
+                    logger.error("I/O error occured while truncating the "
+                                 "journal", exc_info=True)
+            self._needs_compaction = True
+            return
+        self._journal_entries += len(changes)
+        if self._journal_entries > max(self.MIN_COMPACTION_ENTRIES,
+                                       len(self._store)):
+            self._compact()
+
+    def _compact(self) -> bool:
+        """Write a snapshot of all entities and empty the journal.
+
+        The snapshot replaces the old one atomically, and the journal
+        is emptied only afterwards: replaying it on the new snapshot
+        gives the same entities.
+
+        return: whether the snapshot was written.
+
+        """
+        if self._load_failed:
+            logger.warning("Not writing a snapshot, the data on disk "
+                           "couldn't be loaded.",
+                           extra={'location': self._path})
+            return False
+
+        snapshot_path = os.path.join(self._path, self.SNAPSHOT_NAME)
+        try:
+            with open(snapshot_path + '.tmp', 'wb') as rec:
+                rec.write(json.dumps({key: value.get()
+                                      for key, value in self._store.items()})
+                          .encode('utf-8'))
+                rec.flush()
+                os.fsync(rec.fileno())
+            os.replace(snapshot_path + '.tmp', snapshot_path)
+            with open(os.path.join(self._path, self.JOURNAL_NAME), 'wb'):
+                pass
+        except OSError:
+            logger.error("I/O error occured while writing the snapshot",
+                         exc_info=True)
+            return False
+        self._journal_entries = 0
+        self._needs_compaction = False
+        return True
 
     def add_create_callback(self, callback: Callable[[str, EntityT], Any]):
         """Add a callback to be called when entities are created.
@@ -134,6 +308,29 @@ class Store(Generic[EntityT]):
         """
         self._delete_callbacks.append(callback)
 
+    def add_batch_callback(
+        self, callback: Callable[[], AbstractContextManager[Any]]
+    ):
+        """Add a callback to be called around changes of many entities.
+
+        The callback takes no arguments and returns a context manager,
+        which is entered before the other callbacks are called for
+        the entities of a list being merged or deleted, and exited
+        after them. This allows the listeners to process the changes
+        at once.
+
+        """
+        self._batch_callbacks.append(callback)
+
+    def _batch(self) -> ExitStack:
+        """Return a context that enters those of the batch callbacks.
+
+        """
+        stack = ExitStack()
+        for callback in self._batch_callbacks:
+            stack.enter_context(callback())
+        return stack
+
     def create(self, key: str, data: dict):
         """Create a new entity.
 
@@ -163,13 +360,7 @@ class Store(Generic[EntityT]):
             for callback in self._create_callbacks:
                 callback(key, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                with open(path, 'wt', encoding="utf-8") as rec:
-                    json.dump(self._store[key].get(), rec)
-            except OSError:
-                logger.error("I/O error occured while creating entity",
-                             exc_info=True)
+            self._append([[key, item.get()]])
 
     def update(self, key: str, data: dict):
         """Update an entity.
@@ -202,13 +393,7 @@ class Store(Generic[EntityT]):
             for callback in self._update_callbacks:
                 callback(key, old_item, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                with open(path, 'wt', encoding="utf-8") as rec:
-                    json.dump(self._store[key].get(), rec)
-            except OSError:
-                logger.error("I/O error occured while updating entity",
-                             exc_info=True)
+            self._append([[key, item.get()]])
 
     def merge_list(self, data_dict: dict[str, dict]):
         """Merge a list of entities.
@@ -243,27 +428,22 @@ class Store(Generic[EntityT]):
                 except InvalidData as exc:
                     raise InvalidData("[entity %s] %s" % (key, exc))
 
-            for key, value in item_dict.items():
-                is_new = key not in self._store
-                old_value = self._store.get(key)
-                # insert entity
-                self._store[key] = value
-                # notify callbacks
-                if is_new:
-                    for callback in self._create_callbacks:
-                        callback(key, value)
-                else:
-                    for callback in self._update_callbacks:
-                        callback(key, old_value, value)
-                # reflect changes on the persistent storage
-                try:
-                    path = os.path.join(self._path, key + '.json')
-                    with open(path, 'wt', encoding="utf-8") as rec:
-                        json.dump(value.get(), rec)
-                except OSError:
-                    logger.error(
-                        "I/O error occured while merging entity lists",
-                        exc_info=True)
+            with self._batch():
+                for key, value in item_dict.items():
+                    is_new = key not in self._store
+                    old_value = self._store.get(key)
+                    # insert entity
+                    self._store[key] = value
+                    # notify callbacks
+                    if is_new:
+                        for callback in self._create_callbacks:
+                            callback(key, value)
+                    else:
+                        for callback in self._update_callbacks:
+                            callback(key, old_value, value)
+            # reflect changes on the persistent storage
+            self._append([[key, value.get()]
+                          for key, value in item_dict.items()])
 
     def delete(self, key: str):
         """Delete an entity.
@@ -292,10 +472,7 @@ class Store(Generic[EntityT]):
             for callback in self._delete_callbacks:
                 callback(key, old_value)
             # reflect changes on the persistent storage
-            try:
-                os.remove(os.path.join(self._path, key + '.json'))
-            except OSError:
-                logger.error("Unable to delete entity", exc_info=True)
+            self._append([[key]])
 
     def delete_list(self):
         """Delete all entities.
@@ -303,7 +480,7 @@ class Store(Generic[EntityT]):
         Delete all existing entities from the store.
 
         """
-        with LOCK:
+        with LOCK, self._batch():
             # delete all entities
             for key in list(self._store.keys()):
                 self.delete(key)
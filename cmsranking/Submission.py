@@ -71,9 +71,9 @@ class Submission(Entity):
     def get(self):
         result = self.__dict__.copy()
         del result['key']
-        del result['score']
-        del result['token']
-        del result['extra']
+        # These are missing until the Scoring module fills them.
+        for field in ['score', 'token', 'extra']:
+            result.pop(field, None)
         return result
 
     def consistent(self, stores):
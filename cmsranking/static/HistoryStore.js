@@ -24,14 +24,23 @@ var HistoryStore = new function () {
         self.history_t = new Array();  // per task
         self.history_c = new Array();  // per contest
         self.history_g = new Array();  // global
+
+        // The history as received from the server, and the position
+        // in it to ask only for the changes that follow.
+        self.data = new Array();
+        self.position = null;
     };
 
     self.request_update = function (callback) {
         $.ajax({
             url: Config.get_history_url(),
+            data: self.position !== null ? {"since": self.position} : {},
             dataType: "json",
-            success: function (data) {
-                self.perform_update(data, callback);
+            success: function (data, status, xhr) {
+                var offset = parseInt(xhr.getResponseHeader("History-Offset")) || 0;
+                self.data = self.data.slice(0, offset).concat(data);
+                self.position = xhr.getResponseHeader("History-Position");
+                self.perform_update(self.data, callback);
             },
             error: function () {
                 console.error("Error while getting the history");
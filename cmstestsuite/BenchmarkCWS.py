@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure how many requests per second a running ContestWebServer
+serves on the pages of a contest, with many logged in contestants
+loading them at the same time.
+
+Run it against the same contest before and after a change to compare
+them. The users are taken from the contest as in StressTest (only
+those with a plaintext password can be used).
+
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from cms import ServiceCoord, config, get_service_address, utf8_decoder
+from cmstestsuite.StressTest import harvest_contest_data
+from cmstestsuite.web import Browser
+from cmstestsuite.web.CWSRequests import CWSLoginRequest
+
+
+class Client(threading.Thread):
+    """A contestant loading a page as fast as possible."""
+
+    def __init__(self, username, password, base_url, url, stop_at):
+        super().__init__()
+        self.username = username
+        self.password = password
+        self.base_url = base_url
+        self.url = url
+        self.stop_at = stop_at
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        browser = Browser()
+        login_request = CWSLoginRequest(browser, self.username,
+                                        self.password, base_url=self.base_url)
+        browser.login(login_request)
+        if login_request.outcome != login_request.OUTCOME_SUCCESS:
+            print("Cannot log in as %s." % self.username, file=sys.stderr)
+            return
+
+        while time.monotonic() < self.stop_at:
+            start = time.monotonic()
+            try:
+                response = browser.do_request(self.url)
+            except Exception:
+                self.errors += 1
+                continue
+            if response.status_code != 200:
+                self.errors += 1
+                continue
+            self.latencies.append(time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pages of ContestWebServer.")
+    parser.add_argument(
+        "-c", "--contest-id", action="store", type=int, required=True,
+        help="ID of the contest to test against")
+    parser.add_argument(
+        "-n", "--clients", action="store", type=int, default=20,
+        help="number of contestants loading the page (default 20)")
+    parser.add_argument(
+        "-d", "--duration", action="store", type=float, default=30.0,
+        help="duration of the measurement, in seconds (default 30)")
+    parser.add_argument(
+        "-p", "--page", action="store", choices=["overview", "task"],
+        default="overview",
+        help="page to load: the overview, with the list of the tasks, "
+             "or the description of the first task (default overview)")
+    parser.add_argument(
+        "-u", "--base-url", action="store", type=utf8_decoder,
+        help="base contest URL for placing HTTP requests "
+             "(without trailing slash)")
+    args = parser.parse_args()
+
+    users, tasks = harvest_contest_data(args.contest_id)
+    if len(users) == 0:
+        print("No viable users, terminating.")
+        return 1
+
+    if args.base_url is not None:
+        base_url = args.base_url
+    else:
+        base_url = "http://%s:%d" % \
+            (get_service_address(ServiceCoord('ContestWebServer', 0))[0],
+             config.contest_web_server.listen_port[0])
+    if args.page == "overview":
+        url = base_url + "/"
+    else:
+        url = "%s/tasks/%s/description" % (base_url, tasks[0][1])
+
+    # Log in all the clients before starting the measurement.
+    stop_at = time.monotonic() + 3600
+    clients = [Client(username, data["password"], base_url, url, stop_at)
+               for username, data in list(users.items())[:args.clients]]
+    for client in clients:
+        client.start()
+    time.sleep(1)
+    start = time.monotonic()
+    for client in clients:
+        client.latencies = []
+        client.errors = 0
+        client.stop_at = start + args.duration
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - start
+
+    latencies = sorted(latency for client in clients
+                       for latency in client.latencies)
+    errors = sum(client.errors for client in clients)
+    if len(latencies) == 0:
+        print("No successful requests, terminating.")
+        return 1
+    print("%d clients, %s:" % (len(clients), url))
+    print("  requests/second %8.1f" % (len(latencies) / elapsed))
+    print("  median latency  %8.1f ms"
+          % (latencies[len(latencies) // 2] * 1000))
+    print("  95th percentile %8.1f ms"
+          % (latencies[len(latencies) * 95 // 100] * 1000))
+    print("  errors          %8d" % errors)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the transfer of files from and to the database backend of
+the FileCacher with fixed-size chunks on a dedicated large object
+connection (the old path) and with the current path.
+
+The files are written to the configured database and deleted at the
+end, so this must not be run against a database in use.
+
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+from cms.db import FSObject, SessionGen
+from cms.db.filecacher import DBBackend, FileCacher, copyfileobj
+from cmscommon.digest import bytes_digest
+
+
+class Sink:
+    """File object discarding what is written to it."""
+
+    def write(self, data):
+        return len(data)
+
+
+def old_get_file(digest):
+    with SessionGen() as session:
+        fso = FSObject.get_from_digest(digest, session)
+        return fso.get_lobject(mode='rb')
+
+
+def old_get_size(digest):
+    with old_get_file(digest) as lobj:
+        return lobj.seek(0, io.SEEK_END)
+
+
+def old_put_file(backend, content, digest):
+    fobj = backend.create_file(digest)
+    copyfileobj(io.BytesIO(content), fobj, FileCacher.CHUNK_SIZE)
+    backend.commit_file(fobj, digest)
+
+
+def new_put_file(backend, content, digest):
+    fobj = backend.create_file(digest)
+    copyfileobj(io.BytesIO(content), fobj, FileCacher.CHUNK_SIZE,
+                FileCacher.MAX_CHUNK_SIZE)
+    backend.commit_file(fobj, digest)
+
+
+def measure(function, repetitions):
+    start = time.monotonic()
+    for _ in range(repetitions):
+        function()
+    return (time.monotonic() - start) / repetitions
+
+
+def benchmark(size, count, repetitions):
+    backend = DBBackend()
+    contents = [os.urandom(size) for _ in range(count)]
+    digests = [bytes_digest(content) for content in contents]
+    results = {}
+
+    def put(put_file):
+        for digest in digests:
+            backend.delete(digest)
+        for content, digest in zip(contents, digests):
+            put_file(backend, content, digest)
+
+    results["write, old"] = measure(lambda: put(old_put_file), repetitions)
+    results["write, new"] = measure(lambda: put(new_put_file), repetitions)
+
+    def get(get_file, buffer_sizes):
+        for digest in digests:
+            with get_file(digest) as fobj:
+                copyfileobj(fobj, Sink(), *buffer_sizes)
+
+    results["read, old"] = measure(
+        lambda: get(old_get_file, (FileCacher.CHUNK_SIZE,)), repetitions)
+    results["read, new"] = measure(
+        lambda: get(backend.get_file,
+                    (FileCacher.CHUNK_SIZE, FileCacher.MAX_CHUNK_SIZE)),
+        repetitions)
+
+    results["sizes, old"] = measure(
+        lambda: [old_get_size(digest) for digest in digests],
+        repetitions)
+    results["sizes, new"] = measure(
+        lambda: backend.get_sizes(digests), repetitions)
+
+    for digest in digests:
+        backend.delete(digest)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the database backend of the FileCacher.")
+    parser.add_argument(
+        "-s", "--sizes", action="store", type=int, nargs="+",
+        default=[1024, 1024 * 1024, 64 * 1024 * 1024],
+        help="sizes of the files to transfer, in bytes")
+    parser.add_argument(
+        "-n", "--count", action="store", type=int, default=10,
+        help="number of files of each size (default 10)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=3,
+        help="number of times each measurement is repeated (default 3)")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        results = benchmark(size, args.count, args.repetitions)
+        print("%d files of %d bytes:" % (args.count, size))
+        for name, seconds in results.items():
+            print("  %-12s %8.3f s" % (name, seconds))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the latency and throughput of RPCs carrying job groups
+like those exchanged by ES and the workers, with the JSON lines
+protocol and with the binary ones.
+
+A server and a client are run in this process, connected through the
+loopback interface.
+
+"""
+
+import argparse
+import sys
+import time
+from unittest.mock import patch
+
+import gevent
+from gevent.server import StreamServer
+
+from cms import Address, ServiceCoord, config
+from cms.db import Executable
+from cms.grading.Job import EvaluationJob, JobGroup
+from cms.io import RemoteServiceClient, RemoteServiceServer, rpc_method
+from cms.io.rpc import FORMAT_JSON, FORMAT_MSGPACK, msgpack
+from cms.service.esoperations import ESOperation
+from cmscommon.digest import bytes_digest
+
+
+class FakeWorker:
+    """Service returning the job group it receives, with the results
+    filled in.
+
+    """
+
+    def __init__(self, output_size):
+        self.output_size = output_size
+
+    @rpc_method
+    def execute_job_group(self, job_group_dict):
+        job_group = JobGroup.import_from_dict(job_group_dict)
+        for job in job_group.jobs:
+            job.success = True
+            job.outcome = "1.0"
+            job.text = ["Output is correct"]
+            job.user_output = None
+            job.plus = {
+                "execution_time": 0.123,
+                "execution_wall_clock_time": 0.234,
+                "execution_memory": 12345678,
+                "exit_status": "ok",
+                "stdout": "x" * self.output_size,
+            }
+        return job_group.export_to_dict()
+
+
+def make_job_group(jobs):
+    executable = bytes_digest(b"executable")
+    return JobGroup([
+        EvaluationJob(
+            operation=ESOperation(ESOperation.EVALUATION, 1, 1, "%03d" % i),
+            task_type="Batch",
+            task_type_parameters=["alone", ["", ""], "diff"],
+            info="evaluate submission 1 on dataset 1, testcase %03d" % i,
+            language="C++17 / g++",
+            executables={"task": Executable(filename="task",
+                                            digest=executable)},
+            input=bytes_digest(b"input %d" % i),
+            output=bytes_digest(b"output %d" % i),
+            time_limit=1.0,
+            memory_limit=256 * 1024 * 1024)
+        for i in range(jobs)])
+
+
+def benchmark(frame_format, compression, job_group_dict, output_size,
+              calls):
+    server_service = FakeWorker(output_size)
+    servers = []
+
+    def handle(sock, address):
+        server = RemoteServiceServer(server_service, address)
+        servers.append(server)
+        server.handle(sock)
+
+    listener = StreamServer(("127.0.0.1", 0), handle)
+    listener.start()
+    address = Address(listener.server_host, listener.server_port)
+    with patch("cms.io.rpc.get_service_address", return_value=address), \
+            patch.object(config.global_, "rpc_binary_protocol",
+                         frame_format is not None), \
+            patch.object(config.global_, "rpc_compression", compression), \
+            patch("cms.io.rpc.msgpack",
+                  msgpack if frame_format == FORMAT_MSGPACK else None):
+        client = RemoteServiceClient(ServiceCoord("Worker", 0))
+        client.connect()
+        client.wait_for_connection()
+        # Let the negotiation finish.
+        gevent.sleep(0.1)
+
+        latencies = []
+        start = time.monotonic()
+        for _ in range(calls):
+            call_start = time.monotonic()
+            client.execute_job_group(job_group_dict=job_group_dict).get()
+            latencies.append(time.monotonic() - call_start)
+        elapsed = time.monotonic() - start
+
+        client.disconnect()
+        for server in servers:
+            server.disconnect()
+        listener.stop()
+    latencies.sort()
+    return latencies[len(latencies) // 2], calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the RPC protocols on ES-Worker traffic.")
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, default=25,
+        help="number of jobs in each job group (default 25)")
+    parser.add_argument(
+        "-o", "--output-sizes", action="store", type=int, nargs="+",
+        default=[100, 10000],
+        help="size of the stdout of each job, in bytes")
+    parser.add_argument(
+        "-n", "--calls", action="store", type=int, default=200,
+        help="number of calls to measure (default 200)")
+    args = parser.parse_args()
+
+    frame_formats = [None, FORMAT_JSON]
+    if msgpack is not None:
+        frame_formats.append(FORMAT_MSGPACK)
+    job_group_dict = make_job_group(args.jobs).export_to_dict()
+    for output_size in args.output_sizes:
+        print("%d jobs, %d bytes of output each:" % (args.jobs, output_size))
+        for frame_format in frame_formats:
+            for compression in [False, True] if frame_format else [False]:
+                latency, throughput = benchmark(
+                    frame_format, compression, job_group_dict, output_size,
+                    args.calls)
+                name = frame_format or "JSON lines"
+                if compression:
+                    name += " + zlib"
+                print("  %-14s median latency %7.3f ms, %7.1f calls/s"
+                      % (name, latency * 1000, throughput))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the computation of the ranking of AWS by loading all the
+submissions of the contest and calling task_score for each
+participation and task (the old path) and with a single query (the
+current one), on a synthetic contest.
+
+The contest is written to the configured database and deleted at the
+end, so this must not be run against a database in use.
+
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from sqlalchemy.orm import joinedload
+
+from cms.db import Contest, SessionGen
+from cms.grading.scoring import contest_scores_fingerprint, \
+    contest_task_scores, task_score
+from cmscommon.constants import SCORE_MODE_MAX
+from cmstestsuite.unit_tests.databasemixin import \
+    DatabaseObjectGeneratorMixin
+
+
+class Generator(DatabaseObjectGeneratorMixin):
+    pass
+
+
+def make_contest(session, users, tasks, submissions, seed):
+    rng = random.Random(seed)
+    contest = Generator.get_contest()
+    session.add(contest)
+    task_objects = []
+    for num in range(tasks):
+        task = Generator.get_task(contest=contest, num=num,
+                                  score_mode=SCORE_MODE_MAX)
+        task.active_dataset = Generator.get_dataset(task=task)
+        task_objects.append(task)
+    for _ in range(users):
+        participation = Generator.get_participation(contest=contest)
+        for task in task_objects:
+            for _ in range(submissions):
+                submission = Generator.get_submission(
+                    task=task, participation=participation)
+                score = float(rng.randrange(101))
+                Generator.get_submission_result(
+                    submission=submission, dataset=task.active_dataset,
+                    score=score, score_details=[], public_score=score,
+                    public_score_details=[], ranking_score_details=[])
+    session.commit()
+    return contest.id
+
+
+def old_scores(session, contest_id):
+    contest = session.query(Contest)\
+        .filter(Contest.id == contest_id)\
+        .options(joinedload("participations"))\
+        .options(joinedload("participations.submissions"))\
+        .options(joinedload("participations.submissions.token"))\
+        .options(joinedload("participations.submissions.results"))\
+        .first()
+    return {p.id: {task.id: task_score(p, task) for task in contest.tasks}
+            for p in contest.participations}
+
+
+def new_scores(session, contest_id):
+    contest = session.query(Contest).filter(Contest.id == contest_id).one()
+    contest_scores_fingerprint(session, contest)
+    return contest_task_scores(session, contest)
+
+
+def cache_hit(session, contest_id):
+    contest = session.query(Contest).filter(Contest.id == contest_id).one()
+    return contest_scores_fingerprint(session, contest)
+
+
+def measure(function, contest_id, repetitions):
+    start = time.monotonic()
+    for _ in range(repetitions):
+        # A new session each time, as each request of AWS has its own.
+        with SessionGen() as session:
+            result = function(session, contest_id)
+    return (time.monotonic() - start) / repetitions, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the computation of the ranking of AWS.")
+    parser.add_argument(
+        "-u", "--users", action="store", type=int, default=1000,
+        help="number of users in the contest (default 1000)")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=10,
+        help="number of tasks in the contest (default 10)")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=3,
+        help="number of submissions of each user on each task "
+        "(default 3)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=3,
+        help="number of times each measurement is repeated (default 3)")
+    args = parser.parse_args()
+
+    with SessionGen() as session:
+        contest_id = make_contest(session, args.users, args.tasks,
+                                  args.submissions, 42)
+    try:
+        old, old_result = measure(old_scores, contest_id, args.repetitions)
+        new, new_result = measure(new_scores, contest_id, args.repetitions)
+        hit, _ = measure(cache_hit, contest_id, args.repetitions)
+        assert {p_id: scores for p_id, scores in old_result.items()
+                if any(score != (0.0, False) for score in scores.values())} \
+            == new_result
+        print("%d users, %d tasks, %d submissions each:"
+              % (args.users, args.tasks, args.submissions))
+        print("  old path   %8.3f s" % old)
+        print("  one query  %8.3f s" % new)
+        print("  cache hit  %8.3f s" % hit)
+    finally:
+        with SessionGen() as session:
+            session.delete(session.query(Contest).get(contest_id))
+            session.commit()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the loading and the writing of the stores of RWS with one
+file per entity (the old layout) and with a snapshot and a journal
+(the current one).
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+
+
+def make_subchanges(count, offset=0):
+    return {"c%d" % i: {"submission": "s%d" % (i // 2), "time": i,
+                        "score": float(i % 100), "extra": ["%d" % (i % 7)]}
+            for i in range(offset, offset + count)}
+
+
+def old_load(path):
+    result = dict()
+    for name in os.listdir(path):
+        if name[-5:] == '.json' and name[:-5] != '':
+            with open(os.path.join(path, name), 'rb') as rec:
+                item = Subchange()
+                item.set(json.load(rec))
+                item.key = name[:-5]
+                result[name[:-5]] = item
+    return result
+
+
+def old_write(path, data_dict):
+    for key, value in data_dict.items():
+        item = Subchange()
+        item.set(value)
+        item.key = key
+        with open(os.path.join(path, key + '.json'), 'wt',
+                  encoding="utf-8") as rec:
+            json.dump(item.get(), rec)
+
+
+def load(path):
+    store = Store(Subchange, path, {})
+    store.load_from_disk()
+    return store
+
+
+def measure(function, *args):
+    start = time.monotonic()
+    result = function(*args)
+    return time.monotonic() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the storage of the ranking web server.")
+    parser.add_argument(
+        "-n", "--entities", action="store", type=int, nargs="+",
+        default=[10 ** 4, 10 ** 5],
+        help="number of entities in the store")
+    parser.add_argument(
+        "-b", "--batch", action="store", type=int, default=1000,
+        help="number of entities in each PUT batch (default 1000)")
+    args = parser.parse_args()
+
+    for count in args.entities:
+        print("%d entities:" % count)
+        with tempfile.TemporaryDirectory() as tmp:
+            old_write(tmp, make_subchanges(count))
+            elapsed, _ = measure(old_load, tmp)
+            print("  startup, one file per entity  %8.3f s" % elapsed)
+            elapsed, _ = measure(load, tmp)
+            print("  conversion                    %8.3f s" % elapsed)
+            elapsed, store = measure(load, tmp)
+            print("  startup, snapshot             %8.3f s" % elapsed)
+
+            batch = make_subchanges(args.batch, count)
+            with tempfile.TemporaryDirectory() as old_tmp:
+                elapsed, _ = measure(old_write, old_tmp, batch)
+            print("  batch, one file per entity    %8.3f s" % elapsed)
+            elapsed, _ = measure(store.merge_list, batch)
+            print("  batch, journal                %8.3f s" % elapsed)
+
+            # A journal as long as possible without being compacted.
+            for offset in range(count, 2 * count - args.batch, args.batch):
+                store.merge_list(make_subchanges(args.batch, offset))
+            elapsed, store = measure(load, tmp)
+            print("  startup, snapshot and journal %8.3f s (%d entities)"
+                  % (elapsed, len(store._store)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
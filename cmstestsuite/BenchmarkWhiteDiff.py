@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the white diff of outputs line by line (the old
+implementation) and in blocks of lines (the current one), on outputs
+with many short lines.
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from cms.grading.steps.whitediff import _WHITES, _white_diff, \
+    _white_diff_canonicalize
+
+
+def old_white_diff(output, res):
+    line = 0
+    while True:
+        lout = output.readline()
+        lres = res.readline()
+        line += 1
+        if len(lres) == 0 and len(lout) == 0:
+            return True, None
+        elif len(lres) == 0 or len(lout) == 0:
+            lout = lout.strip(b''.join(_WHITES))
+            lres = lres.strip(b''.join(_WHITES))
+            if len(lout) > 0:
+                return False, "Contestant output too long"
+            if len(lres) > 0:
+                return False, "Contestant output too short"
+        else:
+            lout = _white_diff_canonicalize(lout)
+            lres = _white_diff_canonicalize(lres)
+            if lout != lres:
+                return False, "Mismatch on line %d" % line
+
+
+def make_outputs(lines, seed):
+    """Return pairs of equivalent outputs with the given number of
+    lines, and a description of each.
+
+    """
+    rng = random.Random(seed)
+    rows = [b"%d %d" % (rng.randrange(10 ** 6), rng.randrange(10 ** 6))
+            for _ in range(lines)]
+    res = b"\n".join(rows) + b"\n"
+    return [
+        ("identical", res, res),
+        ("CRLF", b"\r\n".join(rows) + b"\r\n", res),
+        ("trailing spaces", b" \n".join(rows) + b" \n", res),
+        ("mismatch at end", res[:-2] + b"x\n", res),
+    ]
+
+
+def measure(function, path_a, path_b, repetitions):
+    start = time.monotonic()
+    for _ in range(repetitions):
+        with open(path_a, "rb") as a, open(path_b, "rb") as b:
+            result = function(a, b)
+    return (time.monotonic() - start) / repetitions, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the white diff comparator.")
+    parser.add_argument(
+        "-l", "--lines", action="store", type=int, nargs="+",
+        default=[10 ** 4, 10 ** 6],
+        help="number of lines of the outputs")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=3,
+        help="number of times each measurement is repeated (default 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path_a = os.path.join(tmp, "a")
+        path_b = os.path.join(tmp, "b")
+        for lines in args.lines:
+            print("%d lines:" % lines)
+            for name, output, res in make_outputs(lines, 42):
+                with open(path_a, "wb") as a, open(path_b, "wb") as b:
+                    a.write(output)
+                    b.write(res)
+                old, old_result = measure(
+                    old_white_diff, path_a, path_b, args.repetitions)
+                new, new_result = measure(
+                    _white_diff, path_a, path_b, args.repetitions)
+                assert old_result[0] == new_result[0]
+                print("  %-16s old %8.3f s  new %8.3f s  (%.1fx)"
+                      % (name, old, new, old / new if new > 0 else 0))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
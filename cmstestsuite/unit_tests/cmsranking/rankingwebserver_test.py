@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the history and score handlers of the ranking web server"""
+
+import gzip
+import json
+import unittest
+
+from werkzeug.test import Client
+
+from cmstestsuite.unit_tests.cmsranking.scoring_test import make_stores
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cmscommon.constants import SCORE_MODE_MAX
+from cmsranking.RankingWebServer import HistoryHandler, JSONSnapshot, \
+    ScoreHandler
+
+
+class JSONClient(Client):
+
+    def get(self, *args, headers=None, **kwargs):
+        headers = dict(headers or {}, Accept="application/json")
+        return super().get(*args, headers=headers, **kwargs)
+
+
+class TestHandlers(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stores = make_stores(self.base_dir)
+        self.stores["task"].create("t", {
+            "name": "t", "short_name": "t", "contest": "c",
+            "max_score": 100.0, "score_precision": 0,
+            "extra_headers": [], "order": 0, "score_mode": SCORE_MODE_MAX})
+        for u_id in ["u0", "u1"]:
+            self.stores["submission"].create(
+                "s" + u_id, {"user": u_id, "task": "t", "time": 0})
+        self.subchanges = 0
+
+    def score(self, user, time, score):
+        self.subchanges += 1
+        self.stores["subchange"].create("c%d" % self.subchanges, {
+            "submission": "s" + user, "time": time, "score": score})
+
+    def test_history_since(self):
+        client = JSONClient(HistoryHandler(self.stores))
+        self.score("u0", 10, 1.0)
+        response = client.get("/history")
+        self.assertEqual(response.json, [["u0", "t", 10, 1.0]])
+        self.assertEqual(response.headers["History-Offset"], "0")
+        position = response.headers["History-Position"]
+
+        # Nothing new.
+        response = client.get("/history", query_string={"since": position})
+        self.assertEqual(response.json, [])
+        self.assertEqual(response.headers["History-Offset"], "1")
+        self.assertEqual(response.headers["History-Position"], position)
+
+        # Appended changes.
+        self.score("u1", 20, 2.0)
+        self.score("u0", 30, 3.0)
+        response = client.get("/history", query_string={"since": position})
+        self.assertEqual(response.json,
+                         [["u1", "t", 20, 2.0], ["u0", "t", 30, 3.0]])
+        self.assertEqual(response.headers["History-Offset"], "1")
+        position = response.headers["History-Position"]
+
+        # A change in the past rewrites the history.
+        self.score("u1", 5, 4.0)
+        response = client.get("/history", query_string={"since": position})
+        self.assertEqual(response.headers["History-Offset"], "0")
+        self.assertEqual(response.json, [["u1", "t", 5, 4.0],
+                                         ["u0", "t", 10, 1.0],
+                                         ["u1", "t", 20, 2.0],
+                                         ["u0", "t", 30, 3.0]])
+
+        response = client.get("/history", query_string={"since": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_conditional(self):
+        client = JSONClient(HistoryHandler(self.stores))
+        self.score("u0", 10, 1.0)
+        response = client.get("/history")
+        etag = response.headers["ETag"]
+
+        response = client.get("/history", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.score("u0", 20, 2.0)
+        response = client.get("/history", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 2)
+
+    def test_gzip(self):
+        client = JSONClient(HistoryHandler(self.stores))
+        for time in range(JSONSnapshot.GZIP_MIN_SIZE // 10):
+            self.score("u0", time, float(time))
+        response = client.get("/history",
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.data)),
+                         client.get("/history").json)
+
+    def test_scores(self):
+        self.score("u0", 10, 1.0)
+        client = JSONClient(ScoreHandler(self.stores))
+        self.score("u1", 20, 2.0)
+        response = client.get("/scores")
+        self.assertEqual(response.json, {"u0": {"t": 1.0}, "u1": {"t": 2.0}})
+        self.assertIn("Timestamp", response.headers)
+        etag = response.headers["ETag"]
+
+        response = client.get("/scores", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.stores["subchange"].delete("c1")
+        response = client.get("/scores", headers={"If-None-Match": etag})
+        self.assertEqual(response.json, {"u1": {"t": 2.0}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the scoring of the ranking web server"""
+
+import os
+import random
+import unittest
+from unittest.mock import patch
+
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+from cmsranking.Scoring import Score, ScoringStore
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+from cmsranking.Task import Task
+
+
+def make_submission(key, time):
+    submission = Submission()
+    submission.set({"user": "u", "task": "t", "time": time})
+    submission.key = key
+    return submission
+
+
+def make_subchange(key, submission, time, score, extra=None, token=None):
+    subchange = Subchange()
+    data = {"submission": submission, "time": time, "score": score}
+    if extra is not None:
+        data["extra"] = extra
+    if token is not None:
+        data["token"] = token
+    subchange.set(data)
+    subchange.key = key
+    return subchange
+
+
+class TestScore(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.random = random.Random(42)
+
+    def random_subchange(self, key, num_submissions):
+        s_id = "s%d" % self.random.randrange(num_submissions)
+        extra = ["%d" % self.random.randrange(4) for _ in range(3)]
+        return make_subchange(
+            key, s_id, 100 + self.random.randrange(1000),
+            float(sum(map(int, extra))), extra=extra,
+            token=self.random.choice([None, True, False]))
+
+    def assertSameAsReplay(self, score):
+        history = list(score._history)
+        score.reset_history()
+        self.assertEqual(history, score._history)
+
+    def check_random_operations(self, score_mode):
+        num_submissions = 8
+        score = Score(score_mode)
+        for i in range(num_submissions):
+            score.create_submission("s%d" % i,
+                                    make_submission("s%d" % i, 100 * i))
+
+        keys = []
+        for i in range(200):
+            operation = self.random.randrange(3) if keys else 0
+            if operation == 0:
+                key = "c%03d" % i
+                keys.append(key)
+                score.create_subchange(
+                    key, self.random_subchange(key, num_submissions))
+            elif operation == 1:
+                key = self.random.choice(keys)
+                subchange = self.random_subchange(key, num_submissions)
+                # Updates keep the submission, as the store does.
+                subchange.submission = \
+                    score._changes_by_key[key].submission
+                score.update_subchange(key, subchange)
+            else:
+                key = self.random.choice(keys)
+                keys.remove(key)
+                score.delete_subchange(key)
+            self.assertEqual(
+                [c.key for c in score._changes],
+                [c.key for c in sorted(score._changes_by_key.values(),
+                                       key=lambda c: (c.time, c.key))])
+            self.assertSameAsReplay(score)
+
+    def test_max(self):
+        self.check_random_operations(SCORE_MODE_MAX)
+
+    def test_max_subtask(self):
+        self.check_random_operations(SCORE_MODE_MAX_SUBTASK)
+
+    def test_max_tokened_last(self):
+        self.check_random_operations(SCORE_MODE_MAX_TOKENED_LAST)
+
+    def test_rejudge_lowers_max_subtask(self):
+        score = Score(SCORE_MODE_MAX_SUBTASK)
+        score.create_submission("s0", make_submission("s0", 10))
+        score.create_submission("s1", make_submission("s1", 20))
+        score.create_subchange("a", make_subchange(
+            "a", "s0", 10, 30.0, extra=["10", "20"]))
+        score.create_subchange("b", make_subchange(
+            "b", "s1", 20, 40.0, extra=["20", "20"]))
+        self.assertEqual(score.get_score(), 40.0)
+
+        score.update_subchange("a", make_subchange(
+            "a", "s0", 10, 10.0, extra=["0", "10"]))
+        self.assertEqual(score._history, [(10, 10.0), (20, 40.0)])
+
+        score.update_subchange("b", make_subchange(
+            "b", "s1", 20, 5.0, extra=["5", "0"]))
+        self.assertEqual(score._history, [(10, 10.0), (20, 15.0)])
+
+        score.delete_subchange("a")
+        self.assertEqual(score._history, [(20, 5.0)])
+
+
+def make_stores(base_dir):
+    stores = dict()
+    stores["task"] = Store(Task, os.path.join(base_dir, "tasks"), stores)
+    stores["submission"] = Store(
+        Submission, os.path.join(base_dir, "submissions"), stores)
+    stores["subchange"] = Store(
+        Subchange, os.path.join(base_dir, "subchanges"), stores)
+    for store in stores.values():
+        store.load_from_disk()
+    stores["scoring"] = ScoringStore(stores)
+    stores["scoring"].init_store()
+    return stores
+
+
+class TestScoringStore(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.random = random.Random(42)
+        self.stores = make_stores(self.base_dir)
+        self.scoring = self.stores["scoring"]
+        for t_id in ["t0", "t1"]:
+            self.stores["task"].create(t_id, {
+                "name": t_id, "short_name": t_id, "contest": "c",
+                "max_score": 100.0, "score_precision": 0,
+                "extra_headers": [], "order": 0,
+                "score_mode": SCORE_MODE_MAX_TOKENED_LAST})
+        for i in range(6):
+            self.stores["submission"].create("s%d" % i, {
+                "user": "u%d" % (i % 3), "task": "t%d" % (i % 2),
+                "time": i})
+
+    def assertHistoryConsistent(self, previous, previous_epoch):
+        history = list(self.scoring.get_global_history())
+        self.assertEqual(history, list(self.scoring._merge_histories()))
+        if self.scoring.history_epoch == previous_epoch:
+            self.assertEqual(history[:len(previous)], previous)
+        return history, self.scoring.history_epoch
+
+    def test_global_history(self):
+        store = self.stores["subchange"]
+        history, epoch = self.assertHistoryConsistent([], 0)
+        appended = 0
+        for i in range(300):
+            operation = self.random.randrange(10)
+            if operation < 8 or len(store._store) == 0:
+                # Mostly new subchanges, in time order.
+                time = 10 * i if operation < 7 \
+                    else self.random.randrange(10 * i + 1)
+                store.create("c%03d" % i, {
+                    "submission": "s%d" % self.random.randrange(6),
+                    "time": time, "score": float(self.random.randrange(5))})
+            elif operation == 8:
+                key = self.random.choice(list(store._store))
+                data = store.retrieve(key)
+                data["score"] = float(self.random.randrange(5))
+                store.update(key, data)
+            else:
+                store.delete(self.random.choice(list(store._store)))
+            old_epoch = epoch
+            history, epoch = self.assertHistoryConsistent(history, epoch)
+            appended += epoch == old_epoch
+        # Most changes did not require merging the histories again.
+        self.assertGreater(appended, 150)
+
+    def test_batch(self):
+        # The same subchanges, in reverse order of time, created one by
+        # one and in a single batch.
+        subchanges = {"c%03d" % i: {
+            "submission": "s%d" % (i % 6), "time": 1000 - i,
+            "score": float(i % 7)} for i in range(60)}
+        other = make_stores(self.makedirs("other"))
+        for name, store in other.items():
+            if name != "scoring":
+                store.merge_list(self.stores[name].retrieve_list())
+        for key, data in subchanges.items():
+            other["subchange"].create(key, data)
+
+        notified = []
+        self.scoring.add_score_callback(
+            lambda *args: notified.append(args))
+        with patch.object(Score, "append_change",
+                          autospec=True,
+                          side_effect=Score.append_change) as append_change:
+            self.stores["subchange"].merge_list(subchanges)
+        # Each change was applied once, instead of once for each
+        # change that came later in the batch but earlier in time.
+        self.assertEqual(append_change.call_count, len(subchanges))
+
+        self.assertEqual(self.scoring.get_global_history(),
+                         other["scoring"].get_global_history())
+        expected = sorted((u_id, t_id, score.get_score())
+                          for u_id, tasks in other["scoring"]._scores.items()
+                          for t_id, score in tasks.items()
+                          if score.get_score() != 0.0)
+        self.assertEqual(sorted(notified), expected)
+
+    def test_delete_submission(self):
+        self.stores["subchange"].create(
+            "c0", {"submission": "s0", "time": 10, "score": 1.0})
+        history, epoch = self.assertHistoryConsistent([], 0)
+        self.assertEqual(history, [("u0", "t0", 10, 1.0)])
+
+        self.stores["submission"].delete("s0")
+        self.assertEqual(self.scoring.get_global_history(), [])
+        self.assertEqual(self.scoring.history_epoch, epoch + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
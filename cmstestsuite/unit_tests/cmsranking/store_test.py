@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the persistence of the stores of the ranking web server"""
+
+import io
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cmsranking.Store import Store
+from cmsranking.Team import Team
+
+
+class TestStore(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.get_path("teams")
+        self.store = self.load()
+
+    def load(self):
+        store = Store(Team, self.path, {})
+        store.load_from_disk()
+        return store
+
+    def assertReloads(self):
+        self.assertEqual(self.load().retrieve_list(),
+                         self.store.retrieve_list())
+
+    def journal_lines(self):
+        with open(os.path.join(self.path, Store.JOURNAL_NAME), "rb") as f:
+            return f.readlines()
+
+    def test_changes_are_persisted(self):
+        self.store.create("a", {"name": "A"})
+        self.store.create("b", {"name": "B"})
+        self.store.update("a", {"name": "AA"})
+        self.store.delete("b")
+        self.store.merge_list({"b": {"name": "BB"}, "c": {"name": "C"}})
+        self.assertEqual(len(self.journal_lines()), 6)
+        self.assertEqual(self.load().retrieve_list(),
+                         {"a": {"name": "AA"}, "b": {"name": "BB"},
+                          "c": {"name": "C"}})
+
+    def test_compaction(self):
+        with patch.object(Store, "MIN_COMPACTION_ENTRIES", 10):
+            for i in range(25):
+                self.store.merge_list({"k%d" % (i % 3): {"name": "%d" % i}})
+            # Compacted at the 11th and 22nd change.
+            self.assertEqual(len(self.journal_lines()), 3)
+            self.assertReloads()
+
+    def test_incomplete_entry(self):
+        self.store.create("a", {"name": "A"})
+        self.store.create("b", {"name": "B"})
+        journal = os.path.join(self.path, Store.JOURNAL_NAME)
+        with open(journal, "ab") as f:
+            f.write(b'["c", {"na')
+
+        store = self.load()
+        self.assertEqual(store.retrieve_list(),
+                         {"a": {"name": "A"}, "b": {"name": "B"}})
+        self.assertEqual(len(self.journal_lines()), 2)
+        store.create("c", {"name": "C"})
+        self.assertEqual(self.load().retrieve_list(), store.retrieve_list())
+
+    def test_invalid_entry(self):
+        self.store.create("a", {"name": "A"})
+        journal = os.path.join(self.path, Store.JOURNAL_NAME)
+        with open(journal, "ab") as f:
+            f.write(b'["b", {"na\n["c", 1]\n')
+        self.store.create("d", {"name": "D"})
+
+        store = self.load()
+        self.assertEqual(store.retrieve_list(),
+                         {"a": {"name": "A"}, "d": {"name": "D"}})
+
+    def test_failed_append(self):
+        self.store.create("a", {"name": "A"})
+        self.store._compact()
+        self.store.create("b", {"name": "B"})
+
+        class FullDisk(io.BytesIO):
+            # Only a part of the data fits on the disk.
+            def write(self, data):
+                self.journal.write(data[:5])
+                self.journal.close()
+                raise OSError("No space left on device")
+
+        def open_full_disk(path, mode):
+            full_disk = FullDisk()
+            full_disk.journal = open(path, mode)
+            full_disk.tell = full_disk.journal.tell
+            return full_disk
+        with patch("cmsranking.Store.open", open_full_disk, create=True):
+            self.store.create("c", {"name": "C"})
+        self.assertEqual(len(self.journal_lines()), 1)
+
+        # The next change writes all of them in a snapshot.
+        self.store.create("d", {"name": "D"})
+        self.assertEqual(self.journal_lines(), [])
+        self.assertReloads()
+
+    def test_failed_load(self):
+        self.store.create("a", {"name": "A"})
+        self.store._compact()
+        self.write_file("teams/" + Store.SNAPSHOT_NAME, b"not json")
+
+        store = self.load()
+        with patch.object(Store, "MIN_COMPACTION_ENTRIES", 0):
+            store.create("b", {"name": "B"})
+        with open(os.path.join(self.path, Store.SNAPSHOT_NAME), "rb") as f:
+            self.assertEqual(f.read(), b"not json")
+        self.assertEqual(len(self.journal_lines()), 1)
+
+    def test_conversion(self):
+        self.store.create("a", {"name": "A"})
+        self.write_file("teams/a.json", json.dumps({"name": "AA"}).encode())
+        self.write_file("teams/b.json", json.dumps({"name": "B"}).encode())
+        self.write_file("teams/c.json", b"not json")
+
+        store = self.load()
+        self.assertEqual(store.retrieve_list(),
+                         {"a": {"name": "AA"}, "b": {"name": "B"}})
+        self.assertEqual(
+            sorted(os.listdir(self.path)),
+            sorted([Store.JOURNAL_NAME, Store.SNAPSHOT_NAME, "c.json"]))
+        self.assertEqual(self.journal_lines(), [])
+        self.assertEqual(self.load().retrieve_list(), store.retrieve_list())
+
+
+if __name__ == "__main__":
+    unittest.main()
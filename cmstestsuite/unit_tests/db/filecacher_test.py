@@ -26,12 +26,18 @@
 import os
 import random
 import shutil
+import sqlite3
 import unittest
 from io import BytesIO
+from unittest.mock import patch
+
+import gevent
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.db.filecacher import FileCacher
+from cms import config
+from cms.db import Digest, LargeObject
+from cms.db.filecacher import CacheIndex, FileCacher
 from cmscommon.digest import Digester, bytes_digest
 
 
@@ -358,6 +364,18 @@ class TestFileCacherBase:
         # Check that the file was stored correctly.
         self.check_stored_file(digest)
 
+    def test_get_sizes(self):
+        """Look up the sizes of many files at once, some missing."""
+        contents = [os.urandom(size) for size in [0, 10, 1000]]
+        digests = [self.file_cacher.put_file_content(content)
+                   for content in contents]
+        missing = bytes_digest(b"this file was never stored")
+
+        sizes = self.file_cacher.get_sizes(
+            digests + [missing, Digest.TOMBSTONE])
+        self.assertEqual(sizes, {digest: len(content)
+                                 for digest, content in zip(digests, contents)})
+
 
 class TestFileCacherDB(TestFileCacherBase, DatabaseMixin, unittest.TestCase):
     """Tests for the FileCacher service with a database backend."""
@@ -369,6 +387,24 @@ class TestFileCacherDB(TestFileCacherBase, DatabaseMixin, unittest.TestCase):
         DatabaseMixin.setUp(self)
         TestFileCacherBase.setUp(self, FileCacher())
 
+    def test_small_and_streamed_reads(self):
+        """Files above the threshold are streamed, the others are not."""
+        content = os.urandom(1000)
+        digest = self.file_cacher.put_file_content(content)
+        backend = self.file_cacher.backend
+
+        with backend.get_file(digest) as fobj:
+            self.assertIsInstance(fobj, BytesIO)
+            self.assertEqual(fobj.read(), content)
+
+        with patch.object(backend, "SINGLE_READ_MAX_SIZE", 100):
+            with backend.get_file(digest) as fobj:
+                self.assertIsInstance(fobj, LargeObject)
+                self.assertEqual(fobj.read(), content)
+
+        with self.assertRaises(KeyError):
+            backend.get_file(bytes_digest(b"missing"))
+
 
 class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
     """Tests for the FileCacher service with a filesystem backend."""
@@ -383,5 +419,89 @@ class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
         shutil.rmtree("fs-storage", ignore_errors=True)
 
 
+class TestFileCacherEviction(unittest.TestCase):
+    """Tests for the eviction of files from a size-limited cache."""
+
+    def setUp(self):
+        super().setUp()
+        with patch.object(config.global_, "cache_max_size_mib", 1):
+            self.file_cacher = FileCacher(path="fs-storage")
+
+    def tearDown(self):
+        shutil.rmtree("fs-storage", ignore_errors=True)
+        super().tearDown()
+
+    def put(self):
+        return self.file_cacher.put_file_content(os.urandom(400 * 1024))
+
+    def is_cached(self, digest):
+        return os.path.exists(os.path.join(self.file_cacher.file_dir, digest))
+
+    def test_least_recently_used_evicted(self):
+        self.file_cacher._index.TOUCH_INTERVAL = 0
+        first = self.put()
+        second = self.put()
+        self.file_cacher.get_file_content(first)
+        third = self.put()
+
+        self.assertTrue(self.is_cached(first))
+        self.assertFalse(self.is_cached(second))
+        self.assertTrue(self.is_cached(third))
+        self.assertEqual(self.file_cacher.stats["evictions"], 1)
+
+        # The evicted file is still in the backend.
+        self.file_cacher.get_file_content(second)
+        self.assertTrue(self.is_cached(second))
+        self.assertEqual(self.file_cacher.stats["misses"], 1)
+        self.assertEqual(self.file_cacher.stats["hits"], 1)
+        self.assertFalse(self.is_cached(first))
+
+    def test_untracked_file(self):
+        digest = self.put()
+        self.file_cacher._index.remove(digest)
+        self.assertEqual(self.file_cacher._index.total_size(), 0)
+
+        self.file_cacher.cache_file(digest)
+        self.assertEqual(self.file_cacher._index.total_size(), 400 * 1024)
+        self.assertEqual(self.file_cacher.stats["hits"], 1)
+
+    def test_drop(self):
+        digest = self.put()
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher._index.total_size(), 0)
+
+    def test_accesses_rate_limited(self):
+        first = self.put()
+        second = self.put()
+        # Too close to the addition to be written to the index.
+        self.file_cacher.get_file_content(first)
+        self.put()
+        self.assertFalse(self.is_cached(first))
+        self.assertTrue(self.is_cached(second))
+
+    def test_locked_index(self):
+        other = sqlite3.connect(
+            os.path.join(self.file_cacher.file_dir, "_index.sqlite"),
+            isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        with patch.object(CacheIndex, "LOCK_TIMEOUT", 0.1):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.put()
+
+        # Other greenlets keep running while we wait for the lock.
+        gevent.spawn_later(0.05, other.execute, "COMMIT")
+        self.put()
+        other.close()
+        self.assertEqual(self.file_cacher._index.total_size(), 400 * 1024)
+
+    def test_purge_closes_index(self):
+        index = self.file_cacher._index
+        with patch.object(config.global_, "cache_max_size_mib", 1):
+            self.file_cacher.purge_cache()
+        self.assertIsNot(self.file_cacher._index, index)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            index.total_size()
+
+
 if __name__ == "__main__":
     unittest.main()
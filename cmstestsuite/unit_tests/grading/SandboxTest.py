@@ -20,9 +20,17 @@
 """Tests for general utility functions."""
 
 import io
+import os
+import stat
 import unittest
+from unittest.mock import MagicMock, patch
 
-from cms.grading.Sandbox import Truncator
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+from cmstestsuite.unit_tests.grading.steps.fakesandbox import FakeSandbox
+
+from cms import config
+from cms.grading.Sandbox import SandboxInterfaceException, SandboxPool, \
+    Truncator
 
 
 class TestTruncator(unittest.TestCase):
@@ -62,5 +70,150 @@ class TestTruncator(unittest.TestCase):
         self.perform_truncator_test(100, 40, 7)
 
 
+class TestSandboxPool(unittest.TestCase):
+    """Test the class SandboxPool."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch("cms.grading.Sandbox.Sandbox",
+                        MagicMock(side_effect=self.new_sandbox))
+        self.Sandbox = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = SandboxPool(1, 2)
+
+    @staticmethod
+    def new_sandbox(box_index, shard, name=None, temp_dir=None,
+                    outer_dir=None):
+        sandbox = MagicMock()
+        sandbox.get_root_path.return_value = \
+            outer_dir if outer_dir is not None else "/tmp/box%d" % box_index
+        return sandbox
+
+    def test_reuse(self):
+        sandbox = self.pool.acquire("evaluate")
+        self.Sandbox.assert_called_once_with(
+            SandboxPool.BOX_INDEX_BASE, 1, name="evaluate")
+        self.assertTrue(self.pool.release(sandbox))
+        sandbox.reset.assert_called_once_with(reinitialize=False)
+        sandbox.cleanup.assert_not_called()
+
+        other = self.pool.acquire("check")
+        self.assertIsNot(other, sandbox)
+        self.assertEqual(self.Sandbox.call_args.kwargs["outer_dir"],
+                         "/tmp/box%d" % SandboxPool.BOX_INDEX_BASE)
+        self.assertEqual(self.Sandbox.call_args.kwargs["name"], "check")
+        self.assertEqual(self.pool.get_status()["reused"], 1)
+
+    def test_size(self):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNone(self.pool.acquire())
+        self.assertNotEqual(self.Sandbox.call_args_list[0].args[0],
+                            self.Sandbox.call_args_list[1].args[0])
+        self.assertTrue(self.pool.discard(first))
+        self.assertIsNotNone(self.pool.acquire())
+        self.assertFalse(self.pool.release(MagicMock()))
+        self.assertTrue(self.pool.release(second))
+
+    def test_warm(self):
+        self.pool.warm()
+        self.assertEqual(self.Sandbox.call_count, 2)
+        self.assertEqual(self.pool.get_status()["free"], 2)
+        self.assertEqual(self.pool.get_status()["created"], 2)
+        # The warm sandboxes are reused, not created again.
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNone(self.pool.acquire())
+        self.assertEqual(self.pool.get_status()["reused"], 2)
+        self.assertEqual({first.get_root_path(), second.get_root_path()},
+                         {"/tmp/box%d" % (SandboxPool.BOX_INDEX_BASE + i)
+                          for i in range(2)})
+
+    def test_warm_failure(self):
+        self.Sandbox.side_effect = SandboxInterfaceException()
+        self.pool.warm()
+        self.assertEqual(self.pool.get_status()["free"], 0)
+        self.assertEqual(self.pool.get_status()["in_use"], 0)
+        # The sandboxes are still created on demand.
+        self.Sandbox.side_effect = self.new_sandbox
+        self.assertIsNotNone(self.pool.acquire())
+
+    def test_reset_failure(self):
+        sandbox = self.pool.acquire()
+        sandbox.reset.side_effect = SandboxInterfaceException()
+        self.assertTrue(self.pool.release(sandbox))
+        sandbox.cleanup.assert_called_once_with(delete=True)
+        self.assertEqual(self.pool.get_status()["reset_failures"], 1)
+        self.assertEqual(self.pool.get_status()["free"], 0)
+
+    def test_reinit(self):
+        pool = SandboxPool(1, 2, SandboxPool.RESET_REINIT)
+        sandbox = pool.acquire()
+        pool.release(sandbox)
+        sandbox.reset.assert_called_once_with(reinitialize=True)
+
+        with self.assertRaises(ValueError):
+            SandboxPool(1, 2, "nothing")
+
+
+class TestFileStaging(FileSystemMixin, unittest.TestCase):
+    """Test how files of the cache are put in the sandbox."""
+
+    def setUp(self):
+        super().setUp()
+        self.sandbox = FakeSandbox(None, temp_dir=self.base_dir)
+        self.cached = self.write_file("cached", b"content")
+        os.chmod(self.cached, 0o600)
+        self.file_cacher = MagicMock()
+        self.file_cacher.get_file.side_effect = \
+            lambda digest: open(self.cached, "rb")
+
+    def set_staging(self, staging):
+        patcher = patch.object(config.sandbox, "file_staging", staging)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def is_linked(self, path):
+        return os.path.samestat(os.stat(self.sandbox.relative_path(path)),
+                                os.stat(self.cached))
+
+    def read(self, path):
+        with open(self.sandbox.relative_path(path), "rb") as f:
+            return f.read()
+
+    def test_copy(self):
+        self.set_staging("copy")
+        self.sandbox.create_file_from_storage("input", "dig",
+                                              self.file_cacher)
+        self.file_cacher.get_file_to_fobj.assert_called_once()
+
+    def test_link(self):
+        self.set_staging("link")
+        self.sandbox.create_file_from_storage("exe", "dig",
+                                              self.file_cacher,
+                                              executable=True)
+        self.assertEqual(self.read("exe"), b"content")
+        if not self.is_linked("exe"):
+            self.skipTest("Files were cloned or copied.")
+        self.assertEqual(stat.S_IMODE(os.stat(self.cached).st_mode), 0o555)
+
+        # Changing the permissions in the sandbox doesn't touch the
+        # cache, and writable files get a copy of their own.
+        self.sandbox.allow_writing_all()
+        self.assertEqual(stat.S_IMODE(os.stat(self.cached).st_mode), 0o555)
+        self.sandbox.allow_writing_only(["exe"])
+        self.assertFalse(self.is_linked("exe"))
+        self.assertEqual(self.read("exe"), b"content")
+        self.assertEqual(stat.S_IMODE(os.stat(self.cached).st_mode), 0o555)
+
+    def test_fallback_to_copy(self):
+        self.set_staging("link")
+        self.file_cacher.get_file.side_effect = \
+            lambda digest: io.BytesIO(b"in memory")
+        self.sandbox.create_file_from_storage("input", "dig",
+                                              self.file_cacher)
+        self.assertEqual(self.read("input"), b"in memory")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the construction of jobs.
+
+"""
+
+import json
+import unittest
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.grading.Job import DatasetJobCache, JobGroup
+from cms.service.esoperations import ESOperation
+from cmscommon.digest import bytes_digest
+
+
+class TestDatasetJobCache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(
+            task=self.task, task_type="Batch",
+            task_type_parameters=["alone", ["", ""], "diff"],
+            time_limit=1.0, memory_limit=256 * 1024 * 1024)
+        self.task.active_dataset = self.dataset
+        self.testcases = [self.add_testcase(self.dataset) for _ in range(3)]
+        self.add_manager(self.dataset)
+
+        self.submission = self.add_submission(
+            self.task, self.participation, language="C++17 / g++")
+        self.add_file(self.submission)
+        sr = self.add_submission_result(self.submission, self.dataset)
+        self.add_executable(sr)
+
+        self.other_submission = self.add_submission(
+            self.task, self.participation, language="C++17 / g++",
+            additional_info=json.dumps({"limits": {"weak_time_limit": 2.0}}))
+        sr = self.add_submission_result(self.other_submission, self.dataset)
+        self.add_executable(sr)
+
+        self.session.commit()
+        self.cache = DatasetJobCache()
+
+    def operations(self):
+        return [
+            ESOperation(ESOperation.COMPILATION,
+                        self.submission.id, self.dataset.id),
+        ] + [
+            ESOperation(ESOperation.EVALUATION, submission.id,
+                        self.dataset.id, testcase.codename)
+            for submission in [self.submission, self.other_submission]
+            for testcase in self.testcases
+        ]
+
+    def assertSameAsJobGroup(self, operations):
+        self.session.expire_all()
+        expected = JobGroup.from_operations(operations, self.session)\
+            .export_to_dict()
+        self.assertEqual(
+            self.cache.export_job_group(operations, self.session), expected)
+
+    def test_same_as_job_group(self):
+        self.assertSameAsJobGroup(self.operations())
+        files = self.cache._datasets[self.dataset.id]
+        # Again, from the cache.
+        self.assertSameAsJobGroup(self.operations())
+        self.assertIs(self.cache._datasets[self.dataset.id], files)
+
+    def test_dataset_changes(self):
+        self.assertSameAsJobGroup(self.operations())
+
+        self.testcases[0].input = bytes_digest(b"new input")
+        self.add_manager(self.dataset)
+        self.dataset.time_limit = 3.0
+        self.session.commit()
+        self.assertSameAsJobGroup(self.operations())
+
+        codename = self.testcases[2].codename
+        self.session.delete(self.testcases[2])
+        self.session.commit()
+        self.testcases = self.testcases[:2]
+        self.assertSameAsJobGroup(self.operations())
+        with self.assertRaises(KeyError):
+            self.cache.export_job_group(
+                [ESOperation(ESOperation.EVALUATION, self.submission.id,
+                             self.dataset.id, codename)], self.session)
+
+    def test_user_tests(self):
+        user_test = self.add_user_test(self.task, self.participation,
+                                       language="C++17 / g++")
+        self.add_user_test_result(user_test, self.dataset)
+        self.session.commit()
+        operations = self.operations()
+        operations.insert(1, ESOperation(ESOperation.USER_TEST_COMPILATION,
+                                         user_test.id, self.dataset.id))
+        self.assertSameAsJobGroup(operations)
+
+    def test_missing_testcase(self):
+        operation = ESOperation(ESOperation.EVALUATION, self.submission.id,
+                                self.dataset.id, "missing")
+        with self.assertRaises(KeyError):
+            self.cache.export_job_group([operation], self.session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 Stefano Maggiolo <s.maggiolo@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the instantiation of score types."""
+
+import unittest
+
+from cms.grading.scoretypes import get_dataset_score_type
+from cms.grading.scoretypes.GroupMin import GroupMin
+
+
+class TestGetDatasetScoreType(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.parameters = [[40, "1_*"], [60.0, "2_*"]]
+        self.public_testcases = {"1_0": True, "2_0": False, "2_1": True}
+
+    def get(self, dataset_id=1):
+        return get_dataset_score_type(dataset_id, "GroupMin", self.parameters,
+                                      self.public_testcases, 2)
+
+    def test_reused(self):
+        score_type = self.get()
+        self.assertIsInstance(score_type, GroupMin)
+        self.assertEqual(score_type.max_score, 100.0)
+        self.assertEqual(score_type.max_public_score, 40.0)
+        self.assertIs(self.get(), score_type)
+        self.assertIsNot(self.get(dataset_id=2), score_type)
+
+    def test_updated(self):
+        score_type = self.get()
+        self.parameters[1][0] = 50.0
+        updated = self.get()
+        self.assertIsNot(updated, score_type)
+        self.assertEqual(updated.max_score, 90.0)
+        self.assertEqual(score_type.max_score, 100.0)
+
+        self.public_testcases["2_0"] = True
+        self.assertEqual(self.get().max_public_score, 90.0)
+
+    def test_targets(self):
+        score_type = self.get()
+        self.assertEqual(score_type.retrieve_target_testcases(),
+                         [["1_0"], ["2_0", "2_1"]])
+        self.assertIs(score_type.retrieve_target_testcases(),
+                      score_type.retrieve_target_testcases())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,7 +25,8 @@ from datetime import timedelta
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.grading.scoring import task_score
+from cms.grading.scoring import contest_scores_fingerprint, \
+    contest_task_scores, participation_task_scores, task_score
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 from cmscommon.datetime import make_datetime
@@ -47,8 +48,28 @@ class TaskScoreMixin(DatabaseMixin):
         return self.timestamp + timedelta(seconds=timestamp)
 
     def call(self, public=False, only_tokened=False):
-        return task_score(self.participation, self.task,
-                          public=public, only_tokened=only_tokened)
+        result = task_score(self.participation, self.task,
+                            public=public, only_tokened=only_tokened)
+        # All the scores of the participation must agree.
+        self.session.flush()
+        scores = participation_task_scores(self.session, self.participation,
+                                           self.task)
+        if public:
+            self.assertEqual((scores.public_score, scores.partial), result)
+        elif only_tokened:
+            self.assertEqual((scores.tokened_score, scores.partial), result)
+        else:
+            self.assertEqual((scores.score, scores.partial), result)
+        if not public and not only_tokened:
+            # The scores of the whole contest must agree.
+            self.session.flush()
+            scores = contest_task_scores(self.session,
+                                         self.participation.contest)
+            self.assertEqual(
+                scores.get(self.participation.id, {}).get(self.task.id,
+                                                          (0.0, False)),
+                result)
+        return result
 
     def add_result(self, timestamp, score, tokened=False, score_details=None,
                    public_score=None, public_score_details=None):
@@ -360,5 +381,44 @@ class TestTaskScoreMax(TaskScoreMixin, unittest.TestCase):
         self.assertEqual(self.call(), (44.44, False))
 
 
+class TestContestScoresFingerprint(TaskScoreMixin, unittest.TestCase):
+    """Tests for contest_scores_fingerprint()."""
+
+    def fingerprint(self):
+        self.session.flush()
+        return contest_scores_fingerprint(self.session,
+                                          self.participation.contest)
+
+    def test_changes(self):
+        self.task.score_mode = SCORE_MODE_MAX
+        fingerprints = [self.fingerprint()]
+
+        self.add_result(self.at(1), 44.4)
+        fingerprints.append(self.fingerprint())
+
+        submission_result = self.add_submission_result(
+            self.add_submission(participation=self.participation,
+                                task=self.task, timestamp=self.at(2)),
+            self.task.active_dataset)
+        fingerprints.append(self.fingerprint())
+
+        submission_result.score = 55.5
+        submission_result.score_details = []
+        submission_result.public_score = 0.0
+        submission_result.public_score_details = []
+        submission_result.ranking_score_details = []
+        fingerprints.append(self.fingerprint())
+
+        self.add_token(timestamp=self.at(3),
+                       submission=submission_result.submission)
+        fingerprints.append(self.fingerprint())
+
+        self.task.score_mode = SCORE_MODE_MAX_SUBTASK
+        fingerprints.append(self.fingerprint())
+
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
+        self.assertEqual(self.fingerprint(), fingerprints[-1])
+
+
 if __name__ == "__main__":
     unittest.main()
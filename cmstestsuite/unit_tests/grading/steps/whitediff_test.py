@@ -18,10 +18,13 @@
 
 """Tests for whitediff.py."""
 
+import random
 import unittest
 from io import BytesIO
+from unittest.mock import patch
 
 from cms.grading.steps import _WHITES, _white_diff
+from cms.grading.steps.whitediff import _LineReader, _white_diff_canonicalize
 
 
 class TestWhiteDiff(unittest.TestCase):
@@ -72,6 +75,87 @@ class TestWhiteDiff(unittest.TestCase):
         line2 = line1 + "0"
         self.assertFalse(self._diff(line1, line2))
 
+    def test_messages(self):
+        self.assertEqual(
+            _white_diff(BytesIO(b"1\n2 3\n4\n"), BytesIO(b"1\n2  4\n4\n")),
+            (False, "Expected `2 4`, found `2 3` on line 2"))
+        self.assertEqual(
+            _white_diff(BytesIO(b"1\n2\n"), BytesIO(b"1\n")),
+            (False, "Contestant output too long"))
+        self.assertEqual(
+            _white_diff(BytesIO(b"1\n \n"), BytesIO(b"1\n\n2")),
+            (False, "Contestant output too short"))
+
+
+def reference_white_diff(output, res):
+    """The line by line definition of the white diff."""
+    whites = b"".join(_WHITES)
+    line = 0
+    while True:
+        lout = output.readline()
+        lres = res.readline()
+        line += 1
+        if len(lres) == 0 and len(lout) == 0:
+            return True, None
+        elif len(lres) == 0 or len(lout) == 0:
+            if len(lout.strip(whites)) > 0:
+                return False, "Contestant output too long"
+            if len(lres.strip(whites)) > 0:
+                return False, "Contestant output too short"
+        else:
+            lout = _white_diff_canonicalize(lout)
+            lres = _white_diff_canonicalize(lres)
+            if lout != lres:
+                lout = (lout[:100] + b"..." if len(lout) > 100 else lout)
+                lres = (lres[:100] + b"..." if len(lres) > 100 else lres)
+                lout = lout.decode("utf-8", errors='backslashreplace')
+                lres = lres.decode("utf-8", errors='backslashreplace')
+                return False, \
+                    f"Expected `{lres}`, found `{lout}` on line {line}"
+
+
+class TestWhiteDiffBlocks(unittest.TestCase):
+    """Compare the block-based white diff with the definition, with
+    chunks small enough to split lines and runs of whitespaces.
+
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.random = random.Random(42)
+
+    def random_output(self):
+        lines = []
+        for _ in range(self.random.randrange(12)):
+            tokens = [self.random.choice([b"1", b"2", b"ab", b"\xff"])
+                      for _ in range(self.random.randrange(4))]
+            line = b""
+            for token in tokens + [b""]:
+                line += b"".join(self.random.choice(_WHITES[:2] + _WHITES[3:])
+                                 for _ in range(self.random.randrange(3)))
+                line += token
+            lines.append(line)
+        return b"\n".join(lines) + self.random.choice([b"", b"\n"])
+
+    def mutate(self, output):
+        output = bytearray(output)
+        for _ in range(self.random.randrange(3)):
+            position = self.random.randrange(len(output) + 1)
+            output[position:position + self.random.randrange(2)] = \
+                self.random.choice([b"", b" ", b"\n", b"\r\n", b"1"])
+        return bytes(output)
+
+    def test_same_as_line_by_line(self):
+        for chunk_size in [1, 2, 3, 7, 1024]:
+            with patch.object(_LineReader, "CHUNK_SIZE", chunk_size):
+                for _ in range(300):
+                    res = self.random_output()
+                    output = self.mutate(res)
+                    self.assertEqual(
+                        _white_diff(BytesIO(output), BytesIO(res)),
+                        reference_white_diff(BytesIO(output), BytesIO(res)),
+                        (output, res))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -19,9 +19,13 @@
 """Tests for the utilities for task types."""
 
 import unittest
+from unittest.mock import MagicMock, patch
 
+from cms import config
 from cms.grading import Language
 from cms.grading.tasktypes import is_manager_for_compilation
+from cms.grading.tasktypes.util import BOXES_PER_JOB_SLOT, create_sandbox, \
+    delete_sandbox, set_job_slot, set_sandbox_pool
 
 
 class TestLanguage(Language):
@@ -91,5 +95,55 @@ class TestIsManagerForCompilation(unittest.TestCase):
         self.assertIsNotForCompilation("test.srcext1.")
 
 
+class TestSandboxPoolUsage(unittest.TestCase):
+    """Test that create_sandbox and delete_sandbox use the pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.pool = MagicMock()
+        set_sandbox_pool(self.pool)
+        self.addCleanup(set_sandbox_pool, None)
+        patcher = patch.object(config.worker, "keep_sandbox", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.job = MagicMock(archive_sandbox=False, keep_sandbox=False)
+
+    def test_pooled_sandbox(self):
+        sandbox = create_sandbox(0, MagicMock(), name="evaluate")
+        self.assertIs(sandbox, self.pool.acquire.return_value)
+        self.pool.release.return_value = True
+        delete_sandbox(sandbox, self.job, MagicMock(), True)
+        self.pool.release.assert_called_once_with(sandbox)
+        sandbox.cleanup.assert_not_called()
+
+    def test_failed_job_not_reused(self):
+        sandbox = create_sandbox(0, MagicMock(), name="evaluate")
+        delete_sandbox(sandbox, self.job, MagicMock(), False)
+        self.pool.release.assert_not_called()
+        self.pool.discard.assert_called_once_with(sandbox)
+        sandbox.cleanup.assert_called_once_with(delete=False)
+
+    @patch("cms.grading.tasktypes.util.Sandbox")
+    def test_pool_exhausted(self, Sandbox):
+        self.pool.acquire.return_value = None
+        sandbox = create_sandbox(0, MagicMock(), name="evaluate")
+        self.assertIs(sandbox, Sandbox.return_value)
+
+    @patch("cms.grading.tasktypes.util.Sandbox")
+    def test_job_slot(self, Sandbox):
+        self.addCleanup(set_job_slot, 0)
+        set_job_slot(2, {5})
+        sandbox = create_sandbox(0, MagicMock(), name="evaluate")
+        self.assertEqual(sandbox.cpus, {5})
+
+        self.pool.acquire.return_value = None
+        file_cacher = MagicMock()
+        create_sandbox(1, file_cacher, name="evaluate")
+        Sandbox.assert_called_once_with(
+            2 * BOXES_PER_JOB_SLOT + 1, file_cacher.service.shard,
+            name="evaluate")
+        self.assertEqual(Sandbox.return_value.cpus, {5})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the persistent cache of the compiled statements."""
+
+import os
+import subprocess
+import unittest
+from unittest.mock import patch
+
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cms.io.BuildCache import BuildCache
+from cms.io.Repository import Repository
+from cms.io.TaskFetch import TaskCompileJob
+
+
+class TestBuildCache(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = BuildCache(self.get_path("cache"), 1)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", b"pdf", "log")
+        self.assertEqual(self.cache.get("a"), (b"pdf", "log"))
+
+        # Another instance (e.g. after a restart) sees the same entries.
+        self.assertEqual(BuildCache(self.get_path("cache"), 1).get("a"),
+                         (b"pdf", "log"))
+
+    def test_eviction(self):
+        # Two of them fit in the cache, three don't.
+        third = b"x" * (400 * 1024)
+        self.cache.put("a", third, "")
+        self.cache.put("b", third, "")
+        os.utime(self.cache._entry_path("a"), (0, 0))
+        os.utime(self.cache._entry_path("b"), (1, 1))
+        # Using an entry makes it the most recent one.
+        self.assertIsNotNone(self.cache.get("a"))
+
+        self.cache.put("c", third, "")
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
+class TestTaskCompileJob(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.makedirs("repo/task")
+        self.write_file("repo/task/statement.tex", b"statement")
+        self.git("init", "-q")
+        self.commit()
+        # The lock isn't used here, and the manager process doesn't get
+        # along with the gevent monkey patching of other tests.
+        with patch("cms.io.Repository.Manager"):
+            self.repository = Repository(self.get_path("repo"))
+        self.cache = BuildCache(self.get_path("cache"), 0)
+
+    def git(self, *args):
+        subprocess.check_output(["git"] + list(args),
+                                cwd=self.get_path("repo"))
+
+    def commit(self):
+        self.git("add", ".")
+        self.git("-c", "user.name=a", "-c", "user.email=a@localhost",
+                 "commit", "-q", "-m", "change")
+
+    def new_job(self, language):
+        return TaskCompileJob(self.repository, "task", language, "task",
+                              None, self.cache)
+
+    def test_tree_hashes(self):
+        hashes = self.repository.get_tree_hashes(["task", "."])
+        self.assertEqual(len(hashes), 2)
+
+        self.write_file("repo/task/statement.tex", b"changed")
+        self.assertIsNone(self.repository.get_tree_hashes(["task"]))
+        self.commit()
+        self.assertNotEqual(self.repository.get_tree_hashes(["task"])[0],
+                            hashes[0])
+        self.assertIsNone(self.repository.get_tree_hashes(["missing"]))
+
+    def test_cached_statement(self):
+        job = self.new_job("en")
+        self.cache.put(job._cache_key(), b"pdf", "log")
+
+        with patch.object(TaskCompileJob, "_compile") as compile_:
+            job = self.new_job("en")
+            self.assertEqual(job.join(), 1)
+            compile_.assert_not_called()
+            self.assertEqual(job.info(1), {"error": False, "done": True,
+                                           "msg": "Okay", "log": "log"})
+            self.assertEqual(job.get(), b"pdf")
+
+            # The repository is locked while we look at it.
+            lock = self.repository.lock
+            self.assertEqual(lock.acquire.call_count, 1)
+            self.assertEqual(lock.release.call_count, 1)
+
+            # Other languages and changed tasks are compiled.
+            self.new_job("de").join()
+            self.write_file("repo/task/statement.tex", b"changed")
+            self.commit()
+            self.new_job("en").join()
+            self.assertEqual(compile_.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,8 +22,10 @@
 
 """
 
+import json
 import socket
 import unittest
+import zlib
 from unittest.mock import Mock, patch
 
 import gevent
@@ -31,9 +33,11 @@ import gevent.event
 import gevent.socket
 from gevent.server import StreamServer
 
-from cms import Address, ServiceCoord
+from cms import Address, ServiceCoord, config
 from cms.io import RPCError, rpc_method, RemoteServiceServer, \
     RemoteServiceClient
+from cms.io.rpc import FRAME_HEADER, FRAME_MARKER, FRAME_MSGPACK, \
+    FRAME_ZLIB, PROTOCOL_METHOD, RemoteServiceBase
 
 
 class MockService:
@@ -63,7 +67,7 @@ class MockService:
         event.wait()
 
 
-class TestRPC(unittest.TestCase):
+class RPCTestMixin:
 
     def setUp(self):
         patcher = patch("cms.io.rpc.get_service_address")
@@ -162,12 +166,29 @@ class TestRPC(unittest.TestCase):
         """Pause the greenlet so other work can be done."""
         gevent.sleep(0.005)
 
+    def negotiated_socket(self) -> socket.socket:
+        """Connect to the server and ask it for JSON frames, as a
+        client would.
+
+        return: the socket.
+
+        """
+        sock = gevent.socket.create_connection((self.host, self.port))
+        request = {"__id": "protocol", "__method": PROTOCOL_METHOD,
+                   "__data": {"formats": ["json"], "compressions": []}}
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\r\n")
+        sock.makefile("rb").readline()
+        return sock
+
     def tearDown(self):
         self.kill_listener()
         self.disconnect_clients()
         self.disconnect_servers()
         self.sleep()
 
+
+class TestRPC(RPCTestMixin, unittest.TestCase):
+
     def test_method_not_existent(self):
         client = self.get_client(ServiceCoord("Foo", 0))
         result = client.not_existent()
@@ -431,6 +452,165 @@ class TestRPC(unittest.TestCase):
         self.assertFalse(self.servers[0].connected)
         sock.close()
 
+    def test_send_invalid_frame(self):
+        sock = self.negotiated_socket()
+        sock.sendall(FRAME_HEADER.pack(FRAME_MARKER, FRAME_ZLIB, 3) + b"foo")
+        self.sleep()
+        self.assertFalse(self.servers[0].connected)
+        sock.close()
+
+    def test_send_too_large_frame(self):
+        sock = self.negotiated_socket()
+        sock.sendall(FRAME_HEADER.pack(
+            FRAME_MARKER, 0, RemoteServiceBase._max_frame_size() + 1))
+        self.sleep()
+        self.assertFalse(self.servers[0].connected)
+        sock.close()
+
+    def test_send_too_large_compressed_frame(self):
+        sock = self.negotiated_socket()
+        # A valid message, made too large by trailing spaces.
+        payload = zlib.compress(
+            b'{"__id": "echo", "__method": "echo", "__data": {"value": 1}}'
+            + b" " * RemoteServiceBase._max_frame_size())
+        sock.sendall(FRAME_HEADER.pack(FRAME_MARKER, FRAME_ZLIB, len(payload))
+                     + payload)
+        self.sleep()
+        self.assertFalse(self.servers[0].connected)
+        sock.close()
+
+
+class TestRPCJSONLines(TestRPC):
+    """Run the tests again with the JSON lines protocol."""
+
+    def setUp(self):
+        patcher = patch.object(config.global_, "rpc_binary_protocol", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+class TestRPCProtocol(RPCTestMixin, unittest.TestCase):
+
+    def sent_flags(self, remote):
+        """Record the flags of the frames sent by remote (None for
+        the messages sent as JSON lines).
+
+        """
+        flags = []
+        write = remote._write
+
+        def recording_write(data):
+            if data[:1] == bytes([FRAME_MARKER]):
+                flags.append(FRAME_HEADER.unpack_from(data)[1])
+            else:
+                flags.append(None)
+            write(data)
+
+        remote._write = recording_write
+        return flags
+
+    def echo(self, client, value):
+        result = client.echo(value=value)
+        result.wait()
+        self.assertTrue(result.successful())
+        return result.value
+
+    def test_negotiation(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.sleep()
+        self.assertEqual(client._frame_format, "msgpack")
+        self.assertEqual(self.servers[0]._frame_format, "msgpack")
+
+        client_flags = self.sent_flags(client)
+        server_flags = self.sent_flags(self.servers[0])
+        self.assertEqual(self.echo(client, [1, "a"]), [1, "a"])
+        self.assertEqual(client_flags, [FRAME_MSGPACK])
+        self.assertEqual(server_flags, [FRAME_MSGPACK])
+
+    def test_same_values_as_json(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.sleep()
+        value = {1: (2, 3), None: {True: 1.5}, "a": 2 ** 70}
+        self.assertEqual(self.echo(client, value),
+                         {"1": [2, 3], "null": {"true": 1.5}, "a": 2 ** 70})
+
+    @patch.object(config.global_, "rpc_compression", True)
+    @patch.object(config.global_, "rpc_max_frame_size_mib", 4)
+    def test_large_message(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.sleep()
+        server_flags = self.sent_flags(self.servers[0])
+        value = "x" * (2 * RemoteServiceBase.MAX_MESSAGE_SIZE)
+        self.assertEqual(self.echo(client, value), value)
+        self.assertEqual(server_flags, [FRAME_MSGPACK | FRAME_ZLIB])
+
+    @patch.object(config.global_, "rpc_compression", True)
+    @patch.object(config.global_, "rpc_max_frame_size_mib", 4)
+    def test_without_msgpack(self):
+        with patch("cms.io.rpc.msgpack", None):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.sleep()
+            self.assertEqual(client._frame_format, "json")
+            server_flags = self.sent_flags(self.servers[0])
+            value = "x" * (2 * RemoteServiceBase.MAX_MESSAGE_SIZE)
+            self.assertEqual(self.echo(client, value), value)
+            self.assertEqual(server_flags, [FRAME_ZLIB])
+
+    @patch.object(config.global_, "rpc_compression", True)
+    def test_too_large_message(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.sleep()
+        value = "x" * RemoteServiceBase._max_frame_size()
+        result = client.echo(value=value)
+        result.wait()
+        self.assertFalse(result.successful())
+        self.assertTrue(client.connected)
+        self.assertEqual(self.echo(client, 42), 42)
+
+    def test_disabled(self):
+        with patch.object(config.global_, "rpc_binary_protocol", False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.sleep()
+        self.assertIsNone(client._frame_format)
+        self.assertIsNone(self.servers[0]._frame_format)
+        server_flags = self.sent_flags(self.servers[0])
+        self.assertEqual(self.echo(client, 42), 42)
+        self.assertEqual(server_flags, [None])
+
+    def test_frames_only_after_negotiation(self):
+        payload = json.dumps({"__id": "echo", "__method": "echo",
+                              "__data": {"value": 42}}).encode("utf-8")
+        frame = FRAME_HEADER.pack(FRAME_MARKER, 0, len(payload)) + payload
+
+        sock = gevent.socket.create_connection((self.host, self.port))
+        sock.sendall(frame)
+        self.sleep()
+        self.assertFalse(self.servers[0].connected)
+        sock.close()
+
+        sock = self.negotiated_socket()
+        sock.sendall(frame)
+        self.sleep()
+        self.assertTrue(self.servers[1].connected)
+        sock.close()
+
+        with patch.object(config.global_, "rpc_binary_protocol", False):
+            sock = self.negotiated_socket()
+            sock.sendall(frame)
+            self.sleep()
+        self.assertFalse(self.servers[2].connected)
+        sock.close()
+
+    def test_old_server(self):
+        with patch.object(RemoteServiceServer, "_choose_protocol",
+                          side_effect=AttributeError("Doesn't exist.")):
+            client = self.get_client(ServiceCoord("Foo", 0))
+            self.sleep()
+        self.assertIsNone(client._frame_format)
+        self.assertIsNone(self.servers[0]._frame_format)
+        self.assertEqual(self.echo(client, 42), 42)
+
 
 if __name__ == "__main__":
     unittest.main()
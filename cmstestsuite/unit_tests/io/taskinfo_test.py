@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the scanning of the task repository of TaskInfo."""
+
+import json
+import shutil
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cms.io.TaskInfo import InfoJsonSource
+
+
+class TestInfoJsonSource(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tasks = {}
+        self.version = SimpleNamespace(value=0)
+        self.source = InfoJsonSource(self.tasks, ["tasks"], self.version)
+        self.repository = SimpleNamespace(path=self.base_dir)
+
+    def write_info(self, code, title):
+        self.makedirs("tasks/%s" % code)
+        self.write_file("tasks/%s/info.json" % code, json.dumps(
+            {"title": title, "algorithm": 1, "implementation": 2}).encode())
+
+    def update(self):
+        """Scan the repository, return the codes of the parsed tasks."""
+        with patch.object(self.source, "parse_single",
+                          wraps=self.source.parse_single) as parse_single:
+            self.source.apply(self.source.load(self.repository))
+        return sorted(call.args[0].name for call in parse_single.mock_calls)
+
+    def test_only_changes_are_parsed(self):
+        self.write_info("a", "A")
+        self.write_info("b", "B")
+        self.assertEqual(self.update(), ["a", "b"])
+        self.assertEqual(self.tasks["a"]["title"], "A")
+        self.assertEqual(self.version.value, 1)
+
+        self.assertEqual(self.update(), [])
+        self.assertEqual(self.version.value, 1)
+
+        self.write_info("a", "AA")
+        self.makedirs("tasks/c")
+        self.assertEqual(self.update(), ["a", "c"])
+        self.assertEqual(self.tasks["a"]["title"], "AA")
+        self.assertIsNotNone(self.tasks["c"]["error"])
+        self.assertEqual(self.version.value, 2)
+
+        shutil.rmtree(self.get_path("tasks/b"))
+        self.assertEqual(self.update(), [])
+        self.assertNotIn("b", self.tasks)
+        self.assertEqual(self.version.value, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
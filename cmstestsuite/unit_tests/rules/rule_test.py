@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the hash cache of the rules"""
+
+import hashlib
+import json
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+from cms import config
+from cms.rules import Rule
+from cms.rules.Rule import HashCache, RuleResult
+
+
+class TestHashCache(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rulesdir = self.makedirs("rules")
+        for patcher in [
+                patch.object(config.germake, "always_recompute_hash", False),
+                patch.dict(HashCache._instances),
+                # Pretend the files were written long ago.
+                patch.object(Rule.time, "time_ns",
+                             return_value=time.time_ns() + 3600 * 10**9),
+                patch.object(Rule, "compute_file_hash",
+                             wraps=Rule.compute_file_hash)]:
+            self.mock = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.files = [self.write_file("f%d" % i, b"content %d" % i)
+                      for i in range(3)]
+        self.result = RuleResult(self.rulesdir)
+
+    def test_hash_is_cached(self):
+        first = self.result.hash_of_file(self.files[0])
+        self.assertEqual(self.mock.call_count, 1)
+        self.assertEqual(self.result.hash_of_file(self.files[0]), first)
+        self.assertEqual(self.mock.call_count, 1)
+
+        self.write_file("f0", b"other content")
+        self.assertNotEqual(self.result.hash_of_file(self.files[0]), first)
+        self.assertEqual(self.mock.call_count, 2)
+
+    def test_uptodate_single_lookup(self):
+        for filename in self.files:
+            self.result.add_dependency(filename)
+        with patch.object(HashCache, "lookup",
+                          wraps=HashCache.get(self.rulesdir).lookup) as lookup:
+            self.assertTrue(self.result.uptodate())
+            lookup.assert_called_once()
+        self.assertEqual(self.mock.call_count, 3)
+
+        self.write_file("f1", b"other content")
+        self.assertFalse(self.result.uptodate())
+
+    def test_migration(self):
+        path = os.path.abspath(self.files[0])
+        name = hashlib.sha256(json.dumps(
+            {'type': 'filehash', 'file': path},
+            sort_keys=True).encode('utf-8')).hexdigest()
+        hashfile = os.path.join(self.rulesdir, name)
+        with open(hashfile, "w") as f:
+            json.dump({'type': 'filehash', 'file': path,
+                       'ctime': os.lstat(path).st_ctime_ns,
+                       'hash': "old hash"}, f)
+
+        # The old cache trusts hashes recorded well after the ctime.
+        with patch.object(Rule.os, "fstat",
+                          return_value=MagicMock(st_ctime_ns=2 ** 62)):
+            HashCache.get(self.rulesdir)
+        self.assertFalse(os.path.exists(hashfile))
+        self.assertEqual(self.result.hash_of_file(path), "old hash")
+        self.mock.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
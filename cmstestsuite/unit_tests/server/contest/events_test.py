@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2026 agent <agent@local>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the event streams of the participations.
+
+"""
+
+import ipaddress
+import unittest
+
+import collections
+try:
+    collections.MutableMapping
+except:
+    # Monkey-patch: Tornado 4.5.3 does not work on Python 3.11 by default
+    collections.MutableMapping = collections.abc.MutableMapping
+
+import gevent
+import tornado.web
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.server.contest.authentication import validate_login
+from cms.server.contest.events import ParticipationEventSource
+from cmscommon.crypto import build_password
+from cmscommon.datetime import make_datetime
+
+
+SECRET = b"0" * 32
+
+
+class TestParticipationEventSource(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.user = self.add_user(
+            username="myuser", password=build_password("mypass"))
+        self.participation = self.add_participation(
+            contest=self.contest, user=self.user)
+        _, cookie = validate_login(
+            self.session, self.contest, make_datetime(), "myuser",
+            "mypass", ipaddress.ip_address("127.0.0.1"))
+        self.cookie_name = self.contest.name + "_login"
+        self.cookie = tornado.web.create_signed_value(
+            SECRET, self.cookie_name, cookie).decode("ascii")
+        # The middleware reads the data with sessions of its own.
+        self.session.commit()
+
+        self.event_source = ParticipationEventSource(
+            Response("app"), SECRET)
+        self.client = Client(self.event_source)
+        self.path = "/%s/events" % self.contest.name
+
+    def tearDown(self):
+        self.delete_data()
+        super().tearDown()
+
+    def get(self, path, with_cookie=True):
+        if with_cookie:
+            self.client.set_cookie(self.cookie_name, self.cookie)
+        else:
+            self.client.delete_cookie(self.cookie_name)
+        # With HTTP/1.0 the stream ends after the first batch of events.
+        return self.client.get(
+            path, headers={"Accept": "text/event-stream"},
+            environ_overrides={"SERVER_PROTOCOL": "HTTP/1.0",
+                               "REMOTE_ADDR": "127.0.0.1"})
+
+    def test_other_paths(self):
+        response = self.get("/%s/tasks" % self.contest.name)
+        self.assertEqual(response.get_data(as_text=True), "app")
+
+    def test_not_authenticated(self):
+        self.assertEqual(self.get(self.path, with_cookie=False).status_code,
+                         403)
+        self.assertEqual(self.get("/nocontest/events").status_code, 404)
+
+    def test_events(self):
+        # The publisher is created on the first connection.
+        gevent.spawn_later(0.1, self.event_source.send_to_participation,
+                           self.participation.id, "notification")
+        response = self.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"event:notification\n", response.data)
+
+        # Events of other participations and contests aren't received.
+        gevent.spawn_later(0.1, self.event_source.send_to_participation,
+                           self.participation.id + 1, "notification")
+        gevent.spawn_later(0.1, self.event_source.send_to_contest,
+                           self.contest.id + 1, "notification")
+        gevent.spawn_later(0.2, self.event_source.send_to_contest,
+                           self.contest.id, "submission", "{}")
+        response = self.get(self.path)
+        self.assertNotIn(b"notification", response.data)
+        self.assertIn(b"event:submission\ndata:{}\n", response.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
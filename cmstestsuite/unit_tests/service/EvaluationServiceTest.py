@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the evaluation service.
+
+"""
+
+# We enable monkey patching to make many libraries gevent-friendly
+# (for instance, urllib3, used by requests)
+import gevent.monkey
+
+gevent.monkey.patch_all()  # noqa
+
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import gevent
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms import ServiceCoord
+from cms.db import Evaluation
+from cms.grading.Job import EvaluationJob
+from cms.io.priorityqueue import QueueEntry
+from cms.service.EvaluationService import EvaluationExecutor, \
+    EvaluationService, Result
+from cms.service.esoperations import ESOperation
+from cms.service.workerpool import WorkerPool
+
+
+class TestWriteResults(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.testcases = [self.add_testcase(self.dataset) for _ in range(3)]
+        self.submission = self.add_submission(self.task, self.participation)
+        self.sr = self.add_submission_result(
+            self.submission, self.dataset, compilation_outcome="ok")
+        self.session.commit()
+
+        self.service = EvaluationService(0)
+        patcher = patch.object(self.service, "evaluation_ended")
+        self.evaluation_ended = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.session.close()
+        super().tearDown()
+
+    def evaluation_result(self, testcase, success=True):
+        operation = ESOperation(ESOperation.EVALUATION,
+                                self.submission.id, self.dataset.id,
+                                testcase.codename)
+        job = EvaluationJob(operation=operation, success=success,
+                            outcome="1.0", text=["Output is correct"],
+                            plus={"execution_time": 0.1}, shard=0,
+                            sandboxes=[])
+        return operation, Result(job, success)
+
+    def num_evaluations(self):
+        return self.session.query(Evaluation)\
+            .filter(Evaluation.submission_id == self.submission.id)\
+            .filter(Evaluation.dataset_id == self.dataset.id)\
+            .count()
+
+    def test_partial_then_complete(self):
+        self.service.write_results([
+            self.evaluation_result(self.testcases[0]),
+            self.evaluation_result(self.testcases[1])])
+        self.assertEqual(self.num_evaluations(), 2)
+        self.session.expire_all()
+        self.assertFalse(self.sr.evaluated())
+        self.evaluation_ended.assert_not_called()
+
+        self.service.write_results([
+            self.evaluation_result(self.testcases[2])])
+        self.assertEqual(self.num_evaluations(), 3)
+        self.session.expire_all()
+        self.assertTrue(self.sr.evaluated())
+        self.evaluation_ended.assert_called_once()
+
+    def test_duplicate_evaluation_not_counted(self):
+        self.service.write_results([
+            self.evaluation_result(self.testcases[0])])
+        self.service.write_results([
+            self.evaluation_result(self.testcases[0]),
+            self.evaluation_result(self.testcases[1])])
+        self.assertEqual(self.num_evaluations(), 2)
+        self.session.expire_all()
+        self.assertFalse(self.sr.evaluated())
+
+    def test_existing_evaluations_are_counted(self):
+        self.add_evaluation(self.sr, self.testcases[0])
+        self.add_evaluation(self.sr, self.testcases[1])
+        self.session.commit()
+
+        self.service.write_results([
+            self.evaluation_result(self.testcases[2])])
+        self.session.expire_all()
+        self.assertTrue(self.sr.evaluated())
+
+    def test_replaced_testcase(self):
+        self.service.write_results([
+            self.evaluation_result(self.testcases[0]),
+            self.evaluation_result(self.testcases[1])])
+        # Replacing a testcase deletes its evaluations, without
+        # changing the number of testcases.
+        codename = self.testcases[1].codename
+        self.session.delete(self.testcases[1])
+        self.session.commit()
+        self.testcases[1] = self.add_testcase(self.dataset, codename=codename)
+        self.session.commit()
+
+        self.service.write_results([
+            self.evaluation_result(self.testcases[2])])
+        self.assertEqual(self.num_evaluations(), 2)
+        self.session.expire_all()
+        self.assertFalse(self.sr.evaluated())
+        self.evaluation_ended.assert_not_called()
+
+    def test_failed_evaluation(self):
+        self.service.write_results([
+            self.evaluation_result(self.testcases[0], success=False),
+            self.evaluation_result(self.testcases[1])])
+        self.assertEqual(self.num_evaluations(), 1)
+        self.session.expire_all()
+        self.assertEqual(self.sr.evaluation_tries, 1)
+        self.assertFalse(self.sr.evaluated())
+
+
+class TestBatchSizing(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = EvaluationService(0).get_executor()
+        for testcase in range(1000):
+            self.executor.enqueue(self.operation(testcase), 0, None)
+        # Simulate the executor extracting the first operation.
+        self.executor._pop(wait=True)
+
+    @staticmethod
+    def operation(testcase):
+        return ESOperation(ESOperation.EVALUATION, 1, 1, "%03d" % testcase)
+
+    def test_unknown_duration(self):
+        self.assertEqual(self.executor.max_operations_per_batch(),
+                         EvaluationExecutor.MAX_OPERATIONS_PER_BATCH)
+
+    def test_slow_operations(self):
+        self.executor.pool._record_durations(
+            [self.operation(1000)],
+            EvaluationExecutor.TARGET_BATCH_DURATION / 3)
+        self.assertEqual(self.executor.max_operations_per_batch(), 3)
+        self.assertEqual(self.executor._batch_sizing["max_operations"], 3)
+
+    def test_very_slow_operations(self):
+        self.executor.pool._record_durations(
+            [self.operation(1000)], timedelta(hours=1))
+        self.assertEqual(self.executor.max_operations_per_batch(), 1)
+
+    def test_job_slots(self):
+        with patch.object(self.executor.pool, "max_job_slots",
+                          return_value=4):
+            self.assertEqual(self.executor.max_operations_per_batch(),
+                             4 * EvaluationExecutor.MAX_OPERATIONS_PER_BATCH)
+            self.executor.pool._record_durations(
+                [self.operation(1000)],
+                EvaluationExecutor.TARGET_BATCH_DURATION / 3)
+            self.assertEqual(self.executor.max_operations_per_batch(), 12)
+            self.assertEqual(self.executor._batch_sizing["job_slots"], 4)
+
+    def test_job_slots_slow_operations(self):
+        # Even if a single operation exceeds the target duration, the
+        # batch has one operation for each job slot.
+        self.executor.pool._record_durations(
+            [self.operation(1000)], timedelta(hours=1))
+        with patch.object(self.executor.pool, "max_job_slots",
+                          return_value=4):
+            self.assertEqual(self.executor.max_operations_per_batch(), 4)
+
+    def test_job_slots_short_queue(self):
+        # Few operations per worker are still shipped in batches of
+        # one operation for each job slot.
+        while len(self.executor._operation_queue) > 3:
+            self.executor._pop()
+        with patch.object(self.executor.pool, "max_job_slots",
+                          return_value=4):
+            self.assertEqual(self.executor.max_operations_per_batch(), 4)
+
+
+class TestExecuteAffinity(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        service = MagicMock()
+        service.connect_to.side_effect = \
+            lambda coord, on_connect: MagicMock(connected=True)
+        # Building the job group needs the database, which we do not
+        # care about here.
+        for name in ["SessionGen", "DatasetJobCache"]:
+            patcher = patch("cms.service.workerpool.%s" % name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(WorkerPool, "MAX_AFFINITY_WAIT",
+                               timedelta(seconds=0.1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.executor = EvaluationExecutor(service)
+        self.executor.pool._prefetch = False
+        for shard in range(2):
+            self.executor.pool.add_worker(ServiceCoord("Worker", shard))
+
+    @staticmethod
+    def entry(submission_id, codename):
+        return QueueEntry(
+            ESOperation(ESOperation.EVALUATION, submission_id, 1, codename),
+            0, None, 0)
+
+    def test_idle_worker_used_after_affinity_wait(self):
+        # The worker with the files is busy, the other one is idle.
+        pool = self.executor.pool
+        busy = pool.acquire_worker([self.entry(1, "a").item])
+
+        # The deadline passes while we decide to wait for the busy
+        # worker.
+        now = [0.0]
+        acquire_worker = pool.acquire_worker
+
+        def slow_acquire_worker(*args, **kwargs):
+            ret = acquire_worker(*args, **kwargs)
+            now[0] += 1.0
+            return ret
+
+        clock = MagicMock()
+        clock.monotonic.side_effect = lambda: now[0]
+        with patch("cms.service.EvaluationService.time", clock), \
+                patch.object(pool, "acquire_worker", slow_acquire_worker), \
+                gevent.Timeout(2):
+            self.executor.execute([self.entry(1, "b")])
+        self.assertEqual(self.executor._currently_executing, [])
+        self.assertIn(self.entry(1, "b").item, pool)
+        self.assertNotIn(self.entry(1, "b").item, pool._operations[busy])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,7 +28,7 @@ import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
 import unittest
-from unittest.mock import patch, PropertyMock
+from unittest.mock import MagicMock, patch, PropertyMock
 
 import gevent
 
@@ -130,6 +130,85 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
                               [(sr_a.submission_id, sr_a.dataset_id),
                                (sr_b.submission_id, sr_b.dataset_id)])
 
+    def test_new_evaluation_error(self):
+        """An error on a submission doesn't affect the others scored
+        in the same batch.
+
+        """
+        sr_a = self.new_sr_to_score()
+        sr_b = self.new_sr_to_score()
+        self.session.commit()
+
+        def compute_score(sr):
+            if sr.submission_id == sr_a.submission_id:
+                raise ValueError("Invalid evaluations.")
+            return self.compute_score(sr)
+        self.score_type.compute_score.side_effect = compute_score
+
+        service = ScoringService(0)
+        service.new_evaluation(sr_a.submission_id, sr_a.dataset_id)
+        service.new_evaluation(sr_b.submission_id, sr_b.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.assertEqual(self.call_args,
+                         [(sr_b.submission_id, sr_b.dataset_id)])
+        self.session.expire_all()
+        self.assertIsNone(sr_a.scored_at)
+        self.assertIsNotNone(sr_b.scored_at)
+
+    def test_new_evaluation_unit_test_error(self):
+        """An error when computing the unit test score leaves the
+        submission result not scored.
+
+        """
+        sr_a = self.new_sr_to_score()
+        sr_b = self.new_sr_to_score()
+        self.session.commit()
+
+        def compute_unit_test_score(sr, si):
+            if sr.submission_id == sr_a.submission_id:
+                raise ValueError("Invalid additional info.")
+            return self.compute_unit_test_score(sr, si)
+        self.score_type.compute_unit_test_score.side_effect = \
+            compute_unit_test_score
+
+        service = ScoringService(0)
+        service.new_evaluation(sr_a.submission_id, sr_a.dataset_id)
+        service.new_evaluation(sr_b.submission_id, sr_b.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.session.expire_all()
+        self.assertIsNone(sr_a.score)
+        self.assertIsNone(sr_a.scored_at)
+        self.assertTrue(sr_a.needs_scoring())
+        self.assertIsNotNone(sr_b.scored_at)
+        self.assertEqual(sr_b.unit_test_score_details,
+                         self.unit_test_score_info)
+
+    def test_new_evaluation_notifies(self):
+        """The other services are told about scores on the active
+        dataset.
+
+        """
+        sr = self.new_sr_to_score()
+        sr.submission.task.active_dataset = sr.dataset
+        self.session.commit()
+
+        service = ScoringService(0)
+        executor = service.get_executor()
+        executor.proxy_service = MagicMock()
+        executor.admin_web_servers = [MagicMock()]
+        service.new_evaluation(sr.submission_id, sr.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        executor.proxy_service.submission_scored.assert_called_once_with(
+            submission_id=sr.submission_id)
+        executor.admin_web_servers[0].scores_changed.assert_called_once_with(
+            contest_id=self.contest.id)
+
     def test_new_evaluation_already_scored(self):
         """One submission is not re-scored if already scored.
 
@@ -22,13 +22,17 @@
 """
 
 import unittest
-from unittest.mock import Mock, call
+from unittest.mock import MagicMock, Mock, call, patch
 
 import gevent
 
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
 import cms.service.Worker
+from cms import config
 from cms.grading import JobException
-from cms.grading.Job import JobGroup, EvaluationJob
+from cms.grading.Job import CompilationJob, JobGroup, EvaluationJob
+from cms.grading.tasktypes import util as tasktypes_util
 from cms.service.Worker import Worker
 from cms.service.esoperations import ESOperation
 from cmstestsuite.unit_tests.testidgenerator import \
@@ -283,6 +287,124 @@ class TestWorker(unittest.TestCase):
         return job_groups, calls
 
 
+class TestWorkerParallelJobs(unittest.TestCase):
+
+    PARALLEL_JOBS = 3
+
+    def setUp(self):
+        for patcher in [
+                patch.object(config.worker, "parallel_jobs",
+                             self.PARALLEL_JOBS),
+                patch.object(config.worker, "pinned_cpus", [0, 1, 2, 3]),
+                patch.object(cms.service.Worker, "get_task_type")]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = Worker(1)
+        self.task_type = SlotRecordingTaskType()
+        cms.service.Worker.get_task_type.return_value = self.task_type
+
+    def execute(self, jobs):
+        return JobGroup.import_from_dict(self.service.execute_job_group(
+            JobGroup(jobs).export_to_dict()))
+
+    def test_evaluations_in_distinct_slots(self):
+        jobs, unused_calls = TestWorker.new_jobs(7)
+        result = self.execute(jobs)
+
+        self.assertTrue(all(job.success for job in result.jobs))
+        self.assertEqual(self.task_type.max_running, self.PARALLEL_JOBS)
+        self.assertEqual(set(self.task_type.slots), {0, 1, 2})
+        # Slot k of shard 1 uses the CPU (3 + k) % 4.
+        self.assertEqual(self.task_type.cpus, {0: {3}, 1: {0}, 2: {1}})
+
+    def test_compilations_run_alone(self):
+        jobs, unused_calls = TestWorker.new_jobs(4)
+        jobs.insert(2, CompilationJob(
+            ESOperation(ESOperation.COMPILATION, unique_long_id(),
+                        unique_long_id()),
+            "fake_task_type", "fake_parameters", info="compilation"))
+        self.execute(jobs)
+
+        self.assertEqual(self.task_type.running_with["compilation"], 1)
+        self.assertEqual(self.task_type.max_running, 2)
+
+    def test_exception(self):
+        jobs, unused_calls = TestWorker.new_jobs(6)
+        jobs[1].info = "raise"
+        with self.assertRaises(JobException):
+            self.execute(jobs)
+        # The jobs already started finished, the others were skipped.
+        self.assertEqual(self.task_type.running, set())
+        self.assertLess(len(self.task_type.slots), len(jobs))
+        self.assertFalse(self.service.work_lock.locked())
+
+    def test_job_slots(self):
+        self.assertEqual(self.service.job_slots(), self.PARALLEL_JOBS)
+
+
+class TestWorkerPrecache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.service = Worker(0)
+
+    def test_files_to_precache_order(self):
+        task = self.add_task(contest=self.add_contest())
+        other = self.add_dataset(task=task)
+        active = self.add_dataset(task=task)
+        task.active_dataset = active
+        other_manager = self.add_manager(other)
+        other_testcase = self.add_testcase(other)
+        active_testcase = self.add_testcase(active)
+        active_manager = self.add_manager(active)
+        statement = self.add_statement(task)
+        self.session.flush()
+
+        self.assertEqual(
+            Worker._files_to_precache(self.session, task.contest),
+            [active_manager.digest,
+             active_testcase.input, active_testcase.output,
+             other_manager.digest,
+             other_testcase.input, other_testcase.output,
+             statement.digest])
+
+    def test_precache_files(self):
+        digests = ["%040x" % i for i in range(10)]
+        self.service.file_cacher = MagicMock()
+        self.service.file_cacher.stats = {"misses": 0}
+
+        def cache_file(digest):
+            if digest == digests[3]:
+                raise KeyError()
+            self.service.file_cacher.stats["misses"] += 1
+        self.service.file_cacher.cache_file.side_effect = cache_file
+
+        with patch.object(self.service, "_files_to_precache",
+                          return_value=digests), \
+                patch("cms.service.Worker.Contest"):
+            self.service.precache_files(contest_id=1)
+
+        self.assertCountEqual(
+            [c.args[0] for c in
+             self.service.file_cacher.cache_file.call_args_list],
+            digests)
+        self.assertEqual(self.service.precache_status(), {
+            "contest_id": 1,
+            "running": False,
+            "total": 10,
+            "done": 10,
+            "missing": 1,
+            "downloaded": 9,
+        })
+
+    def test_precache_files_other_worker(self):
+        self.service.file_cacher = MagicMock()
+        self.service.file_cacher.precache_lock.return_value = None
+        self.service.precache_files(contest_id=1)
+        self.service.file_cacher.cache_file.assert_not_called()
+        self.assertIsNone(self.service.precache_status())
+
+
 class FakeTaskType:
     def __init__(self, execute_results):
         self.execute_results = execute_results
@@ -308,5 +430,32 @@ class FakeTaskType:
         self.execute_results = results
 
 
+class SlotRecordingTaskType:
+    """Task type recording the job slots in which the jobs run."""
+
+    def __init__(self):
+        self.running = set()
+        self.max_running = 0
+        self.running_with = {}
+        self.slots = []
+        self.cpus = {}
+
+    def execute_job(self, job, file_cacher):
+        slot = tasktypes_util._job_slot.index
+        assert slot not in self.running
+        self.running.add(slot)
+        self.max_running = max(self.max_running, len(self.running))
+        self.running_with[job.info] = len(self.running)
+        self.slots.append(slot)
+        self.cpus[slot] = tasktypes_util._job_slot.cpus
+        try:
+            gevent.sleep(0.01)
+            if job.info == "raise":
+                raise ValueError("Failure.")
+        finally:
+            self.running.remove(slot)
+        job.success = True
+
+
 if __name__ == "__main__":
     unittest.main()
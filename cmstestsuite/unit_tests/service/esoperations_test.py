@@ -239,6 +239,38 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_submissions_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_submissions_operations_min_submission_id(self):
+        """Test that old submissions without results are skipped."""
+        expected_operations = set()
+
+        # An old submission with results to be evaluated, which is
+        # returned anyway.
+        submission, results = self.add_submission_with_results(
+            self.tasks[0], self.participation, True)
+        self.session.flush()
+        expected_operations.update(set(
+            self.submission_evaluation_operation(result, codename)
+            for result in results if self.to_judge(result.dataset)
+            for codename in result.dataset.testcases))
+
+        # An old submission without results, skipped.
+        old_submission = self.add_submission(
+            self.tasks[0], self.participation)
+        self.session.flush()
+
+        # A new submission without results.
+        submission = self.add_submission(self.tasks[0], self.participation)
+        self.session.flush()
+        expected_operations.update(set(
+            self.submission_compilation_operation(submission, dataset)
+            for dataset in submission.task.datasets if self.to_judge(dataset)))
+
+        self.assertEqual(
+            set(get_submissions_operations(
+                self.session, self.contest.id,
+                min_submission_id=old_submission.id)),
+            expected_operations)
+
     def submission_compilation_operation(
             self, submission, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
@@ -394,6 +426,35 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_user_tests_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_user_tests_operations_min_user_test_id(self):
+        """Test that old user_tests without results are skipped."""
+        expected_operations = set()
+
+        # An old user_test with results to be evaluated, which is
+        # returned anyway.
+        user_test, results = self.add_user_test_with_results(True)
+        self.session.flush()
+        expected_operations.update(set(
+            self.user_test_evaluation_operation(result)
+            for result in results if self.to_judge(result.dataset)))
+
+        # An old user_test without results, skipped.
+        old_user_test = self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+
+        # A new user_test without results.
+        user_test = self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+        expected_operations.update(set(
+            self.user_test_compilation_operation(user_test, dataset)
+            for dataset in user_test.task.datasets if self.to_judge(dataset)))
+
+        self.assertEqual(
+            set(get_user_tests_operations(
+                self.session, self.contest.id,
+                min_user_test_id=old_user_test.id)),
+            expected_operations)
+
     def user_test_compilation_operation(self, user_test, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
             if result is None or result.compilation_tries == 0 \
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the worker pool.
+
+"""
+
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from cms import ServiceCoord, config
+from cms.service.esoperations import ESOperation
+from cms.service.workerpool import WorkerPool
+from cmscommon.datetime import make_datetime
+
+
+class WorkerPoolTestMixin:
+
+    NUM_WORKERS = 3
+    PREFETCH = False
+
+    def setUp(self):
+        super().setUp()
+        self.service = MagicMock()
+        self.service.contest_id = None
+        self.service.connect_to.side_effect = \
+            lambda coord, on_connect: MagicMock(connected=True)
+
+        # Building the job group needs the database, which we do not
+        # care about here.
+        patcher = patch("cms.service.workerpool.SessionGen")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("cms.service.workerpool.DatasetJobCache")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with patch.object(config.worker, "prefetch_batch", self.PREFETCH):
+            self.pool = WorkerPool(self.service)
+        for shard in range(self.NUM_WORKERS):
+            self.pool.add_worker(ServiceCoord("Worker", shard))
+
+    @staticmethod
+    def evaluations(submission_id, codenames):
+        return [ESOperation(ESOperation.EVALUATION, submission_id, 1, codename)
+                for codename in codenames]
+
+
+class TestWorkerPoolAffinity(WorkerPoolTestMixin, unittest.TestCase):
+
+    def test_prefers_worker_with_files(self):
+        shard = self.pool.acquire_worker(self.evaluations(1, ["a", "b"]))
+        self.pool.release_worker(shard)
+
+        for _ in range(10):
+            other = self.pool.acquire_worker(self.evaluations(1, ["c"]))
+            self.assertEqual(other, shard)
+            self.pool.release_worker(other)
+
+    def test_waits_for_busy_worker_with_files(self):
+        shard = self.pool.acquire_worker(self.evaluations(1, ["a"]))
+
+        operations = self.evaluations(1, ["b"])
+        self.assertIsNone(
+            self.pool.acquire_worker(operations, wait_for_affinity=True))
+
+        other = self.pool.acquire_worker(operations, wait_for_affinity=False)
+        self.assertIsNotNone(other)
+        self.assertNotEqual(other, shard)
+
+    def test_no_wait_without_affinity(self):
+        self.pool.acquire_worker(self.evaluations(1, ["a"]))
+        self.assertIsNotNone(self.pool.acquire_worker(
+            self.evaluations(2, ["b"]), wait_for_affinity=True))
+
+    def test_no_worker_available(self):
+        for submission_id in range(3):
+            self.assertIsNotNone(self.pool.acquire_worker(
+                self.evaluations(submission_id, ["a"])))
+        self.assertIsNone(self.pool.acquire_worker(
+            self.evaluations(3, ["a"])))
+
+
+class TestWorkerPoolPrefetch(WorkerPoolTestMixin, unittest.TestCase):
+
+    NUM_WORKERS = 1
+    PREFETCH = True
+
+    def test_prefetch(self):
+        first = self.evaluations(1, ["a"])
+        second = self.evaluations(2, ["a"])
+        shard = self.pool.acquire_worker(first)
+        self.assertEqual(self.pool.acquire_worker(second), shard)
+        self.assertIn(second[0], self.pool)
+        status = self.pool.get_status()["%d" % shard]
+        self.assertEqual(status["operations"], [first[0].to_dict()])
+        self.assertEqual(status["prefetched_operations"],
+                         [second[0].to_dict()])
+
+        # Only one batch can be prefetched.
+        self.assertIsNone(self.pool.acquire_worker(self.evaluations(3, ["a"])))
+
+        self.assertFalse(self.pool.release_worker(shard))
+        self.assertNotIn(first[0], self.pool)
+        self.assertIn(second[0], self.pool)
+        self.assertIsNotNone(self.pool._start_time[shard])
+
+        self.assertFalse(self.pool.release_worker(shard))
+        self.assertNotIn(second[0], self.pool)
+        self.assertIsNone(self.pool._start_time[shard])
+
+    def test_prefetched_batch_lost_first(self):
+        first = self.evaluations(1, ["a"])
+        second = self.evaluations(2, ["a"])
+        shard = self.pool.acquire_worker(first)
+        start_time = self.pool._start_time[shard] = \
+            make_datetime() - timedelta(seconds=10)
+        self.pool.acquire_worker(second)
+        (_, first_id), (_, second_id) = \
+            [call.kwargs["plus"] for call
+             in self.pool._worker[shard].execute_job_group.mock_calls]
+
+        # The call for the prefetched batch fails while the worker is
+        # still executing the first one.
+        self.assertFalse(self.pool.release_worker(shard, batch_id=second_id))
+        self.assertIn(first[0], self.pool)
+        self.assertNotIn(second[0], self.pool)
+        self.assertEqual(self.pool._start_time[shard], start_time)
+        self.assertIsNone(self.pool.expected_duration(first[0]))
+
+        self.assertFalse(self.pool.release_worker(shard, batch_id=first_id))
+        self.assertNotIn(first[0], self.pool)
+        self.assertIsNone(self.pool._start_time[shard])
+        self.assertAlmostEqual(self.pool.expected_duration(first[0]), 10,
+                               places=1)
+
+        # Late results of batches already released are ignored.
+        self.assertTrue(self.pool.release_worker(shard, batch_id=first_id))
+
+    def test_ignore_in_prefetched_batch(self):
+        first = self.evaluations(1, ["a"])
+        second = self.evaluations(2, ["a"])
+        shard = self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.pool.ignore_operation(second[0])
+        self.assertFalse(self.pool.release_worker(shard))
+        self.assertEqual(self.pool.release_worker(shard), second)
+
+    def test_disable_loses_all_batches(self):
+        first = self.evaluations(1, ["a"])
+        second = self.evaluations(2, ["a"])
+        shard = self.pool.acquire_worker(first)
+        self.pool.acquire_worker(second)
+        self.assertEqual(self.pool.disable_worker(shard), first + second)
+        self.assertNotIn(second[0], self.pool)
+        self.assertTrue(self.pool.release_worker(shard))
+        self.assertTrue(self.pool.release_worker(shard))
+
+    def test_no_prefetch_when_disabled_by_config(self):
+        self.pool._prefetch = False
+        self.pool.acquire_worker(self.evaluations(1, ["a"]))
+        self.assertIsNone(self.pool.acquire_worker(self.evaluations(2, ["a"])))
+
+
+class TestWorkerPoolDurations(WorkerPoolTestMixin, unittest.TestCase):
+
+    def test_expected_duration(self):
+        operations = self.evaluations(1, ["a", "b"])
+        self.assertIsNone(self.pool.expected_duration(operations[0]))
+
+        shard = self.pool.acquire_worker(operations)
+        self.pool._start_time[shard] = make_datetime() - timedelta(seconds=10)
+        self.pool.release_worker(shard)
+        self.assertAlmostEqual(
+            self.pool.expected_duration(operations[0]), 5, places=1)
+
+        # Compilations of the same dataset are tracked separately.
+        compilation = ESOperation(ESOperation.COMPILATION, 1, 1)
+        self.assertIsNone(self.pool.expected_duration(compilation))
+
+    def test_ignored_results_not_recorded(self):
+        operations = self.evaluations(1, ["a"])
+        shard = self.pool.acquire_worker(operations)
+        self.pool.disable_worker(shard)
+        self.assertIsNone(self.pool.expected_duration(operations[0]))
+
+
+class TestWorkerPoolJobSlots(WorkerPoolTestMixin, unittest.TestCase):
+
+    def test_job_slots_from_worker(self):
+        self.assertEqual(self.pool.max_job_slots(), 1)
+        self.pool.on_worker_connected(ServiceCoord("Worker", 1))
+        self.pool._worker[1].job_slots.assert_called_once_with(
+            callback=self.pool._set_job_slots, plus=1)
+        self.pool._set_job_slots(4, 1)
+        self.assertEqual(self.pool.max_job_slots(), 4)
+        self.assertEqual(self.pool.get_status()["1"]["job_slots"], 4)
+
+        # Workers not supporting parallel jobs have a single slot.
+        self.pool._set_job_slots(None, 1, error="Unknown method.")
+        self.assertEqual(self.pool.max_job_slots(), 1)
+
+    def test_disconnected_workers_ignored(self):
+        self.pool._set_job_slots(4, 1)
+        self.pool._worker[1].connected = False
+        self.assertEqual(self.pool.max_job_slots(), 1)
+
+    def test_durations_per_slot(self):
+        self.pool._set_job_slots(4, 0)
+        evaluations = self.evaluations(1, ["a", "b", "c", "d", "e", "f"])
+        shard = self.pool.acquire_worker(evaluations)
+        self.pool._start_time[shard] = make_datetime() - timedelta(seconds=6)
+        self.pool.release_worker(shard)
+        expected = {0: 4.0, 1: 1.0, 2: 1.0}[shard]
+        self.assertAlmostEqual(
+            self.pool.expected_duration(evaluations[0]), expected, places=1)
+
+        # Compilations do not run in parallel.
+        compilation = ESOperation(ESOperation.COMPILATION, 1, 1)
+        self.pool._record_durations([compilation], timedelta(seconds=6), 4)
+        self.assertAlmostEqual(self.pool.expected_duration(compilation), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()